@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import secrets
+
+from app.metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# Порядок столбцов листа appointments; appointment_id добавлен последним,
+# чтобы старые таблицы оставались совместимыми
+APPOINTMENT_COLUMNS = [
+    'user_id', 'client_name', 'phone', 'service', 'date', 'time',
+    'status', 'created_at', 'notes', 'appointment_id', 'master', 'duration'
+]
+# Поля, изменение которых в таблице важно для индексов бота
+TRACKED_COLUMNS = ('user_id', 'client_name', 'phone', 'service', 'date', 'time', 'status', 'master', 'duration')
+
+
+def backfill_key(record, seen):
+    """Ключ строки без ID по ее содержимому; одинаковые строки различаются номером повтора"""
+    key = tuple(str(record.get(column, '')) for column in ('user_id', 'date', 'time', 'created_at'))
+    seen[key] = seen.get(key, 0) + 1
+    return key + (seen[key],)
+
+
+def generate_appointment_id():
+    """Короткий стабильный ID записи (буква в начале, чтобы таблица не считала его числом)"""
+    return f"a{secrets.token_hex(5)}"
+
+
+class AppointmentBook:
+    """Записи на услуги с индексом ID -> строка листа.
+
+    У каждой записи есть стабильный appointment_id, поэтому кнопки отмены
+    не зависят от положения строки. Номера строк берутся из ответов на
+    запись (updatedRange) и обновляются при каждом чтении листа.
+    """
+
+    def __init__(self, storage, writes, sheet_name="appointments"):
+        self.storage = storage
+        self.writes = writes
+        self.sheet_name = sheet_name
+        self.on_change = None       # callback(added, changed, removed) для изменений, внесенных в лист не ботом
+        self._header = None
+        self._loaded = False
+        self._records = {}          # appointment_id -> запись
+        self._rows = {}             # appointment_id -> номер строки в листе
+        self._pending_rows = {}     # appointment_id -> future с номером строки (еще не записана)
+        self._pending_status = {}   # appointment_id -> статус, еще не записанный в лист
+        self._status_writes = {}    # appointment_id -> future записи статуса в лист
+        self._backfilled = {}       # содержимое строки -> ID, выданный старой записи без ID, пока он не прочитан из листа
+        self._lock = asyncio.Lock()
+        self._reads_started = 0     # номер последнего начатого чтения листа
+        self._last_read = 0         # номер последнего успешного чтения
+        self._reading = False
+        # Изменения ячеек ставятся в очередь по ID записи: строки сдвигаются до отправки
+        writes.resolve_rows(sheet_name, self.row_of)
+
+    @property
+    def header(self):
+        return self._header or APPOINTMENT_COLUMNS
+
+    def row_of(self, appointment_id):
+        """Номер строки записи в листе (None, если строка еще в очереди)"""
+        row = self._rows.get(appointment_id)
+        if row is None:
+            # Строку только что записала очередь, а _on_appended еще не вызван
+            pending = self._pending_rows.get(appointment_id)
+            if pending is not None and pending.done() and not pending.cancelled() and pending.exception() is None:
+                row = pending.result()
+        return row
+
+    def pending_write(self, appointment_id):
+        """Future еще не отправленной строки или статуса записи (None, если отправлять нечего)"""
+        return self._status_writes.get(appointment_id) or self._pending_rows.get(appointment_id)
+
+    def forget(self, appointment_ids):
+        """Убирает записи из индекса (после удаления их строк из листа)"""
+        for appointment_id in appointment_ids:
+            self._records.pop(appointment_id, None)
+            self._rows.pop(appointment_id, None)
+
+    def snapshot(self):
+        """Записи и номера строк для сохранения между перезапусками"""
+        if not self._loaded or self._pending_rows or self._pending_status:
+            # Пока очередь не отправлена, номера строк неизвестны - снимок не делаем
+            return None
+        return self._header, self._records, self._rows
+
+    def restore(self, state):
+        self._header, self._records, self._rows = state
+        self._loaded = True
+
+    def _column(self, name):
+        return self._header.index(name) + 1
+
+    async def _ensure_header(self):
+        if self._header is not None:
+            return
+        header = list(await self.storage.get_header(self.sheet_name) or APPOINTMENT_COLUMNS[:-3])
+        for column in APPOINTMENT_COLUMNS:
+            if column not in header:
+                # Добавляем новые столбцы (ID, мастер, длительность) в существующую таблицу
+                header.append(column)
+                self.writes.update_cell(self.sheet_name, 1, len(header), column)
+        self._header = header
+
+    async def records(self, fresh=False):
+        """Все записи; лист перечитывается, индекс строк обновляется.
+
+        Вызовы, пришедшие во время чтения, получают его результат, а не
+        перечитывают лист друг за другом; fresh=True - только чтение,
+        начатое после вызова (нужно, когда важны номера строк).
+        """
+        seen = self._reads_started - 1 if self._reading and not fresh else self._reads_started
+        async with self._lock:
+            if self._last_read > seen:
+                return list(self._records.values())
+            await self._ensure_header()
+            self._reads_started += 1
+            self._reading = True
+            try:
+                rows = await self.storage.get_all_records(self.sheet_name, shared=not fresh)
+            finally:
+                self._reading = False
+            self._rebuild(rows)
+            self._last_read = self._reads_started
+            self._loaded = True
+            return list(self._records.values())
+
+    async def cached(self):
+        """Все записи из памяти (лист читается только при первом обращении)"""
+        cache_lookup("appointments", self._loaded)
+        if not self._loaded:
+            return await self.records()
+        return list(self._records.values())
+
+    def _rebuild(self, rows):
+        previous = self._records if self._loaded else None
+        records, row_map = {}, {}
+        seen, written = {}, set()
+        for row_num, record in enumerate(rows, 2):
+            appointment_id = str(record.get('appointment_id') or '')
+            if appointment_id:
+                written.add(appointment_id)
+            else:
+                appointment_id = self._backfill_id(backfill_key(record, seen))
+            record['appointment_id'] = appointment_id
+            if appointment_id in self._pending_status:
+                record['status'] = self._pending_status[appointment_id]
+            records[appointment_id] = record
+            row_map[appointment_id] = row_num
+        if self._backfilled:
+            # Выданные ID, которые уже читаются из листа, больше не нужны
+            self._backfilled = {key: value for key, value in self._backfilled.items() if value not in written}
+        # Записи из очереди или добавленные уже после чтения в прочитанных строках не видны
+        last_row = len(rows) + 1
+        for appointment_id, record in self._records.items():
+            if appointment_id in records:
+                continue
+            if appointment_id in self._pending_rows or self._rows.get(appointment_id, 0) > last_row:
+                records[appointment_id] = record
+                if appointment_id in self._rows:
+                    row_map[appointment_id] = self._rows[appointment_id]
+        self._records, self._rows = records, row_map
+        if previous is not None and self.on_change is not None:
+            self._notify(previous, records)
+
+    def _notify(self, previous, records):
+        added, changed = [], []
+        for appointment_id, record in records.items():
+            old = previous.get(appointment_id)
+            if old is None:
+                added.append(record)
+            elif any(str(old.get(column, '')) != str(record.get(column, '')) for column in TRACKED_COLUMNS):
+                changed.append((old, record))
+        removed = [record for appointment_id, record in previous.items() if appointment_id not in records]
+        if added or changed or removed:
+            try:
+                self.on_change(added, changed, removed)
+            except Exception as e:
+                logging.error(f"Ошибка при обработке изменений в листе записей: {e}")
+
+    def _backfill_id(self, key):
+        # Строки сдвигаются (архив, ручные правки), поэтому выданный ID ищется по содержимому строки
+        appointment_id = self._backfilled.get(key)
+        if appointment_id is None:
+            appointment_id = generate_appointment_id()
+            self._backfilled[key] = appointment_id
+            future = self.writes.update_cell(self.sheet_name, appointment_id, self._column('appointment_id'), appointment_id)
+            future.add_done_callback(lambda f: self._on_backfilled(key, f))
+        return appointment_id
+
+    def _on_backfilled(self, key, future):
+        if future.cancelled() or future.exception() is not None:
+            # ID не записан: при следующем чтении строка получит новый
+            self._backfilled.pop(key, None)
+
+    async def get(self, appointment_id):
+        """Запись по ID (из памяти; лист читается только при первом обращении)"""
+        cache_lookup("appointments", self._loaded)
+        if not self._loaded:
+            await self.records()
+        return self._records.get(str(appointment_id))
+
+    async def add(self, record):
+        """Добавляет запись через очередь записи и возвращает ее ID"""
+        await self._ensure_header()
+        appointment_id = str(record.get('appointment_id') or generate_appointment_id())
+        record = dict(record, appointment_id=appointment_id)
+        self._records[appointment_id] = record
+        future = self.writes.append_row(
+            self.sheet_name, [record.get(column, '') for column in self._header],
+            key_column=self._column('appointment_id')
+        )
+        self._pending_rows[appointment_id] = future
+        future.add_done_callback(lambda f: self._on_appended(appointment_id, f))
+        return appointment_id
+
+    def _on_appended(self, appointment_id, future):
+        self._pending_rows.pop(appointment_id, None)
+        if not future.cancelled() and future.exception() is None:
+            self._rows[appointment_id] = future.result()
+        else:
+            # Очередь отказалась от строки: записи в листе нет
+            self._records.pop(appointment_id, None)
+
+    async def set_status(self, appointment_id, status):
+        """Меняет статус записи одним изменением ячейки; возвращает запись или None"""
+        record = await self.get(appointment_id)
+        if record is None or (appointment_id not in self._rows and appointment_id not in self._pending_rows):
+            return None
+        record['status'] = status
+        self._pending_status[appointment_id] = status
+        # Номер строки определяется по ID при отправке: до нее строки могут сдвинуться (архив),
+        # а строка, еще стоящая в очереди, к тому времени будет записана
+        future = self.writes.update_cell(self.sheet_name, appointment_id, self._column('status'), status)
+        self._status_writes[appointment_id] = future
+        future.add_done_callback(lambda f: self._on_status_written(appointment_id, f))
+        return record
+
+    def _on_status_written(self, appointment_id, future):
+        self._pending_status.pop(appointment_id, None)
+        if self._status_writes.get(appointment_id) is future:
+            del self._status_writes[appointment_id]
+
+    async def cancel(self, appointment_id):
+        """Отменяет запись"""
+        return await self.set_status(appointment_id, 'cancelled')
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+from bisect import bisect_left, bisect_right
+from calendar import monthrange
+from datetime import datetime, timedelta
+
+from app.metrics import cache_lookup
+from config.settings import WORK_START, WORK_END, SLOT_DURATION, SCHEDULE_STEP, MASTERS
+
+logger = logging.getLogger(__name__)
+
+
+def build_slots(work_start=WORK_START, work_end=WORK_END, slot_duration=SLOT_DURATION):
+    """Слоты рабочего дня в формате HH:MM (включая время окончания, как в сетке бота)"""
+    slots = []
+    current_time = datetime.strptime(f"{work_start}:00", "%H:%M")
+    end_time = datetime.strptime(f"{work_end}:00", "%H:%M")
+    while current_time <= end_time:
+        slots.append(current_time.strftime("%H:%M"))
+        current_time += timedelta(minutes=slot_duration)
+    return tuple(slots)
+
+
+SLOTS = build_slots()
+
+
+def to_minutes(time_str):
+    """'HH:MM' -> минуты от начала дня (None, если время не разбирается)"""
+    hours, _, minutes = str(time_str).strip().partition(':')
+    if not hours.isdigit() or (minutes and not minutes.isdigit()):
+        return None
+    return int(hours) * 60 + int(minutes or 0)
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def appointment_duration(appt):
+    """Длительность записи в минутах (у старых записей ее нет - один слот)"""
+    try:
+        return int(float(appt.get('duration') or SLOT_DURATION))
+    except (TypeError, ValueError):
+        return SLOT_DURATION
+
+
+class Master:
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start  # начало и конец рабочего дня в минутах
+        self.end = end
+
+    def __repr__(self):
+        return f"Master({self.name!r}, {format_minutes(self.start)}-{format_minutes(self.end)})"
+
+
+def parse_masters(spec=MASTERS, work_start=WORK_START, work_end=WORK_END):
+    """'Анна:9-21;Мария:10:30-18' -> [Master]; без настройки - один мастер на часы работы салона"""
+    masters = []
+    for item in spec.split(';'):
+        if not item.strip():
+            continue
+        name, _, hours = item.strip().partition(':')
+        start, _, end = hours.partition('-')
+        start, end = to_minutes(start), to_minutes(end)
+        if not name or start is None or end is None or start >= end:
+            raise ValueError(f"Неверное описание мастера: {item!r} (ожидается 'Имя:9-21')")
+        masters.append(Master(name.strip(), start, end))
+    return masters or [Master('', work_start * 60, work_end * 60)]
+
+
+class MasterDay:
+    """Занятые интервалы одного мастера за день, отсортированные по началу.
+
+    Интервалы могут пересекаться (записи, добавленные вручную в таблицу),
+    поэтому рядом с началами хранится максимум концов всех интервалов,
+    начавшихся не позже: проверка свободного времени - один двоичный поиск.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []       # ends[i] - самый поздний конец среди intervals[:i + 1]
+        self.intervals = []  # (начало, конец, ID записи)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def add(self, start, end, key):
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.intervals.insert(position, (start, end, key))
+        self.ends.insert(position, 0)
+        self._update_ends(position)
+
+    def remove(self, start, key):
+        """Удаляет интервал записи key, начинающийся в start; False, если его нет"""
+        position = bisect_left(self.starts, start)
+        while position < len(self.starts) and self.starts[position] == start:
+            # Запись, занятая до получения ID, подходит под любой ключ
+            if not key or self.intervals[position][2] in (key, ''):
+                del self.starts[position]
+                del self.intervals[position]
+                del self.ends[position]
+                self._update_ends(position)
+                return True
+            position += 1
+        return False
+
+    def _update_ends(self, position):
+        latest = self.ends[position - 1] if position else 0
+        for i in range(position, len(self.intervals)):
+            latest = max(latest, self.intervals[i][1])
+            self.ends[i] = latest
+
+    def is_free(self, start, end):
+        # С [start, end) пересекаются только интервалы, начавшиеся до end; достаточно самого позднего конца
+        position = bisect_left(self.starts, end)
+        return position == 0 or self.ends[position - 1] <= start
+
+    def free_starts(self, candidates, duration):
+        """Начала из candidates (по возрастанию), с которых свободно duration минут"""
+        free = []
+        intervals = self.intervals
+        j = 0
+        for start in candidates:
+            while j < len(intervals) and intervals[j][1] <= start:
+                j += 1
+            if j == len(intervals) or intervals[j][0] >= start + duration:
+                free.append(start)
+        return free
+
+
+def overlaps(intervals, start, end):
+    return any(busy_start < end and start < busy_end for busy_start, busy_end in intervals)
+
+
+class AvailabilityIndex:
+    """Расписание мастеров: занятые интервалы по датам и мастерам.
+
+    Записи хранятся по дням, у каждого мастера - отсортированный список
+    интервалов, поэтому поиск свободных начал для услуги любой
+    длительности зависит только от числа записей в этот день, а не от
+    объема истории. Временные брони клиентов передаются в запросы как
+    extra: {мастер: [(начало, конец)]}.
+    """
+
+    def __init__(self, storage, masters=None, step=SCHEDULE_STEP):
+        self.storage = storage
+        self.masters = masters or parse_masters()
+        self.step = step
+        self._masters_by_name = {master.name: master for master in self.masters}
+        self._grids = {}
+        self._days = {}            # дата -> {имя мастера: MasterDay}
+        self._month_versions = {}  # 'YYYY-MM' -> счетчик изменений (для кэша календаря)
+        self._generation = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self):
+        cache_lookup("availability", self._loaded)
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                self.rebuild(await self.storage.list_appointments())
+
+    def rebuild(self, appointments):
+        """Строит расписание по всем записям за один проход"""
+        self._days = {}
+        self._generation += 1
+        for appt in appointments:
+            if appt.get('status') != 'cancelled':
+                self.book(appt)
+        self._loaded = True
+        logger.info(f"Индекс свободного времени построен: {len(self._days)} дат")
+
+    def snapshot(self):
+        if not self._loaded:
+            return None
+        return {
+            date_str: {name: day.intervals for name, day in masters.items()}
+            for date_str, masters in self._days.items()
+        }
+
+    def restore(self, days):
+        """Восстанавливает расписание из снимка (до перестроения по свежим записям)"""
+        self._days = {}
+        for date_str, masters in days.items():
+            for name, intervals in masters.items():
+                day = self._days.setdefault(date_str, {}).setdefault(name, MasterDay())
+                for start, end, key in intervals:
+                    day.add(start, end, key)
+        self._generation += 1
+        self._loaded = True
+
+    def invalidate(self):
+        """Помечает индекс устаревшим: при следующем обращении он будет перестроен"""
+        self._loaded = False
+
+    def _grid(self, master, duration):
+        """Возможные начала услуги длительностью duration у мастера (должна закончиться до конца смены)"""
+        key = (master.name, duration)
+        grid = self._grids.get(key)
+        if grid is None:
+            grid = self._grids[key] = tuple(range(master.start, master.end - duration + 1, self.step))
+        return grid
+
+    def starts_for(self, duration):
+        """Все возможные начала услуги у всех мастеров (без учета записей)"""
+        return sorted({start for master in self.masters for start in self._grid(master, duration)})
+
+    def _day(self, date_str, name):
+        return self._days.get(str(date_str), {}).get(name)
+
+    def _master_free(self, master, date_str, start, end, extra=None):
+        if start < master.start or end > master.end:
+            return False
+        day = self._day(date_str, master.name)
+        if day is not None and not day.is_free(start, end):
+            return False
+        return not (extra and overlaps(extra.get(master.name, ()), start, end))
+
+    def book(self, appt):
+        """Отмечает время записи занятым у ее мастера"""
+        date_str = str(appt.get('date', ''))
+        start = to_minutes(appt.get('time', ''))
+        if start is None or not date_str:
+            return
+        end = start + appointment_duration(appt)
+        name = str(appt.get('master') or '')
+        if name not in self._masters_by_name:
+            # Старые записи без мастера (или мастер удален из настроек) - первому свободному
+            free = [master.name for master in self.masters if self._master_free(master, date_str, start, end)]
+            name = free[0] if free else self.masters[0].name
+        day = self._days.setdefault(date_str, {}).setdefault(name, MasterDay())
+        day.add(start, end, str(appt.get('appointment_id') or ''))
+        self._touch(date_str)
+
+    def release(self, appt):
+        """Освобождает время записи после отмены"""
+        date_str = str(appt.get('date', ''))
+        start = to_minutes(appt.get('time', ''))
+        masters = self._days.get(date_str)
+        if start is None or not masters:
+            return
+        key = str(appt.get('appointment_id') or '')
+        name = str(appt.get('master') or '')
+        # Мастер старой записи мог быть выбран при построении индекса - ищем у всех
+        for day_name in ([name] if name in masters else []) + [n for n in masters if n != name]:
+            if masters[day_name].remove(start, key):
+                self._touch(date_str)
+                return
+
+    def _touch(self, date_str):
+        month = str(date_str)[:7]
+        self._month_versions[month] = self._month_versions.get(month, 0) + 1
+
+    def month_version(self, year, month):
+        """Версия занятости месяца: меняется при любом изменении записей в нем"""
+        return self._generation, self._month_versions.get(f"{year:04d}-{month:02d}", 0)
+
+    def free_masters(self, date_str, time_str, duration=SLOT_DURATION, extra=None):
+        """Мастера, свободные на [time, time + duration), менее загруженные в этот день - первыми"""
+        start = to_minutes(time_str)
+        if start is None:
+            return []
+        free = [
+            master for master in self.masters
+            if self._master_free(master, date_str, start, start + duration, extra)
+        ]
+        free.sort(key=lambda master: len(self._day(date_str, master.name) or ()))
+        return [master.name for master in free]
+
+    def is_free(self, date_str, time_str, duration=SLOT_DURATION, master=None, extra=None):
+        """Свободно ли время (у мастера master или хотя бы у одного)"""
+        free = self.free_masters(date_str, time_str, duration, extra)
+        return master in free if master is not None else bool(free)
+
+    def free_starts(self, date_str, duration=SLOT_DURATION, extra=None):
+        """Начала, с которых услуга длительностью duration помещается хотя бы у одного мастера"""
+        starts = set()
+        for master in self.masters:
+            grid = self._grid(master, duration)
+            day = self._day(date_str, master.name)
+            free = day.free_starts(grid, duration) if day is not None else grid
+            busy = extra.get(master.name) if extra else None
+            if busy:
+                free = [start for start in free if not overlaps(busy, start, start + duration)]
+            starts.update(free)
+        return [format_minutes(start) for start in sorted(starts)]
+
+    async def free_slots(self, date_str, duration=SLOT_DURATION, extra=None):
+        """Свободное время на дату для услуги длительностью duration"""
+        await self.ensure_loaded()
+        return self.free_starts(date_str, duration, extra)
+
+    def occupancy(self, date_from, days):
+        """Матрица занятости всех мастеров на days дней с date_from (расчеты сразу по периоду)"""
+        from app.occupancy import OccupancyMatrix
+        matrix = OccupancyMatrix(date_from, days, self.masters, self.step)
+        matrix.fill(
+            (date_str, name, start, end)
+            for date_str in matrix.dates
+            for name, day in self._days.get(date_str, {}).items()
+            for start, end, _ in day.intervals
+        )
+        return matrix
+
+    def month_free_starts(self, year, month, duration=SLOT_DURATION):
+        """Количество времен начала, с которых услуга длительностью duration помещается, по датам месяца"""
+        matrix = self.occupancy(f"{year:04d}-{month:02d}-01", monthrange(year, month)[1])
+        return dict(zip(matrix.dates, matrix.free_counts(duration).tolist()))
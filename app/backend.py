@@ -0,0 +1,284 @@
+import logging
+
+from gspread.exceptions import WorksheetNotFound
+
+from app.storage import SheetsStorage
+from app.registry import ClientRegistry, CLIENT_COLUMNS
+from app.write_queue import WriteBehindQueue
+from app.appointments import AppointmentBook
+from app.sheet_sync import SheetsReconciler
+from config.settings import STORAGE_BACKEND, SHEETS_SYNC_INTERVAL, EXPORT_CHUNK_SIZE, IMPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def filter_appointments(appointments, user_id=None, date=None, status=None, date_from=None):
+    """Отбор записей по тем же условиям, что и в SQL-хранилище"""
+    return [
+        appt for appt in appointments
+        if (user_id is None or str(appt.get('user_id')) == str(user_id))
+        and (date is None or appt.get('date') == date)
+        and (status is None or appt.get('status') == status)
+        and (date_from is None or str(appt.get('date', '')) >= date_from)
+    ]
+
+
+def is_archivable(appt, before_date):
+    """Запись уходит в архив, если она отменена или уже прошла"""
+    return appt.get('status') == 'cancelled' or str(appt.get('date', '')) < before_date
+
+
+def archive_sheet_name(month):
+    """Имя архивного листа для месяца 'YYYY-MM'"""
+    return f"archive_{month.replace('-', '_')}"
+
+
+class StorageBackend:
+    """Интерфейс хранилища бота: клиенты, услуги и записи"""
+
+    async def start(self):
+        """Запуск фоновых задач хранилища"""
+
+    async def close(self):
+        """Остановка: дописать данные и освободить ресурсы"""
+
+    def snapshot(self):
+        """Состояние кэшей хранилища для быстрого перезапуска (None - сохранять нечего)"""
+        return None
+
+    def restore(self, state):
+        """Восстанавливает кэши из снимка"""
+
+    def subscribe(self, on_appointments=None, on_services=None):
+        """Подписка на изменения, внесенные в хранилище не ботом (правки мастера в таблице).
+
+        on_appointments(added, changed, removed) получает новые записи, пары
+        (старая, новая) измененных и удаленные; on_services(services) - новый список услуг.
+        """
+
+    async def get_client(self, user_id):
+        """Клиент по user_id или None"""
+        raise NotImplementedError
+
+    async def add_client(self, record):
+        """Сохраняет нового клиента"""
+        raise NotImplementedError
+
+    async def add_clients(self, records):
+        """Сохраняет новых клиентов пачками по IMPORT_BATCH_SIZE строк на запрос (загрузка из файла)"""
+        raise NotImplementedError
+
+    def iter_clients(self, chunk_size=EXPORT_CHUNK_SIZE):
+        """Асинхронный генератор: все клиенты порциями по chunk_size"""
+        raise NotImplementedError
+
+    def iter_appointments(self, chunk_size=EXPORT_CHUNK_SIZE, archive=False):
+        """Асинхронный генератор: записи (и архив при archive=True) порциями по chunk_size"""
+        raise NotImplementedError
+
+    async def list_services(self):
+        """Список услуг (словари с name, price и duration - длительностью в минутах)"""
+        raise NotImplementedError
+
+    async def add_appointment(self, record):
+        """Сохраняет запись и возвращает ее appointment_id"""
+        raise NotImplementedError
+
+    async def get_appointment(self, appointment_id):
+        """Запись по ID или None"""
+        raise NotImplementedError
+
+    async def set_appointment_status(self, appointment_id, status):
+        """Меняет статус записи; возвращает запись или None"""
+        raise NotImplementedError
+
+    async def list_appointments(self, user_id=None, date=None, status=None, date_from=None):
+        """Записи, отобранные по клиенту, дате, статусу и/или начальной дате"""
+        raise NotImplementedError
+
+    async def archive_appointments(self, before_date):
+        """Переносит прошедшие (до before_date) и отмененные записи в архив; возвращает их число"""
+        raise NotImplementedError
+
+    async def archived_appointments(self, month):
+        """Записи из архива за месяц 'YYYY-MM'"""
+        raise NotImplementedError
+
+    async def archive_months(self):
+        """Месяцы 'YYYY-MM', за которые есть архив"""
+        raise NotImplementedError
+
+
+class SheetsBackend(StorageBackend):
+    """Хранилище в Google Sheets (листы clients, services и appointments)"""
+
+    def __init__(self, sheets=None, sync_interval=SHEETS_SYNC_INTERVAL):
+        self.sheets = sheets or SheetsStorage()
+        self.writes = WriteBehindQueue(self.sheets)
+        self.clients = ClientRegistry(self.sheets)
+        self.appointments = AppointmentBook(self.sheets, self.writes)
+        self._client_writes = {}  # user_id -> future строки клиента в очереди записи
+        # Без сверки лист записей перечитывается при каждом запросе списка
+        self.reconciler = SheetsReconciler(self, sync_interval) if sync_interval else None
+
+    async def start(self):
+        await self.writes.start()
+        if self.reconciler is not None:
+            self.reconciler.start()
+
+    async def close(self):
+        if self.reconciler is not None:
+            self.reconciler.stop()
+        await self.writes.stop()
+        self.sheets.close()
+
+    def subscribe(self, on_appointments=None, on_services=None):
+        self.appointments.on_change = on_appointments
+        if self.reconciler is not None:
+            self.reconciler.on_services = on_services
+
+    def snapshot(self):
+        return {'clients': self.clients.snapshot(), 'appointments': self.appointments.snapshot()}
+
+    def restore(self, state):
+        if state.get('clients') is not None:
+            self.clients.restore(state['clients'])
+        if state.get('appointments') is not None:
+            self.appointments.restore(state['appointments'])
+
+    async def get_client(self, user_id):
+        return await self.clients.get(user_id)
+
+    async def add_client(self, record):
+        header = self.sheets.cached_header("clients") or CLIENT_COLUMNS
+        key_column = header.index('user_id') + 1 if 'user_id' in header else None
+        future = self.writes.append_row("clients", [record.get(column, '') for column in header], key_column=key_column)
+        self.clients.add(record)
+        user_id = str(record.get('user_id', ''))
+        self._client_writes[user_id] = future
+        future.add_done_callback(lambda f: self._on_client_written(user_id, f))
+
+    def pending_client_write(self, user_id):
+        """Future еще не отправленной строки клиента (None, если отправлять нечего)"""
+        return self._client_writes.get(str(user_id))
+
+    def _on_client_written(self, user_id, future):
+        if self._client_writes.get(user_id) is future:
+            del self._client_writes[user_id]
+        if future.cancelled() or future.exception() is not None:
+            self.clients.discard(user_id)
+
+    async def add_clients(self, records):
+        header = await self.sheets.get_header("clients") or CLIENT_COLUMNS
+        for start in range(0, len(records), IMPORT_BATCH_SIZE):
+            batch = records[start:start + IMPORT_BATCH_SIZE]
+            await self.sheets.append_rows("clients", [[record.get(column, '') for column in header] for record in batch])
+            for record in batch:
+                self.clients.add(record)
+
+    async def iter_clients(self, chunk_size=EXPORT_CHUNK_SIZE):
+        # Клиенты, еще ждущие в очереди записи, должны попасть в выгрузку
+        await self.writes.flush()
+        async for chunk in self.sheets.iter_records("clients", chunk_size):
+            yield chunk
+
+    async def iter_appointments(self, chunk_size=EXPORT_CHUNK_SIZE, archive=False):
+        if archive:
+            for month in await self.archive_months():
+                async for chunk in self.sheets.iter_records(archive_sheet_name(month), chunk_size):
+                    yield chunk
+        # Текущие записи уже в памяти (AppointmentBook), лист заново не читаем
+        records = await self.list_appointments()
+        for start in range(0, len(records), chunk_size):
+            yield records[start:start + chunk_size]
+
+    async def list_services(self):
+        return await self.sheets.get_all_records("services")
+
+    async def add_appointment(self, record):
+        return await self.appointments.add(record)
+
+    async def get_appointment(self, appointment_id):
+        return await self.appointments.get(appointment_id)
+
+    async def set_appointment_status(self, appointment_id, status):
+        return await self.appointments.set_status(appointment_id, status)
+
+    async def list_appointments(self, user_id=None, date=None, status=None, date_from=None):
+        if self.reconciler is not None:
+            # Ручные правки подтягивает SheetsReconciler, отвечаем из памяти
+            records = await self.appointments.cached()
+        else:
+            records = await self.appointments.records()
+        return filter_appointments(records, user_id, date, status, date_from)
+
+    async def archive_appointments(self, before_date):
+        # Удаление сдвигает строки: пока идет перенос, очередь записи ничего не отправляет,
+        # а поставленные в нее изменения находят свою строку по ID уже после перечитывания листа
+        async with self.writes.paused():
+            return await self._archive(before_date)
+
+    async def _archive(self, before_date):
+        records = await self.appointments.records(fresh=True)
+        # Записи без даты не относятся ни к одному месяцу - остаются в листе
+        to_archive = [
+            appt for appt in records
+            if appt.get('date') and is_archivable(appt, before_date) and self.appointments.row_of(appt['appointment_id'])
+        ]
+        if not to_archive:
+            return 0
+
+        header = self.appointments.header
+        by_month = {}
+        for appt in to_archive:
+            by_month.setdefault(str(appt['date'])[:7], []).append(appt)
+        for month, appointments in by_month.items():
+            sheet_name = archive_sheet_name(month)
+            await self.sheets.ensure_worksheet(sheet_name, header)
+            # Прошлый перенос мог оборваться после копирования, но до удаления - такие записи не дублируем
+            archived = await self._archived_ids(sheet_name)
+            rows = [
+                [appt.get(column, '') for column in header]
+                for appt in appointments if appt['appointment_id'] not in archived
+            ]
+            if rows:
+                await self.sheets.append_rows(sheet_name, rows)
+
+        await self.sheets.delete_rows(
+            "appointments", [self.appointments.row_of(appt['appointment_id']) for appt in to_archive]
+        )
+        self.appointments.forget(appt['appointment_id'] for appt in to_archive)
+        # Чтение, начатое до удаления, номера строк не исправит - нужно новое
+        await self.appointments.records(fresh=True)
+        logger.info(f"В архив перенесено записей: {len(to_archive)} ({', '.join(sorted(by_month))})")
+        return len(to_archive)
+
+    async def _archived_ids(self, sheet_name):
+        """ID записей, уже скопированных в архивный лист"""
+        archive_header = await self.sheets.get_header(sheet_name)
+        if 'appointment_id' not in archive_header:
+            return set()
+        return set(await self.sheets.column_values(sheet_name, archive_header.index('appointment_id') + 1))
+
+    async def archived_appointments(self, month):
+        try:
+            return await self.sheets.get_all_records(archive_sheet_name(month))
+        except WorksheetNotFound:
+            return []
+
+    async def archive_months(self):
+        return sorted(
+            name[len("archive_"):].replace('_', '-')
+            for name in await self.sheets.worksheet_names()
+            if name.startswith("archive_")
+        )
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    """Хранилище, выбранное в настройках (STORAGE_BACKEND)"""
+    if backend == 'sqlite':
+        from app.sqlite_backend import SQLiteBackend
+        return SQLiteBackend()
+    if backend == 'sheets':
+        return SheetsBackend()
+    raise ValueError(f"Неизвестное хранилище: {backend}")
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from bisect import bisect_left, insort
+
+from app.metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+
+def booking_key(appt):
+    return (str(appt.get('date', '')), str(appt.get('time', '')), str(appt.get('appointment_id', '')))
+
+
+class BookingIndex:
+    """Действующие записи, отсортированные по дате и времени.
+
+    Для просмотра мастером: страница записей за период берется срезом по
+    двоичному поиску, без чтения хранилища и без сортировки всех записей.
+    Индекс обновляется при записи и отмене так же, как индекс занятости.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._keys = []       # отсортированные (дата, время, ID)
+        self._records = {}    # ID -> запись
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self):
+        cache_lookup("bookings", self._loaded)
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.reload()
+
+    async def reload(self):
+        """Перечитывает действующие записи из хранилища"""
+        self.rebuild(await self.storage.list_appointments(status='confirmed'))
+
+    def rebuild(self, appointments):
+        records = {
+            str(appt.get('appointment_id', '')): appt
+            for appt in appointments if appt.get('status') == 'confirmed'
+        }
+        self._keys = sorted(booking_key(appt) for appt in records.values())
+        self._records = records
+        self._loaded = True
+
+    def invalidate(self):
+        self._loaded = False
+
+    def add(self, appt):
+        appointment_id = str(appt.get('appointment_id', ''))
+        if not self._loaded or appointment_id in self._records:
+            return
+        self._records[appointment_id] = appt
+        insort(self._keys, booking_key(appt))
+
+    def remove(self, appt):
+        appt = self._records.pop(str(appt.get('appointment_id', '')), None)
+        if appt is None:
+            return
+        position = bisect_left(self._keys, booking_key(appt))
+        if position < len(self._keys) and self._keys[position] == booking_key(appt):
+            del self._keys[position]
+
+    def _bounds(self, date_from, date_to):
+        start = bisect_left(self._keys, (date_from,))
+        # (date_to, '\uffff') больше любого ключа даты date_to: время - строка HH:MM
+        end = bisect_left(self._keys, (date_to, '\uffff')) if date_to else len(self._keys)
+        return start, end
+
+    def count(self, date_from, date_to=None):
+        """Количество записей с date_from по date_to включительно"""
+        start, end = self._bounds(date_from, date_to)
+        return max(end - start, 0)
+
+    def between(self, date_from, date_to=None):
+        """Все записи с date_from по date_to включительно"""
+        start, end = self._bounds(date_from, date_to)
+        return [self._records[key[2]] for key in self._keys[start:end]]
+
+    def page(self, date_from, date_to=None, page=0, page_size=10):
+        """Записи одной страницы периода в порядке даты и времени"""
+        start, end = self._bounds(date_from, date_to)
+        first = start + page * page_size
+        return [self._records[key[2]] for key in self._keys[first:min(first + page_size, end)]]
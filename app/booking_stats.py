@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.availability import appointment_duration, parse_masters
+from app.metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+def weekday_of(date_str):
+    try:
+        return datetime.strptime(str(date_str), "%Y-%m-%d").weekday()
+    except ValueError:
+        return None
+
+
+def hour_of(time_str):
+    hour, _, _ = str(time_str).partition(':')
+    return int(hour) if hour.isdigit() else None
+
+
+class BookingStats:
+    """Статистика записей, которая обновляется при каждой записи и отмене.
+
+    Один раз строится по всей истории (текущие записи и архив), дальше
+    меняется только счетчиками, поэтому сводка для мастера не требует
+    чтения записей. Записи по услугам, дням недели и часам считаются
+    вместе с отмененными (спрос), занятость и постоянные клиенты - только
+    по действующим записям.
+    """
+
+    def __init__(self, storage, masters=None):
+        self.storage = storage
+        # Рабочих минут всех мастеров за день - знаменатель занятости
+        self.capacity = sum(master.end - master.start for master in masters or parse_masters())
+        self._reset()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._journal = None  # изменения, пришедшие во время построения
+
+    def _reset(self):
+        self.total = 0
+        self.cancelled = 0
+        self.by_service = Counter()
+        self.by_weekday = Counter()
+        self.by_hour = Counter()
+        self.by_day = Counter()   # дата -> действующих записей
+        self.minutes_by_day = Counter()   # дата -> минут в действующих записях
+        self.visits = Counter()   # user_id -> действующих записей
+
+    def _count(self, appt):
+        self.total += 1
+        self.by_service[str(appt.get('service', ''))] += 1
+        weekday = weekday_of(appt.get('date', ''))
+        if weekday is not None:
+            self.by_weekday[weekday] += 1
+        hour = hour_of(appt.get('time', ''))
+        if hour is not None:
+            self.by_hour[hour] += 1
+        if appt.get('status') == 'cancelled':
+            self.cancelled += 1
+        else:
+            self.by_day[str(appt.get('date', ''))] += 1
+            self.minutes_by_day[str(appt.get('date', ''))] += appointment_duration(appt)
+            self.visits[str(appt.get('user_id', ''))] += 1
+
+    def _uncount(self, appt):
+        self.cancelled += 1
+        date_str = str(appt.get('date', ''))
+        for counter, key, value in (
+            (self.by_day, date_str, 1),
+            (self.minutes_by_day, date_str, appointment_duration(appt)),
+            (self.visits, str(appt.get('user_id', '')), 1),
+        ):
+            counter[key] -= value
+            if counter[key] <= 0:
+                del counter[key]
+
+    def add(self, appt):
+        """Новая подтвержденная запись"""
+        if self._journal is not None:
+            self._journal.append(('add', dict(appt)))
+        if self._loaded:
+            self._count(appt)
+
+    def cancel(self, appt):
+        """Отмена действующей записи"""
+        if self._journal is not None:
+            self._journal.append(('cancel', dict(appt)))
+        if self._loaded:
+            self._uncount(appt)
+
+    async def ensure_loaded(self):
+        cache_lookup("stats", self._loaded)
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.backfill()
+
+    async def backfill(self):
+        """Строит статистику по текущим и архивным записям"""
+        self._journal = []
+        try:
+            seen = {}
+            for appt in await self.storage.list_appointments():
+                seen[str(appt.get('appointment_id', ''))] = appt
+            for month in await self.storage.archive_months():
+                for appt in await self.storage.archived_appointments(month):
+                    # Во время переноса в архив запись может оказаться и там, и там
+                    seen.setdefault(str(appt.get('appointment_id', '')), appt)
+
+            self._reset()
+            for appt in seen.values():
+                self._count(appt)
+            # Записи и отмены, сделанные пока читалась история, учитываем, если их еще нет
+            for action, appt in self._journal:
+                known = seen.get(str(appt.get('appointment_id', '')))
+                if action == 'add' and known is None:
+                    self._count(appt)
+                elif action == 'cancel' and (known is None or known.get('status') != 'cancelled'):
+                    self._uncount(appt)
+            self._loaded = True
+            logger.info(f"Статистика построена: {self.total} записей")
+        finally:
+            self._journal = None
+
+    def snapshot(self):
+        if not self._loaded:
+            return None
+        return (self.total, self.cancelled, self.by_service, self.by_weekday,
+                self.by_hour, self.by_day, self.minutes_by_day, self.visits)
+
+    def restore(self, state):
+        (self.total, self.cancelled, self.by_service, self.by_weekday,
+         self.by_hour, self.by_day, self.minutes_by_day, self.visits) = state
+        self._loaded = True
+
+    @property
+    def cancellation_rate(self):
+        return self.cancelled / self.total if self.total else 0.0
+
+    @property
+    def repeat_clients(self):
+        return sum(1 for count in self.visits.values() if count > 1)
+
+    def occupancy(self, date_str):
+        """Доля занятого рабочего времени всех мастеров на дату"""
+        if not self.capacity:
+            return 0.0
+        return min(self.minutes_by_day.get(str(date_str), 0) / self.capacity, 1.0)
+
+    def render(self, days_ahead=7):
+        """Сводка для мастера"""
+        lines = [
+            "📈 Статистика\n",
+            f"Всего записей: {self.total}, отменено: {self.cancelled} ({self.cancellation_rate:.0%})",
+            f"Клиентов с записями: {len(self.visits)}, постоянных (2+ визита): {self.repeat_clients}\n",
+            "💅 Популярные услуги:",
+        ]
+        for service, count in self.by_service.most_common(5):
+            lines.append(f"   {service}: {count}")
+
+        lines.append("\n📅 По дням недели:")
+        lines.append("   " + ", ".join(f"{WEEKDAYS[day]} {self.by_weekday.get(day, 0)}" for day in range(7)))
+
+        if self.by_hour:
+            lines.append("\n⏰ Популярное время:")
+            for hour, count in sorted(self.by_hour.most_common(3)):
+                lines.append(f"   {hour:02d}:00 - {count}")
+
+        lines.append(f"\n📊 Загрузка на {days_ahead} дней:")
+        today = datetime.now()
+        for offset in range(days_ahead):
+            day = today + timedelta(days=offset)
+            date_str = day.strftime("%Y-%m-%d")
+            lines.append(
+                f"   {day.strftime('%d.%m')} {WEEKDAYS[day.weekday()]}: "
+                f"{self.by_day.get(date_str, 0)} ({self.occupancy(date_str):.0%})"
+            )
+        return "\n".join(lines)
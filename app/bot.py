@@ -1,7 +1,8 @@
-import os
+import asyncio
 import logging
-import json
-from datetime import datetime, timedelta
+import os
+import tempfile
+from datetime import datetime, timedelta, time
 from telegram import (
     Update, 
     ReplyKeyboardMarkup, 
@@ -17,17 +18,30 @@ from telegram.ext import (
     MessageHandler,
     filters,
     ContextTypes,
-    CallbackQueryHandler,
-    JobQueue
+    CallbackQueryHandler
 )
-import gspread
-from google.oauth2.service_account import Credentials
+from app.backend import create_storage
+from app.availability import AvailabilityIndex, SLOTS
+from app.booking_stats import BookingStats
+from app.booking_index import BookingIndex
+from app.reminders import ReminderScheduler
+from app.services import ServicesCatalog
+from app.calendar_view import CalendarRenderer, CALENDAR_LEGEND
+from app.broadcast import Broadcaster
+from app.reservations import SlotReservations
+from app.persistence import build_persistence, CacheSnapshot
+from app.webhook import serve_webhook
+from app.update_processor import PerUserUpdateProcessor
+from app.metrics import instrument_handler, MetricsServer, QUEUE_DEPTH, summary as metrics_summary
+from app.sheets_scheduler import background_job
+from app.transfer import export_file, import_clients, format_of
 from config.settings import (
-    BOT_TOKEN, SPREADSHEET_ID, MASTER_CHAT_ID, MASTER_USER_ID,
-    WORK_START, WORK_END, SLOT_DURATION,
-    START, NAME, PHONE, PHONE_CHOICE, PHONE_MANUAL,
+    BOT_TOKEN, MASTER_CHAT_ID, MASTER_USER_ID,
+    NAME, PHONE_CHOICE, PHONE_MANUAL,
     SERVICE, DATE, TIME, CONFIRMATION,
-    MASTER_MENU, VIEW_BOOKINGS, CANCEL_BOOKING
+    MASTER_MENU, CANCEL_BOOKING, ARCHIVE_HOUR,
+    CACHE_SNAPSHOT_INTERVAL, RUN_MODE, METRICS_PORT, MASTER_PAGE_SIZE, MASTER_DIGEST_HOUR,
+    SLOT_DURATION, SLOT_HOLD_MINUTES
 )
 
 # Настройка логирования
@@ -37,24 +51,160 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Настройка доступа к Google Sheets
-def get_google_sheet(sheet_name="clients"):
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    
-    # Для Heroku используем переменные окружения
-    if os.environ.get('GOOGLE_CREDENTIALS'):
-        creds_info = json.loads(os.environ['GOOGLE_CREDENTIALS'])
-        creds = Credentials.from_service_account_info(creds_info, scopes=scope)
-    else:
-        raise ValueError("GOOGLE_CREDENTIALS не установлены")
-    
-    client = gspread.authorize(creds)
-    return client.open_by_key(SPREADSHEET_ID).worksheet(sheet_name)
-
 class NailSalonBot:
-    def __init__(self):
-        self.user_data = {}
+    def __init__(self, storage=None, snapshot=None):
+        self.storage = storage or create_storage()
+        self.availability = AvailabilityIndex(self.storage)
+        self.services = ServicesCatalog(self.storage)
+        self.calendar = CalendarRenderer(self.availability)
+        self.broadcaster = None
+        self.reservations = SlotReservations()
+        self.stats = BookingStats(self.storage, self.availability.masters)
+        self.bookings = BookingIndex(self.storage)
+        self.reminders = ReminderScheduler(lambda messages: self.broadcaster.broadcast(messages))
+        self.snapshot = snapshot or CacheSnapshot()
+        # Правки мастера в таблице применяются к индексам без их перестроения
+        self.storage.subscribe(on_appointments=self.apply_appointment_changes, on_services=self.services.update)
+        self._revalidate_task = None
+        self._stats_task = None
+        self._reminders_task = None
+        self.metrics_server = None
+
+    async def post_init(self, application: Application):
+        """Запускаем фоновые задачи после старта бота"""
+        self.broadcaster = Broadcaster(application.bot)
+        await self.storage.start()
+        self.reminders.start()
+        self._reminders_task = asyncio.create_task(self.load_reminders())
+        self.register_queue_metrics(application)
+        # В режиме вебхука метрики отдает сервер вебхука
+        if METRICS_PORT and RUN_MODE != 'webhook':
+            self.metrics_server = MetricsServer()
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logging.error(f"Ошибка при запуске сервера метрик: {e}")
+                self.metrics_server = None
+        if self.restore_caches():
+            # Отвечаем из восстановленных кэшей, а свежие записи подтягиваем в фоне
+            self._revalidate_task = asyncio.create_task(self.revalidate_caches())
+        if self.stats.snapshot() is None:
+            # Статистика по истории строится один раз, дальше только обновляется
+            self._stats_task = asyncio.create_task(self.backfill_stats())
+
+    async def shutdown(self, application: Application):
+        """Дописываем данные и освобождаем ресурсы при остановке бота"""
+        for task in (self._revalidate_task, self._stats_task, self._reminders_task):
+            if task is not None:
+                task.cancel()
+        self.reminders.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.storage.close()
+        # Снимок делаем после отправки очереди записи, когда известны все номера строк
+        await self.save_caches()
+
+    def register_queue_metrics(self, application):
+        """Глубина очередей: обновления Telegram, обработчики, отложенная запись"""
+        update_queue = getattr(application, 'update_queue', None)
+        if update_queue is not None:
+            QUEUE_DEPTH.set_function(update_queue.qsize, queue="updates")
+        processor = getattr(application, 'update_processor', None)
+        if isinstance(processor, PerUserUpdateProcessor):
+            QUEUE_DEPTH.set_function(lambda: processor.pending, queue="updates_pending")
+            QUEUE_DEPTH.set_function(lambda: processor.in_flight, queue="handlers_in_flight")
+        writes = getattr(self.storage, 'writes', None)
+        if writes is not None:
+            QUEUE_DEPTH.set_function(lambda: writes.pending, queue="sheets_writes")
+
+    def cache_state(self):
+        """Состояние кэшей для снимка"""
+        return {
+            'backend': type(self.storage).__name__,
+            'storage': self.storage.snapshot(),
+            'services': self.services.snapshot(),
+            'availability': self.availability.snapshot(),
+            'reservations': self.reservations.snapshot(),
+            'stats': self.stats.snapshot(),
+        }
+
+    def restore_caches(self):
+        """Восстанавливает кэши из снимка; True, если снимок был"""
+        state = self.snapshot.load()
+        if not state:
+            return False
+        try:
+            if state['backend'] == type(self.storage).__name__ and state['storage'] is not None:
+                self.storage.restore(state['storage'])
+            if state['services'] is not None:
+                self.services.restore(state['services'])
+            if state['availability'] is not None:
+                self.availability.restore(state['availability'])
+            self.reservations.restore(state['reservations'])
+            if state.get('stats') is not None:
+                self.stats.restore(state['stats'])
+        except Exception as e:
+            logging.error(f"Ошибка при восстановлении кэшей: {e}")
+            return False
+        logger.info("Кэши восстановлены из снимка")
+        return True
+
+    @background_job
+    async def revalidate_caches(self):
+        """Перестраивает индекс занятости по актуальным записям после теплого старта"""
+        try:
+            self.availability.rebuild(await self.storage.list_appointments())
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении кэшей после запуска: {e}")
+
+    def apply_appointment_changes(self, added, changed, removed):
+        """Переносит в индексы записи, добавленные, измененные или удаленные в таблице"""
+        for old, new in changed:
+            self._unindex(old)
+            self._index(new)
+            if old.get('status') != 'cancelled' and new.get('status') == 'cancelled':
+                self.stats.cancel(old)
+        for appt in removed:
+            # Удаленные строки (в том числе перенесенные в архив) остаются в статистике
+            self._unindex(appt)
+        for appt in added:
+            self._index(appt)
+            self.stats.add(appt)
+        logger.info(f"Изменения в таблице: новых {len(added)}, измененных {len(changed)}, удаленных {len(removed)}")
+
+    def _index(self, appt):
+        if appt.get('status') == 'confirmed':
+            self.availability.book(appt)
+            self.bookings.add(appt)
+            self.reminders.add(appt)
+
+    def _unindex(self, appt):
+        if appt.get('status') == 'confirmed':
+            self.availability.release(appt)
+            self.bookings.remove(appt)
+            self.reminders.remove(appt)
+
+    @background_job
+    async def backfill_stats(self):
+        """Строит статистику по истории записей в фоне после запуска"""
+        try:
+            await self.stats.ensure_loaded()
+        except Exception as e:
+            logging.error(f"Ошибка при построении статистики: {e}")
+
+    @instrument_handler
+    async def save_caches(self, context: ContextTypes.DEFAULT_TYPE = None):
+        """Сохраняет снимок кэшей (периодически и при остановке)"""
+        try:
+            await self.snapshot.save(self.cache_state())
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении снимка кэшей: {e}")
+
+    async def purge_reservations(self, context: ContextTypes.DEFAULT_TYPE):
+        """Удаляет истекшие брони клиентов, не дошедших до подтверждения"""
+        self.reservations.purge()
         
+    @instrument_handler
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начало работы с ботом - регистрация или меню"""
         user = update.message.from_user
@@ -62,9 +212,7 @@ class NailSalonBot:
         
         # Проверяем, есть ли клиент в базе
         try:
-            sheet = get_google_sheet("clients")
-            clients = sheet.get_all_records()
-            existing_client = next((c for c in clients if str(c.get('user_id')) == user_id), None)
+            existing_client = await self.storage.get_client(user_id)
             
             if existing_client:
                 # Клиент уже зарегистрирован
@@ -90,6 +238,7 @@ class NailSalonBot:
             await update.message.reply_text("Произошла ошибка. Пожалуйста, попробуйте позже.")
             return ConversationHandler.END
 
+    @instrument_handler
     async def get_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получаем имя клиента"""
         context.user_data['client_name'] = update.message.text
@@ -107,6 +256,7 @@ class NailSalonBot:
         )
         return PHONE_CHOICE
 
+    @instrument_handler
     async def handle_phone_choice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка выбора способа ввода телефона"""
         if update.message.contact:
@@ -122,6 +272,7 @@ class NailSalonBot:
             )
             return PHONE_MANUAL
 
+    @instrument_handler
     async def get_phone_manual(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получаем телефон, введенный вручную"""
         phone = update.message.text
@@ -133,22 +284,21 @@ class NailSalonBot:
             await update.message.reply_text("Пожалуйста, введите корректный номер телефона:")
             return PHONE_MANUAL
 
+    @instrument_handler
     async def save_client_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Сохраняем данные клиента в таблицу"""
         try:
-            sheet = get_google_sheet("clients")
+            client_data = {
+                'user_id': context.user_data.get('user_id', ''),
+                'client_name': context.user_data.get('client_name', ''),
+                'phone': context.user_data.get('phone', ''),
+                'username': context.user_data.get('username', ''),
+                'first_name': context.user_data.get('first_name', ''),
+                'last_name': context.user_data.get('last_name', ''),
+                'registered_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
             
-            client_data = [
-                context.user_data.get('user_id', ''),
-                context.user_data.get('client_name', ''),
-                context.user_data.get('phone', ''),
-                context.user_data.get('username', ''),
-                context.user_data.get('first_name', ''),
-                context.user_data.get('last_name', ''),
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ]
-            
-            sheet.append_row(client_data)
+            await self.storage.add_client(client_data)
             
             await update.message.reply_text(
                 "✅ Регистрация завершена!\n\n"
@@ -166,6 +316,7 @@ class NailSalonBot:
             await update.message.reply_text("Произошла ошибка при сохранении данных. Попробуйте позже.")
             return ConversationHandler.END
 
+    @instrument_handler
     async def show_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показываем главное меню"""
         keyboard = [
@@ -186,21 +337,21 @@ class NailSalonBot:
                 reply_markup=reply_markup
             )
 
+    @instrument_handler
     async def start_booking(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начинаем процесс записи на услугу"""
         user_id = str(update.effective_user.id)
         
         # Проверяем, зарегистрирован ли пользователь
         try:
-            sheet = get_google_sheet("clients")
-            clients = sheet.get_all_records()
-            client = next((c for c in clients if str(c.get('user_id')) == user_id), None)
+            client = await self.storage.get_client(user_id)
             
             if not client:
                 await update.message.reply_text("Сначала нужно завершить регистрацию. Напишите /start")
                 return ConversationHandler.END
                 
             context.user_data['booking_client'] = client
+            context.user_data['user_id'] = user_id
             
         except Exception as e:
             logging.error(f"Ошибка при проверке клиента: {e}")
@@ -209,22 +360,7 @@ class NailSalonBot:
         
         # Получаем список услуг
         try:
-            services_sheet = get_google_sheet("services")
-            services = services_sheet.get_all_records()
-            
-            if not services:
-                keyboard = [[InlineKeyboardButton("Маникюр", callback_data="service_Маникюр")],
-                          [InlineKeyboardButton("Педикюр", callback_data="service_Педикюр")],
-                          [InlineKeyboardButton("Покрытие", callback_data="service_Покрытие")]]
-            else:
-                keyboard = []
-                for service in services:
-                    service_name = service.get('name', 'Услуга')
-                    service_price = service.get('price', '')
-                    button_text = f"{service_name} - {service_price}₽" if service_price else service_name
-                    keyboard.append([InlineKeyboardButton(button_text, callback_data=f"service_{service_name}")])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = await self.services.keyboard()
             await update.message.reply_text("Выберите услугу:", reply_markup=reply_markup)
             return SERVICE
             
@@ -233,6 +369,7 @@ class NailSalonBot:
             await update.message.reply_text("Произошла ошибка при загрузке услуг.")
             return ConversationHandler.END
 
+    @instrument_handler
     async def select_service(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка выбора услуги"""
         query = update.callback_query
@@ -240,6 +377,7 @@ class NailSalonBot:
         
         service = query.data.replace("service_", "")
         context.user_data['service'] = service
+        context.user_data['duration'] = await self.services.duration(service)
         
         # Показываем календарь на 2 недели вперед
         await self.show_calendar(query.message, context)
@@ -247,60 +385,22 @@ class NailSalonBot:
 
     async def show_calendar(self, message, context: ContextTypes.DEFAULT_TYPE, month_offset=0):
         """Показываем инлайн-календарь"""
-        today = datetime.now()
-        target_date = today.replace(day=1) + timedelta(days=32 * month_offset)
-        target_date = target_date.replace(day=1)
-        
-        # Создаем календарь
-        keyboard = []
-        
-        # Заголовок с месяцем и годом
-        month_name = target_date.strftime("%B %Y")
-        header = [
-            InlineKeyboardButton("←", callback_data=f"prev_month_{month_offset}"),
-            InlineKeyboardButton(month_name, callback_data="ignore"),
-            InlineKeyboardButton("→", callback_data=f"next_month_{month_offset}")
-        ]
-        keyboard.append(header)
-        
-        # Дни недели
-        week_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        keyboard.append([InlineKeyboardButton(day, callback_data="ignore") for day in week_days])
-        
-        # Ячейки календаря
-        first_day = target_date.replace(day=1)
-        last_day = (first_day + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        current_row = []
-        # Пустые ячейки до первого дня
-        for _ in range((first_day.weekday()) % 7):
-            current_row.append(InlineKeyboardButton(" ", callback_data="ignore"))
-        
-        current_day = first_day
-        while current_day <= last_day:
-            if len(current_row) == 7:
-                keyboard.append(current_row)
-                current_row = []
-            
-            if current_day >= today.date():
-                date_str = current_day.strftime("%Y-%m-%d")
-                current_row.append(InlineKeyboardButton(str(current_day.day), callback_data=f"date_{date_str}"))
-            else:
-                current_row.append(InlineKeyboardButton(" ", callback_data="ignore"))
-            
-            current_day += timedelta(days=1)
-        
-        # Добавляем последнюю строку если нужно
-        if current_row:
-            keyboard.append(current_row)
+        # Занятость берется из индекса свободного времени
+        try:
+            await self.availability.ensure_loaded()
+        except Exception as e:
+            logging.error(f"Ошибка при получении записей: {e}")
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Доступны только дни, где выбранная услуга целиком помещается у кого-то из мастеров
+        reply_markup = self.calendar.keyboard(month_offset, context.user_data.get('duration', SLOT_DURATION))
         
+        text = f"Выберите дату:\n{CALENDAR_LEGEND}"
         if hasattr(message, 'edit_text'):
-            await message.edit_text("Выберите дату:", reply_markup=reply_markup)
+            await message.edit_text(text, reply_markup=reply_markup)
         else:
-            await message.reply_text("Выберите дату:", reply_markup=reply_markup)
+            await message.reply_text(text, reply_markup=reply_markup)
 
+    @instrument_handler
     async def handle_calendar_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка нажатий в календаре"""
         query = update.callback_query
@@ -322,64 +422,71 @@ class NailSalonBot:
         
         await query.answer()
 
-    async def show_available_times(self, message, context: ContextTypes.DEFAULT_TYPE):
+    async def show_available_times(self, message, context: ContextTypes.DEFAULT_TYPE, notice=""):
         """Показываем доступное время"""
         selected_date = context.user_data['selected_date']
+        user_id = context.user_data.get('user_id')
+        duration = context.user_data.get('duration', SLOT_DURATION)
         date_obj = datetime.strptime(selected_date, "%Y-%m-%d")
         
-        # Получаем занятые слоты на эту дату
+        # Свободное время для услуги этой длительности хотя бы у одного мастера
+        # (время, забронированное другими клиентами, считается занятым)
         try:
-            appointments_sheet = get_google_sheet("appointments")
-            appointments = appointments_sheet.get_all_records()
-            
-            booked_times = []
-            for appt in appointments:
-                appt_date = appt.get('date', '')
-                appt_time = appt.get('time', '')
-                appt_status = appt.get('status', '')
-                
-                if appt_date == selected_date and appt_status != 'cancelled':
-                    booked_times.append(appt_time)
-                    
+            free_times = await self.availability.free_slots(
+                selected_date, duration, extra=self.reservations.held_by_others(selected_date, user_id)
+            )
         except Exception as e:
             logging.error(f"Ошибка при получении записей: {e}")
-            booked_times = []
-        
-        # Создаем клавиатуру со свободными слотами
-        keyboard = []
-        current_time = datetime.strptime(f"{WORK_START}:00", "%H:%M")
-        end_time = datetime.strptime(f"{WORK_END}:00", "%H:%M")
+            free_times = SLOTS
         
-        while current_time <= end_time:
-            time_str = current_time.strftime("%H:%M")
-            if time_str not in booked_times:
-                keyboard.append([InlineKeyboardButton(time_str, callback_data=f"time_{time_str}")])
-            
-            current_time += timedelta(minutes=SLOT_DURATION)
+        keyboard = [
+            [InlineKeyboardButton(time_str, callback_data=f"time_{time_str}")]
+            for time_str in free_times
+        ]
         
         if not keyboard:
-            await message.edit_text("На эту дату нет свободных слотов. Выберите другую дату.")
+            # Подсказываем ближайшее свободное время на месяц вперед (одна матрица вместо цикла по дням)
+            nearest = self.availability.occupancy(
+                (date_obj + timedelta(days=1)).strftime("%Y-%m-%d"), 31
+            ).next_free(duration)
+            hint = ""
+            if nearest:
+                nearest_date = datetime.strptime(nearest[0], "%Y-%m-%d").strftime('%d.%m.%Y')
+                hint = f"\nБлижайшее свободное время: {nearest_date} в {nearest[1]}."
+            await message.edit_text(f"На эту дату нет свободных слотов.{hint} Выберите другую дату.")
             await self.show_calendar(message, context)
             return DATE
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         await message.edit_text(
-            f"Выберите время на {date_obj.strftime('%d.%m.%Y')}:",
+            f"{notice}Выберите время на {date_obj.strftime('%d.%m.%Y')}:",
             reply_markup=reply_markup
         )
 
+    @instrument_handler
     async def select_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка выбора времени"""
         query = update.callback_query
         await query.answer()
         
         time_str = query.data.replace("time_", "")
+        date_str = context.user_data['selected_date']
+        user_id = str(update.effective_user.id)
+        duration = context.user_data.get('duration', SLOT_DURATION)
+        
+        # Бронируем время у наименее загруженного свободного мастера на время подтверждения
+        masters = self.availability.free_masters(
+            date_str, time_str, duration, extra=self.reservations.held_by_others(date_str, user_id)
+        )
+        if not masters or not self.reservations.hold(date_str, time_str, user_id, masters[0], duration):
+            await self.show_available_times(query.message, context, notice="😔 Это время уже занято.\n")
+            return TIME
         context.user_data['time'] = time_str
+        context.user_data['master'] = masters[0]
         
         # Подтверждение записи
         client = context.user_data['booking_client']
         service = context.user_data['service']
-        date_str = context.user_data['selected_date']
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
         
         keyboard = [
@@ -395,46 +502,65 @@ class NailSalonBot:
             f"👤 Клиент: {client.get('client_name', '')}\n"
             f"📞 Телефон: {client.get('phone', '')}\n"
             f"💅 Услуга: {service}\n"
+            + (f"👩 Мастер: {masters[0]}\n" if masters[0] else "") +
             f"📅 Дата: {date_obj.strftime('%d.%m.%Y')}\n"
             f"⏰ Время: {time_str}",
             reply_markup=reply_markup
         )
         return CONFIRMATION
 
+    @instrument_handler
     async def confirm_booking(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Подтверждение или отмена записи"""
         query = update.callback_query
         await query.answer()
         
+        user_id = str(update.effective_user.id)
+        date_str = context.user_data.get('selected_date', '')
+        time_str = context.user_data.get('time', '')
+        master = context.user_data.get('master', '')
+        duration = context.user_data.get('duration', SLOT_DURATION)
+        booking = {'date': date_str, 'time': time_str, 'master': master, 'duration': duration}
+        
         if query.data == "confirm_yes":
+            # Проверка брони и занятие времени идут без await, то есть атомарно
+            if not self.reservations.commit(date_str, time_str, user_id, master, duration) or \
+                    not self.availability.is_free(date_str, time_str, duration, master):
+                await self.show_available_times(
+                    query.message, context, notice="😔 Пока вы подтверждали, это время заняли.\n"
+                )
+                return TIME
+            self.availability.book(booking)
+            
             # Сохраняем запись
+            appointment_id = None
             try:
-                appointments_sheet = get_google_sheet("appointments")
                 client = context.user_data['booking_client']
                 
-                appointment_data = [
-                    context.user_data.get('user_id', ''),
-                    client.get('client_name', ''),
-                    client.get('phone', ''),
-                    context.user_data.get('service', ''),
-                    context.user_data.get('selected_date', ''),
-                    context.user_data.get('time', ''),
-                    'confirmed',
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    ''  # для заметок мастера
-                ]
-                
-                appointments_sheet.append_row(appointment_data)
-                
-                # Получаем ID записи (последняя добавленная строка)
-                all_records = appointments_sheet.get_all_records()
-                appointment_id = len(all_records)
+                appointment_data = {
+                    'user_id': user_id,
+                    'client_name': client.get('client_name', ''),
+                    'phone': client.get('phone', ''),
+                    'service': context.user_data.get('service', ''),
+                    'date': date_str,
+                    'time': time_str,
+                    'status': 'confirmed',
+                    'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    'notes': '',  # для заметок мастера
+                    'master': master,
+                    'duration': duration
+                }
                 
+                # Строка уйдет в таблицу со следующей пачкой, клиенту отвечаем сразу
+                appointment_id = await self.storage.add_appointment(appointment_data)
                 context.user_data['appointment_id'] = appointment_id
+                self.stats.add({**appointment_data, 'appointment_id': appointment_id})
+                self.bookings.add({**appointment_data, 'appointment_id': appointment_id})
+                self.reminders.add({**appointment_data, 'appointment_id': appointment_id})
                 
                 await query.message.edit_text(
                     "✅ Запись подтверждена!\n\n"
-                    "Мы ждем вас в салоне! За день до визита пришлем напоминание."
+                    "Мы ждем вас в салоне! Перед визитом пришлем напоминание."
                 )
                 
                 # Уведомление мастеру
@@ -446,6 +572,7 @@ class NailSalonBot:
                             f"Клиент: {client.get('client_name', '')}\n"
                             f"Телефон: {client.get('phone', '')}\n"
                             f"Услуга: {context.user_data.get('service', '')}\n"
+                            + (f"Мастер: {master}\n" if master else "") +
                             f"Дата: {context.user_data.get('selected_date', '')}\n"
                             f"Время: {context.user_data.get('time', '')}"
                         )
@@ -454,39 +581,44 @@ class NailSalonBot:
                 
             except Exception as e:
                 logging.error(f"Ошибка при сохранении записи: {e}")
+                if appointment_id is None:
+                    self.availability.release(booking)
                 await query.message.edit_text("Произошла ошибка при сохранении записи. Попробуйте позже.")
         else:
+            self.reservations.release(date_str, time_str, user_id)
             await query.message.edit_text("Запись отменена.")
         
         await self.show_main_menu(update, context)
         return ConversationHandler.END
 
+    @instrument_handler
+    async def cancel_dialog(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выход из записи по /cancel: выбранное время освобождается сразу"""
+        self.reservations.release_user(str(update.effective_user.id))
+        await update.message.reply_text("Запись отменена.")
+        await self.show_main_menu(update, context)
+        return ConversationHandler.END
+
+    @instrument_handler
     async def show_my_bookings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показываем активные записи пользователя"""
         user_id = str(update.effective_user.id)
         
         try:
-            appointments_sheet = get_google_sheet("appointments")
-            appointments = appointments_sheet.get_all_records()
-            
-            user_appointments = []
-            for i, appt in enumerate(appointments, 1):
-                if (str(appt.get('user_id')) == user_id and 
-                    appt.get('status') == 'confirmed'):
-                    user_appointments.append((i, appt))
+            user_appointments = await self.storage.list_appointments(user_id=user_id, status='confirmed')
             
             if not user_appointments:
                 await update.message.reply_text("У вас нет активных записей.")
                 return
             
             message = "📋 Ваши активные записи:\n\n"
-            for idx, (row_num, appt) in enumerate(user_appointments, 1):
+            for idx, appt in enumerate(user_appointments, 1):
                 date_obj = datetime.strptime(appt.get('date', ''), "%Y-%m-%d")
                 message += (
                     f"{idx}. 💅 {appt.get('service', '')}\n"
                     f"   📅 {date_obj.strftime('%d.%m.%Y')}\n"
                     f"   ⏰ {appt.get('time', '')}\n"
-                    f"   ID: {row_num}\n\n"
+                    f"   ID: {appt['appointment_id']}\n\n"
                 )
             
             await update.message.reply_text(message)
@@ -495,19 +627,13 @@ class NailSalonBot:
             logging.error(f"Ошибка при получении записей: {e}")
             await update.message.reply_text("Произошла ошибка при загрузке записей.")
 
+    @instrument_handler
     async def start_cancel_booking(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начинаем процесс отмены записи"""
         user_id = str(update.effective_user.id)
         
         try:
-            appointments_sheet = get_google_sheet("appointments")
-            appointments = appointments_sheet.get_all_records()
-            
-            user_appointments = []
-            for i, appt in enumerate(appointments, 1):
-                if (str(appt.get('user_id')) == user_id and 
-                    appt.get('status') == 'confirmed'):
-                    user_appointments.append((i, appt))
+            user_appointments = await self.storage.list_appointments(user_id=user_id, status='confirmed')
             
             if not user_appointments:
                 await update.message.reply_text("У вас нет активных записей для отмены.")
@@ -515,10 +641,10 @@ class NailSalonBot:
             
             # Создаем клавиатуру с записями для отмены
             keyboard = []
-            for idx, (row_num, appt) in enumerate(user_appointments, 1):
+            for idx, appt in enumerate(user_appointments, 1):
                 date_obj = datetime.strptime(appt.get('date', ''), "%Y-%m-%d")
                 button_text = f"{idx}. {date_obj.strftime('%d.%m')} {appt.get('time', '')} - {appt.get('service', '')}"
-                keyboard.append([InlineKeyboardButton(button_text, callback_data=f"cancel_{row_num}")])
+                keyboard.append([InlineKeyboardButton(button_text, callback_data=f"cancel_{appt['appointment_id']}")])
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             await update.message.reply_text(
@@ -532,21 +658,26 @@ class NailSalonBot:
             await update.message.reply_text("Произошла ошибка.")
             return ConversationHandler.END
 
+    @instrument_handler
     async def cancel_booking(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отмена выбранной записи"""
         query = update.callback_query
         await query.answer()
         
-        appointment_id = int(query.data.replace("cancel_", ""))
+        appointment_id = query.data.replace("cancel_", "")
         
         try:
-            appointments_sheet = get_google_sheet("appointments")
-            # Обновляем статус записи
-            appointments_sheet.update_cell(appointment_id + 1, 7, 'cancelled')  # Столбец статуса
+            cancelled_appt = await self.storage.get_appointment(appointment_id)
+            if not cancelled_appt or cancelled_appt.get('status') != 'confirmed':
+                await query.message.edit_text("Запись не найдена или уже отменена.")
+                return ConversationHandler.END
             
-            # Получаем данные отмененной записи для уведомления мастера
-            appointments = appointments_sheet.get_all_records()
-            cancelled_appt = appointments[appointment_id - 1]
+            # Обновляем статус записи (одно изменение ячейки по ID)
+            await self.storage.set_appointment_status(appointment_id, 'cancelled')
+            self.availability.release(cancelled_appt)
+            self.stats.cancel(cancelled_appt)
+            self.bookings.remove(cancelled_appt)
+            self.reminders.remove(cancelled_appt)
             
             await query.message.edit_text("✅ Запись отменена.")
             
@@ -572,6 +703,7 @@ class NailSalonBot:
         return ConversationHandler.END
 
     # Функции для мастера
+    @instrument_handler
     async def master_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню мастера (только для авторизованных пользователей)"""
         user_id = str(update.effective_user.id)
@@ -590,141 +722,278 @@ class NailSalonBot:
         await update.message.reply_text("👨‍💼 Режим мастера:", reply_markup=reply_markup)
         return MASTER_MENU
 
+    @instrument_handler
+    async def reload_services(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Перечитываем список услуг (команда мастера)"""
+        if str(update.effective_user.id) != MASTER_USER_ID:
+            await update.message.reply_text("У вас нет доступа к этой функции.")
+            return
+        
+        try:
+            services = await self.services.reload()
+            await update.message.reply_text(f"✅ Список услуг обновлен: {len(services)}")
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении услуг: {e}")
+            await update.message.reply_text("Произошла ошибка при обновлении услуг.")
+
+    @instrument_handler
+    async def show_metrics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Сводка метрик производительности (команда мастера)"""
+        if str(update.effective_user.id) != MASTER_USER_ID:
+            await update.message.reply_text("У вас нет доступа к этой функции.")
+            return
+        
+        await update.message.reply_text(metrics_summary())
+
+    @instrument_handler
+    async def export_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выгрузка файлом (команда мастера): /export [clients] [jsonl] [archive]"""
+        if str(update.effective_user.id) != MASTER_USER_ID:
+            await update.message.reply_text("У вас нет доступа к этой функции.")
+            return
+        
+        args = [arg.lower() for arg in context.args or []]
+        kind = 'clients' if 'clients' in args else 'appointments'
+        fmt = 'jsonl' if 'jsonl' in args else 'csv'
+        # Строки пишутся во временный файл порциями, в памяти весь список не собирается
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            count = await export_file(self.storage, kind, fmt, path, archive='archive' in args)
+            with open(path, 'rb') as document:
+                await update.message.reply_document(
+                    document, filename=f"{kind}_{datetime.now().strftime('%Y-%m-%d')}.{fmt}",
+                    caption=f"✅ Выгружено: {count}"
+                )
+        except Exception as e:
+            logging.error(f"Ошибка при выгрузке данных: {e}")
+            await update.message.reply_text("Произошла ошибка при выгрузке данных.")
+        finally:
+            os.remove(path)
+
+    @instrument_handler
+    async def import_client_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Загрузка клиентов из файла CSV/JSONL с подписью /import_clients (команда мастера)"""
+        if str(update.effective_user.id) != MASTER_USER_ID:
+            await update.message.reply_text("У вас нет доступа к этой функции.")
+            return
+        
+        document = update.message.document
+        if document is None:
+            await update.message.reply_text(
+                "Пришлите файл CSV или JSONL с подписью /import_clients.\n"
+                "Столбцы: user_id, client_name, phone (остальные необязательны). "
+                "Клиенты с уже известным user_id или телефоном пропускаются."
+            )
+            return
+        
+        fmt = format_of(document.file_name or '')
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                report = await import_clients(self.storage, stream, fmt)
+            await update.message.reply_text(f"✅ Клиенты загружены: {report}")
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке клиентов: {e}")
+            await update.message.reply_text("Произошла ошибка при загрузке клиентов.")
+        finally:
+            os.remove(path)
+
+    @instrument_handler
+    async def show_statistics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Статистика записей (из счетчиков, без чтения записей)"""
+        try:
+            await self.stats.ensure_loaded()
+            await update.message.reply_text(self.stats.render())
+        except Exception as e:
+            logging.error(f"Ошибка при получении статистики: {e}")
+            await update.message.reply_text("Произошла ошибка при загрузке статистики.")
+
+    @instrument_handler
     async def show_today_bookings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показываем записи на сегодня"""
         await self.show_date_bookings(update, context, datetime.now().strftime("%Y-%m-%d"), "сегодня")
 
+    @instrument_handler
     async def show_tomorrow_bookings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показываем записи на завтра"""
         tomorrow = datetime.now() + timedelta(days=1)
         await self.show_date_bookings(update, context, tomorrow.strftime("%Y-%m-%d"), "завтра")
 
+    @instrument_handler
     async def show_date_bookings(self, update: Update, context: ContextTypes.DEFAULT_TYPE, date_str: str, date_display: str):
         """Показываем записи на указанную дату"""
+        await self.open_bookings_view(update, context, {
+            'layout': 'date', 'title': f"📋 Записи на {date_display}:",
+            'empty': f"На {date_display} записей нет.",
+            'date_from': date_str, 'date_to': date_str, 'page': 0,
+        })
+
+    @instrument_handler
+    async def show_all_active_bookings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показываем все активные записи"""
+        await self.open_bookings_view(update, context, {
+            'layout': 'all', 'title': "🗓️ Все активные записи:",
+            'empty': "Активных записей нет.",
+            'date_from': datetime.now().strftime("%Y-%m-%d"), 'date_to': None, 'page': 0,
+        })
+
+    async def open_bookings_view(self, update: Update, context: ContextTypes.DEFAULT_TYPE, cursor):
+        """Первая страница списка записей; курсор списка хранится в user_data"""
         try:
-            appointments_sheet = get_google_sheet("appointments")
-            appointments = appointments_sheet.get_all_records()
-            
-            date_appointments = [
-                appt for appt in appointments 
-                if appt.get('date') == date_str and appt.get('status') == 'confirmed'
-            ]
+            # При открытии списка перечитываем записи (мастер мог править таблицу),
+            # листание страниц идет по индексу без обращения к хранилищу
+            await self.bookings.reload()
+            context.user_data['bookings_cursor'] = cursor
+            text, reply_markup = self.render_bookings_page(cursor)
+            await update.message.reply_text(text, reply_markup=reply_markup)
             
-            if not date_appointments:
-                await update.message.reply_text(f"На {date_display} записей нет.")
+        except Exception as e:
+            logging.error(f"Ошибка при получении записей: {e}")
+            await update.message.reply_text("Произошла ошибка при загрузке записей.")
+
+    @instrument_handler
+    async def turn_bookings_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Листание списка записей мастера"""
+        query = update.callback_query
+        if str(update.effective_user.id) != MASTER_USER_ID:
+            await query.answer("У вас нет доступа к этой функции.")
+            return
+        await query.answer()
+        
+        cursor = context.user_data.get('bookings_cursor')
+        if cursor is None:
+            await query.message.edit_text("Список устарел, откройте его заново из меню мастера.")
+            return
+        try:
+            page = int(query.data.replace("bookings_page_", ""))
+            if page == cursor['page']:
+                # Кнопка с номером страницы: показывать нечего
                 return
-            
-            message = f"📋 Записи на {date_display}:\n\n"
-            for i, appt in enumerate(sorted(date_appointments, key=lambda x: x.get('time', '')), 1):
+            await self.bookings.ensure_loaded()
+            cursor['page'] = page
+            text, reply_markup = self.render_bookings_page(cursor)
+            await query.message.edit_text(text, reply_markup=reply_markup)
+        except Exception as e:
+            logging.error(f"Ошибка при листании записей: {e}")
+
+    def render_bookings_page(self, cursor):
+        """Текст и кнопки одной страницы списка записей"""
+        total = self.bookings.count(cursor['date_from'], cursor['date_to'])
+        if not total:
+            return cursor['empty'], None
+        pages = (total + MASTER_PAGE_SIZE - 1) // MASTER_PAGE_SIZE
+        page = cursor['page'] = min(max(cursor['page'], 0), pages - 1)
+        appointments = self.bookings.page(cursor['date_from'], cursor['date_to'], page, MASTER_PAGE_SIZE)
+        
+        message = f"{cursor['title']}\n\n"
+        if cursor['layout'] == 'date':
+            for i, appt in enumerate(appointments, page * MASTER_PAGE_SIZE + 1):
                 message += (
                     f"{i}. ⏰ {appt.get('time', '')}\n"
                     f"   👤 {appt.get('client_name', '')}\n"
                     f"   📞 {appt.get('phone', '')}\n"
                     f"   💅 {appt.get('service', '')}\n\n"
                 )
-            
-            await update.message.reply_text(message)
-            
-        except Exception as e:
-            logging.error(f"Ошибка при получении записей: {e}")
-            await update.message.reply_text("Произошла ошибка при загрузке записей.")
+        else:
+            # Группируем по датам (записи уже отсортированы по дате и времени)
+            current_date = None
+            for appt in appointments:
+                if appt.get('date', '') != current_date:
+                    if current_date is not None:
+                        message += "\n"
+                    current_date = appt.get('date', '')
+                    date_obj = datetime.strptime(current_date, "%Y-%m-%d")
+                    message += f"📅 {date_obj.strftime('%d.%m.%Y')}:\n"
+                message += (
+                    f"   ⏰ {appt.get('time', '')} - {appt.get('client_name', '')} "
+                    f"({appt.get('phone', '')}) - {appt.get('service', '')}\n"
+                )
+        
+        if pages == 1:
+            return message, None
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("⬅️", callback_data=f"bookings_page_{page - 1}"))
+        buttons.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f"bookings_page_{page}"))
+        if page < pages - 1:
+            buttons.append(InlineKeyboardButton("➡️", callback_data=f"bookings_page_{page + 1}"))
+        return message, InlineKeyboardMarkup([buttons])
 
-    async def show_all_active_bookings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Показываем все активные записи"""
+    # Функции напоминаний
+    @background_job
+    async def load_reminders(self):
+        """Планирует напоминания по предстоящим записям после запуска"""
         try:
-            appointments_sheet = get_google_sheet("appointments")
-            appointments = appointments_sheet.get_all_records()
-            
-            active_appointments = [
-                appt for appt in appointments 
-                if appt.get('status') == 'confirmed' 
-                and datetime.strptime(appt.get('date', ''), "%Y-%m-%d") >= datetime.now().date()
-            ]
-            
-            if not active_appointments:
-                await update.message.reply_text("Активных записей нет.")
-                return
-            
-            # Группируем по датам
-            appointments_by_date = {}
-            for appt in active_appointments:
-                date = appt.get('date', '')
-                if date not in appointments_by_date:
-                    appointments_by_date[date] = []
-                appointments_by_date[date].append(appt)
-            
-            message = "🗓️ Все активные записи:\n\n"
-            for date in sorted(appointments_by_date.keys()):
-                date_obj = datetime.strptime(date, "%Y-%m-%d")
-                message += f"📅 {date_obj.strftime('%d.%m.%Y')}:\n"
-                
-                for appt in sorted(appointments_by_date[date], key=lambda x: x.get('time', '')):
-                    message += (
-                        f"   ⏰ {appt.get('time', '')} - {appt.get('client_name', '')} "
-                        f"({appt.get('phone', '')}) - {appt.get('service', '')}\n"
-                    )
-                message += "\n"
-            
-            await update.message.reply_text(message)
-            
+            today_str = datetime.now().strftime("%Y-%m-%d")
+            self.reminders.load(await self.storage.list_appointments(status='confirmed', date_from=today_str))
         except Exception as e:
-            logging.error(f"Ошибка при получении записей: {e}")
-            await update.message.reply_text("Произошла ошибка при загрузке записей.")
+            logging.error(f"Ошибка при планировании напоминаний: {e}")
 
-    # Функции напоминаний
-    async def send_reminders(self, context: ContextTypes.DEFAULT_TYPE):
-        """Отправка напоминаний за день до визита"""
+    @instrument_handler
+    async def send_master_digest(self, context: ContextTypes.DEFAULT_TYPE):
+        """Список записей на завтра для мастера (клиентам напоминает ReminderScheduler)"""
+        if not MASTER_CHAT_ID:
+            return
         try:
-            appointments_sheet = get_google_sheet("appointments")
-            appointments = appointments_sheet.get_all_records()
-            
             tomorrow = datetime.now() + timedelta(days=1)
             tomorrow_str = tomorrow.strftime("%Y-%m-%d")
             
-            tomorrow_appointments = [
-                appt for appt in appointments 
-                if appt.get('date') == tomorrow_str and appt.get('status') == 'confirmed'
-            ]
+            await self.bookings.ensure_loaded()
+            tomorrow_appointments = self.bookings.between(tomorrow_str, tomorrow_str)
+            if not tomorrow_appointments:
+                return
             
-            for appt in tomorrow_appointments:
-                user_id = appt.get('user_id', '')
-                if user_id:
-                    try:
-                        await context.bot.send_message(
-                            user_id,
-                            f"🔔 Напоминание о записи!\n\n"
-                            f"Завтра, {tomorrow.strftime('%d.%m.%Y')} в {appt.get('time', '')}\n"
-                            f"У вас запись на: {appt.get('service', '')}\n\n"
-                            f"Ждем вас в салоне! 🎉"
-                        )
-                    except Exception as e:
-                        logging.error(f"Ошибка при отправке напоминания пользователю {user_id}: {e}")
+            message = f"📋 Записи на завтра ({tomorrow.strftime('%d.%m.%Y')}):\n\n"
+            for i, appt in enumerate(tomorrow_appointments, 1):
+                message += (
+                    f"{i}. ⏰ {appt.get('time', '')} - {appt.get('client_name', '')} "
+                    f"({appt.get('phone', '')}) - {appt.get('service', '')}\n"
+                )
             
-            # Уведомление мастеру о завтрашних записях
-            if MASTER_CHAT_ID and tomorrow_appointments:
-                message = f"📋 Записи на завтра ({tomorrow.strftime('%d.%m.%Y')}):\n\n"
-                for i, appt in enumerate(sorted(tomorrow_appointments, key=lambda x: x.get('time', '')), 1):
-                    message += (
-                        f"{i}. ⏰ {appt.get('time', '')} - {appt.get('client_name', '')} "
-                        f"({appt.get('phone', '')}) - {appt.get('service', '')}\n"
-                    )
-                
-                try:
-                    await context.bot.send_message(MASTER_CHAT_ID, message)
-                except Exception as e:
-                    logging.error(f"Ошибка при отправке напоминания мастеру: {e}")
+            report = await self.broadcaster.broadcast([(f"master:{tomorrow_str}", MASTER_CHAT_ID, message)])
+            if report.failed:
+                logging.error(f"Не доставлен список записей мастеру: {', '.join(report.failed)}")
                     
         except Exception as e:
-            logging.error(f"Ошибка в функции напоминаний: {e}")
+            logging.error(f"Ошибка при отправке списка записей мастеру: {e}")
+
+    @instrument_handler
+    @background_job
+    async def archive_old_appointments(self, context: ContextTypes.DEFAULT_TYPE):
+        """Ночной перенос прошедших и отмененных записей в архив"""
+        try:
+            today_str = datetime.now().strftime("%Y-%m-%d")
+            archived = await self.storage.archive_appointments(today_str)
+            if archived:
+                # Индексы перестроятся по оставшимся предстоящим записям
+                self.availability.invalidate()
+                self.bookings.invalidate()
+        except Exception as e:
+            logging.error(f"Ошибка при переносе записей в архив: {e}")
 
 def main():
     """Запуск бота"""
-    application = Application.builder().token(BOT_TOKEN).build()
     bot = NailSalonBot()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .persistence(build_persistence())
+        .concurrent_updates(PerUserUpdateProcessor())
+        .post_init(bot.post_init)
+        .post_shutdown(bot.shutdown)
+        .build()
+    )
     
-    # Добавляем job для ежедневных напоминаний
+    # Клиентам напоминания отправляет ReminderScheduler, мастеру - список записей на завтра
     job_queue = application.job_queue
-    job_queue.run_daily(bot.send_reminders, time=datetime.time(hour=19, minute=0))  # Напоминания в 19:00
+    job_queue.run_daily(bot.send_master_digest, time=time(hour=MASTER_DIGEST_HOUR, minute=0))
+    job_queue.run_daily(bot.archive_old_appointments, time=time(hour=ARCHIVE_HOUR, minute=0))
+    job_queue.run_repeating(bot.save_caches, interval=CACHE_SNAPSHOT_INTERVAL, first=CACHE_SNAPSHOT_INTERVAL)
+    job_queue.run_repeating(bot.purge_reservations, interval=SLOT_HOLD_MINUTES * 60, first=SLOT_HOLD_MINUTES * 60)
     
     # Обработчик регистрации нового пользователя
     reg_conv_handler = ConversationHandler(
@@ -734,7 +1003,9 @@ def main():
             PHONE_CHOICE: [MessageHandler(filters.TEXT | filters.CONTACT, bot.handle_phone_choice)],
             PHONE_MANUAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.get_phone_manual)],
         },
-        fallbacks=[CommandHandler('cancel', bot.cancel_booking)]
+        fallbacks=[CommandHandler('cancel', bot.cancel_booking)],
+        name="registration",
+        persistent=True
     )
     
     # Обработчик записи на услугу
@@ -746,7 +1017,9 @@ def main():
             TIME: [CallbackQueryHandler(bot.select_time, pattern='^time_')],
             CONFIRMATION: [CallbackQueryHandler(bot.confirm_booking, pattern='^confirm_')],
         },
-        fallbacks=[CommandHandler('cancel', bot.cancel_booking)]
+        fallbacks=[CommandHandler('cancel', bot.cancel_dialog)],
+        name="booking",
+        persistent=True
     )
     
     # Обработчик отмены записи
@@ -755,7 +1028,9 @@ def main():
         states={
             CANCEL_BOOKING: [CallbackQueryHandler(bot.cancel_booking, pattern='^cancel_')],
         },
-        fallbacks=[CommandHandler('cancel', bot.cancel_booking)]
+        fallbacks=[CommandHandler('cancel', bot.cancel_booking)],
+        name="cancellation",
+        persistent=True
     )
     
     # Обработчик меню мастера
@@ -766,10 +1041,13 @@ def main():
                 MessageHandler(filters.Regex('^📊 Записи на сегодня$'), bot.show_today_bookings),
                 MessageHandler(filters.Regex('^📅 Записи на завтра$'), bot.show_tomorrow_bookings),
                 MessageHandler(filters.Regex('^🗓️ Все активные записи$'), bot.show_all_active_bookings),
+                MessageHandler(filters.Regex('^📈 Статистика$'), bot.show_statistics),
                 MessageHandler(filters.Regex('^🔙 Главное меню$'), bot.show_main_menu),
             ]
         },
-        fallbacks=[]
+        fallbacks=[],
+        name="master_menu",
+        persistent=True
     )
     
     # Добавляем все обработчики
@@ -781,9 +1059,20 @@ def main():
     # Простые обработчики сообщений
     application.add_handler(MessageHandler(filters.Regex('^📋 Мои записи$'), bot.show_my_bookings))
     application.add_handler(MessageHandler(filters.Regex('^🔙 Главное меню$'), bot.show_main_menu))
+    application.add_handler(CommandHandler('reload_services', bot.reload_services))
+    application.add_handler(CommandHandler('metrics', bot.show_metrics))
+    application.add_handler(CommandHandler('export', bot.export_data))
+    application.add_handler(CommandHandler('import_clients', bot.import_client_list))
+    application.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r'^/import_clients'), bot.import_client_list
+    ))
+    application.add_handler(CallbackQueryHandler(bot.turn_bookings_page, pattern='^bookings_page_'))
     
     # Запускаем бота
-    application.run_polling()
+    if RUN_MODE == 'webhook':
+        asyncio.run(serve_webhook(application))
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from app.metrics import TELEGRAM_SENT, TELEGRAM_FAILURES
+from config.settings import (
+    BROADCAST_RATE, BROADCAST_CHAT_INTERVAL, BROADCAST_CONCURRENCY,
+    BROADCAST_MAX_RETRIES, DELIVERY_LOG_PATH, DELIVERY_LOG_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Простой асинхронный token bucket: не больше rate событий в секунду"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DeliveryLog:
+    """Журнал доставленных сообщений в файле (строки 'ключ<TAB>дата').
+
+    Запись дописывается по одной строке, поэтому после перезапуска
+    уже отправленные напоминания не повторяются.
+    """
+
+    def __init__(self, path=DELIVERY_LOG_PATH, keep_days=DELIVERY_LOG_DAYS):
+        self.path = path
+        self.keep_days = keep_days
+        self._delivered = None
+
+    def _load(self):
+        self._delivered = {}
+        if not os.path.exists(self.path):
+            return
+        cutoff = (datetime.now() - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                key, _, day = line.rstrip('\n').partition('\t')
+                if key and day >= cutoff:
+                    self._delivered[key] = day
+        # Переписываем файл без устаревших строк
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{key}\t{day}\n" for key, day in self._delivered.items())
+
+    def __contains__(self, key):
+        if self._delivered is None:
+            self._load()
+        return key in self._delivered
+
+    def add(self, key):
+        if self._delivered is None:
+            self._load()
+        day = datetime.now().strftime("%Y-%m-%d")
+        self._delivered[key] = day
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"{key}\t{day}\n")
+
+
+class BroadcastReport:
+    """Итоги рассылки"""
+
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0
+        self.failed = []
+        self.uncertain = []  # ответ не пришел: сообщение могло дойти, повторно не отправляется
+        self.retries = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"отправлено {self.sent}, пропущено {self.skipped}, ошибок {len(self.failed)}, "
+            f"без подтверждения {len(self.uncertain)}, "
+            f"повторов {self.retries}, {self.elapsed:.1f} с ({self.throughput:.1f} сообщ./с)"
+        )
+
+
+class Broadcaster:
+    """Параллельная рассылка с учетом лимитов Telegram.
+
+    Общий лимит (~30 сообщений в секунду) и интервал между сообщениями
+    в один чат соблюдаются, при RetryAfter и сетевых ошибках сообщение
+    отправляется повторно с нарастающей паузой. Доставленные сообщения
+    отмечаются в журнале и при повторном запуске не отправляются. После
+    таймаута сообщение могло дойти, поэтому оно тоже отмечается и не
+    повторяется, чтобы клиент не получил его дважды.
+    """
+
+    def __init__(self, bot, delivery_log=None, rate=BROADCAST_RATE, chat_interval=BROADCAST_CHAT_INTERVAL,
+                 concurrency=BROADCAST_CONCURRENCY, max_retries=BROADCAST_MAX_RETRIES):
+        self.bot = bot
+        self.delivery_log = delivery_log if delivery_log is not None else DeliveryLog()
+        self.limiter = RateLimiter(rate)
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chat_locks = {}    # chat_id -> (блокировка, число ожидающих ее отправок)
+        self._chat_last_sent = {}
+
+    async def broadcast(self, messages):
+        """Отправляет сообщения [(ключ, chat_id, текст)] и возвращает BroadcastReport"""
+        report = BroadcastReport()
+        started = time.monotonic()
+        await asyncio.gather(*(self._deliver(key, chat_id, text, report) for key, chat_id, text in messages))
+        report.elapsed = time.monotonic() - started
+        if messages:
+            logger.info(f"Рассылка: {report}")
+        return report
+
+    async def _deliver(self, key, chat_id, text, report):
+        if key in self.delivery_log:
+            report.skipped += 1
+            return
+        lock, users = self._chat_locks.get(chat_id, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._chat_locks[chat_id] = (lock, users + 1)
+        try:
+            async with lock, self._semaphore:
+                await self._send(key, chat_id, text, report)
+        finally:
+            # Блокировка нужна, только пока в чат есть отправки: словарь не растет с числом чатов
+            lock, users = self._chat_locks[chat_id]
+            if users == 1:
+                del self._chat_locks[chat_id]
+            else:
+                self._chat_locks[chat_id] = (lock, users - 1)
+
+    async def _send(self, key, chat_id, text, report):
+        """Отправляет одно сообщение с повторами (чат уже заблокирован вызывающим)"""
+        for attempt in range(self.max_retries + 1):
+            # Пауза между сообщениями в один чат
+            wait = self._chat_last_sent.get(chat_id, 0) + self.chat_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id, text)
+            except RetryAfter as e:
+                TELEGRAM_FAILURES.inc(reason="retry_after")
+                delay = e.retry_after
+            except (Forbidden, BadRequest) as e:
+                TELEGRAM_FAILURES.inc(reason=type(e).__name__.lower())
+                # Пользователь заблокировал бота или чат не существует - повтор не поможет
+                logging.error(f"Сообщение {key} в чат {chat_id} не доставлено: {e}")
+                report.failed.append(key)
+                return
+            except TimedOut as e:
+                TELEGRAM_FAILURES.inc(reason="timed_out")
+                # Запрос мог дойти до Telegram: повтор рискует отправить сообщение дважды
+                logging.warning(f"Нет ответа на отправку {key} в чат {chat_id}, сообщение могло быть доставлено: {e}")
+                self._chat_last_sent[chat_id] = time.monotonic()
+                self.delivery_log.add(key)
+                report.uncertain.append(key)
+                return
+            except NetworkError as e:
+                TELEGRAM_FAILURES.inc(reason="network")
+                delay = 2 ** attempt
+                logging.warning(f"Сетевая ошибка при отправке {key}: {e}")
+            else:
+                self._chat_last_sent[chat_id] = time.monotonic()
+                self.delivery_log.add(key)
+                TELEGRAM_SENT.inc()
+                report.sent += 1
+                return
+            if attempt < self.max_retries:
+                report.retries += 1
+                await asyncio.sleep(delay)
+        logging.error(f"Сообщение {key} в чат {chat_id} не доставлено после {self.max_retries} повторов")
+        TELEGRAM_FAILURES.inc(reason="gave_up")
+        report.failed.append(key)
@@ -0,0 +1,83 @@
+import calendar
+from datetime import date
+from functools import lru_cache
+
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.metrics import cache_lookup
+from config.settings import CALENDAR_NEARLY_FULL, SLOT_DURATION
+
+WEEK_DAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+CALENDAR_LEGEND = "✖ - нет свободного времени, • - осталось мало мест"
+
+
+def shift_month(today, month_offset):
+    """Год и месяц через month_offset месяцев от текущего"""
+    year, month = divmod(today.month - 1 + month_offset, 12)
+    return today.year + year, month + 1
+
+
+@lru_cache(maxsize=64)
+def month_grid(year, month, today):
+    """Недели месяца: дата для доступного дня, None для пустых и прошедших клеток"""
+    return tuple(
+        tuple(day if day.month == month and day >= today else None for day in week)
+        for week in calendar.Calendar().monthdatescalendar(year, month)
+    )
+
+
+class CalendarRenderer:
+    """Готовые клавиатуры календаря с отметками занятости.
+
+    Сетка месяца кэшируется по (месяц, сегодня), клавиатура - дополнительно
+    по длительности услуги и версии занятости месяца в индексе, поэтому
+    листание месяцев не требует ни пересчета, ни обращения к хранилищу.
+    День доступен, если услуга выбранной длительности где-то в нем помещается.
+    """
+
+    def __init__(self, availability, nearly_full=CALENDAR_NEARLY_FULL):
+        self.availability = availability
+        self.nearly_full = nearly_full
+        self._keyboards = {}
+
+    def keyboard(self, month_offset, duration=SLOT_DURATION, today=None):
+        today = today or date.today()
+        year, month = shift_month(today, month_offset)
+        key = (year, month, today, duration, self.availability.month_version(year, month))
+        reply_markup = self._keyboards.get(key)
+        cache_lookup("calendar", reply_markup is not None)
+        if reply_markup is None:
+            if len(self._keyboards) > 32:
+                self._keyboards.clear()
+            reply_markup = self._render(year, month, today, month_offset, duration)
+            self._keyboards[key] = reply_markup
+        return reply_markup
+
+    def _render(self, year, month, today, month_offset, duration):
+        # Свободные начала услуги по дням месяца - одна матрица занятости на месяц
+        free_starts = self.availability.month_free_starts(year, month, duration)
+
+        keyboard = [
+            [
+                InlineKeyboardButton("←", callback_data=f"prev_month_{month_offset}"),
+                InlineKeyboardButton(date(year, month, 1).strftime("%B %Y"), callback_data="ignore"),
+                InlineKeyboardButton("→", callback_data=f"next_month_{month_offset}")
+            ],
+            [InlineKeyboardButton(day, callback_data="ignore") for day in WEEK_DAYS],
+        ]
+        for week in month_grid(year, month, today):
+            row = []
+            for day in week:
+                if day is None:
+                    row.append(InlineKeyboardButton(" ", callback_data="ignore"))
+                    continue
+                date_str = day.strftime("%Y-%m-%d")
+                free = free_starts.get(date_str, 0)
+                if free <= 0:
+                    row.append(InlineKeyboardButton(f"{day.day}✖", callback_data="ignore"))
+                elif free <= self.nearly_full:
+                    row.append(InlineKeyboardButton(f"{day.day}•", callback_data=f"date_{date_str}"))
+                else:
+                    row.append(InlineKeyboardButton(str(day.day), callback_data=f"date_{date_str}"))
+            keyboard.append(row)
+        return InlineKeyboardMarkup(keyboard)
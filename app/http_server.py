@@ -0,0 +1,86 @@
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 10  # секунд на чтение запроса
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable",
+}
+
+
+async def read_request(reader):
+    """Читает HTTP-запрос: (метод, путь, заголовки, тело)"""
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    method, path, _ = request_line.split(' ', 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY_SIZE:
+        raise OverflowError(length)
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+
+class HttpServer:
+    """Минимальный HTTP-сервер на asyncio (один запрос на соединение).
+
+    Наследники реализуют dispatch(метод, путь, заголовки, тело) и возвращают
+    (код, тело): словарь отдается как JSON, строка - как text/plain.
+    """
+
+    def __init__(self, listen, port, drain_timeout=10):
+        self.listen = listen
+        self.port = port
+        self.drain_timeout = drain_timeout
+        self._server = None
+        self._connections = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+
+    async def stop(self):
+        """Закрывает порт и дожидается текущих запросов"""
+        if self._server is not None:
+            self._server.close()
+        if self._connections:
+            await asyncio.wait(set(self._connections), timeout=self.drain_timeout)
+
+    async def _handle(self, reader, writer):
+        self._connections.add(asyncio.current_task())
+        try:
+            try:
+                request = await asyncio.wait_for(read_request(reader), REQUEST_TIMEOUT)
+            except OverflowError:
+                status, body = 413, {}
+            except (ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                status, body = 400, {}
+            else:
+                status, body = await self.dispatch(*request)
+            if isinstance(body, str):
+                content_type, payload = "text/plain; version=0.0.4; charset=utf-8", body.encode()
+            else:
+                content_type, payload = "application/json", json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    async def dispatch(self, method, path, headers, body):
+        raise NotImplementedError
@@ -0,0 +1,243 @@
+import functools
+import logging
+import time
+from bisect import bisect_left
+
+from app.http_server import HttpServer
+from config.settings import METRICS_LISTEN, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Gauge:
+    """Показатель, который считывается функцией в момент выдачи метрик"""
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.sources = {}
+
+    def set_function(self, function, **labels):
+        self.sources[_label_key(labels)] = function
+
+    def read(self):
+        """Текущие значения: [(метки, значение)]"""
+        values = []
+        for key, function in sorted(self.sources.items()):
+            try:
+                values.append((key, function()))
+            except Exception as e:
+                logging.error(f"Ошибка при чтении метрики {self.name}: {e}")
+        return values
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        for key, value in self.read():
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.series = {}  # метки -> [счетчики по корзинам (+Inf последней), сумма, количество]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q, key):
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        counts, _, total = self.series[key]
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total_sum, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {total_sum!r}"
+            yield f"{self.name}_count{_format_labels(key)} {count}"
+
+
+class MetricsRegistry:
+    """Метрики бота в памяти процесса с выдачей в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation):
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name, documentation):
+        return self._register(Gauge(name, documentation))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HANDLER_SECONDS = metrics.histogram("bot_handler_seconds", "Время работы обработчиков бота")
+HANDLER_EXCEPTIONS = metrics.counter("bot_handler_exceptions_total", "Необработанные исключения в обработчиках")
+SHEETS_SECONDS = metrics.histogram("sheets_request_seconds", "Время запросов к Google Sheets по листам и методам")
+SHEETS_ERRORS = metrics.counter("sheets_request_errors_total", "Ошибки запросов к Google Sheets")
+CACHE_REQUESTS = metrics.counter("cache_requests_total", "Обращения к кэшам: result=hit|miss")
+TELEGRAM_SENT = metrics.counter("telegram_messages_sent_total", "Отправленные рассылкой сообщения")
+TELEGRAM_FAILURES = metrics.counter("telegram_send_failures_total", "Ошибки отправки сообщений по причинам")
+QUEUE_DEPTH = metrics.gauge("bot_queue_depth", "Глубина очередей бота")
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def instrument_handler(func):
+    """Декоратор обработчика: время выполнения и необработанные исключения"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_EXCEPTIONS.inc(handler=func.__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=func.__name__)
+    return wrapper
+
+
+class SheetsTimer:
+    """Контекстный менеджер для замера запроса к Sheets"""
+
+    def __init__(self, sheet, method):
+        self.labels = {'sheet': sheet, 'method': method}
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        SHEETS_SECONDS.observe(time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None:
+            SHEETS_ERRORS.inc(error=exc_type.__name__, **self.labels)
+
+
+def summary():
+    """Короткая сводка для мастера"""
+    lines = ["📊 Метрики бота\n", "Обработчики (вызовов, среднее / p95):"]
+    handlers = sorted(HANDLER_SECONDS.series.items(), key=lambda item: -item[1][1])
+    for key, (_, total, count) in handlers[:8]:
+        p95 = HANDLER_SECONDS.quantile(0.95, key)
+        lines.append(f"  {dict(key)['handler']}: {count}, {total / count * 1000:.0f} мс / ≤{p95 * 1000:.0f} мс")
+
+    lines.append("\nЗапросы к таблице:")
+    for key, (_, total, count) in sorted(SHEETS_SECONDS.series.items(), key=lambda item: -item[1][2]):
+        labels = dict(key)
+        lines.append(f"  {labels['sheet']}.{labels['method']}: {count}, {total / count * 1000:.0f} мс")
+    errors = sum(SHEETS_ERRORS.values.values())
+    if errors:
+        lines.append(f"  ошибок: {errors}")
+
+    caches = {}
+    for key, value in CACHE_REQUESTS.values.items():
+        labels = dict(key)
+        caches.setdefault(labels['cache'], {})[labels['result']] = value
+    if caches:
+        lines.append("\nПопадания в кэш:")
+        for cache, results in sorted(caches.items()):
+            total = results.get('hit', 0) + results.get('miss', 0)
+            lines.append(f"  {cache}: {results.get('hit', 0) / total:.0%} из {total}")
+
+    failures = sum(TELEGRAM_FAILURES.values.values())
+    lines.append(f"\nРассылка: отправлено {sum(TELEGRAM_SENT.values.values()):.0f}, ошибок {failures:.0f}")
+    depths = QUEUE_DEPTH.read()
+    if depths:
+        lines.append("Очереди: " + ", ".join(f"{dict(key)['queue']} {value}" for key, value in depths))
+    return "\n".join(lines)
+
+
+class MetricsServer(HttpServer):
+    """Отдает метрики по GET /metrics (для режима long polling)"""
+
+    def __init__(self, registry=metrics, listen=METRICS_LISTEN, port=METRICS_PORT):
+        super().__init__(listen, port)
+        self.registry = registry
+
+    async def start(self):
+        await super().start()
+        logger.info(f"Метрики доступны на {self.listen}:{self.port}/metrics")
+
+    async def dispatch(self, method, path, headers, body):
+        if path != '/metrics':
+            return 404, {}
+        if method != 'GET':
+            return 405, {}
+        return 200, self.registry.render()
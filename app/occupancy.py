@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+from math import gcd
+
+import numpy as np
+
+from app.availability import appointment_duration, format_minutes, to_minutes
+
+
+class OccupancyMatrix:
+    """Занятость диапазона дат у всех мастеров: массив дни × мастера × клетки.
+
+    Клетка - отрезок дня длиной resolution минут, True - мастер занят или
+    не работает. Матрица строится за один проход по записям, а вопросы о
+    периоде (сколько свободного времени по дням, первое свободное начало,
+    свободные окна под услугу) решаются операциями над массивом целиком,
+    без цикла по дням. Длительности округляются вверх до целых клеток.
+    """
+
+    def __init__(self, date_from, days, masters, step):
+        self.date_from = datetime.strptime(str(date_from), "%Y-%m-%d").date()
+        self.dates = [(self.date_from + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+        self.masters = masters
+        self.step = step
+        self.day_start = min(master.start for master in masters)
+        day_end = max(master.end for master in masters)
+        # Клетка делит и шаг сетки, и смещение начала смены каждого мастера
+        self.resolution = gcd(step, *(master.start - self.day_start for master in masters))
+        self.cells = -(-(day_end - self.day_start) // self.resolution)
+        self.busy = np.ones((days, len(masters), self.cells), dtype=bool)
+        # Допустимые начала: сетка мастера с шагом step от начала его смены
+        self.start_mask = np.zeros((len(masters), self.cells), dtype=bool)
+        for i, master in enumerate(masters):
+            first = (master.start - self.day_start) // self.resolution
+            last = (master.end - self.day_start) // self.resolution
+            self.busy[:, i, first:last] = False
+            self.start_mask[i, first:last:step // self.resolution] = True
+
+    @classmethod
+    def build(cls, intervals, date_from, days, masters, step):
+        """Матрица по интервалам (дата, мастер, начало, конец) за один проход"""
+        matrix = cls(date_from, days, masters, step)
+        matrix.fill(intervals)
+        return matrix
+
+    @classmethod
+    def from_appointments(cls, appointments, date_from, days, masters, step):
+        """Матрица по записям; записи без известного мастера относятся к первому"""
+        names = {master.name for master in masters}
+
+        def intervals():
+            for appt in appointments:
+                start = to_minutes(appt.get('time', ''))
+                if appt.get('status') == 'cancelled' or start is None:
+                    continue
+                master = str(appt.get('master') or '')
+                yield (
+                    str(appt.get('date', '')), master if master in names else masters[0].name,
+                    start, start + appointment_duration(appt)
+                )
+        return cls.build(intervals(), date_from, days, masters, step)
+
+    def fill(self, intervals):
+        """Отмечает интервалы занятыми: разностный массив и одна накопленная сумма"""
+        day_index = {date_str: i for i, date_str in enumerate(self.dates)}
+        master_index = {master.name: i for i, master in enumerate(self.masters)}
+        rows, starts, ends = [], [], []
+        for date_str, master, start, end in intervals:
+            day, column = day_index.get(date_str), master_index.get(master)
+            if day is not None and column is not None:
+                rows.append(day * len(self.masters) + column)
+                starts.append(start)
+                ends.append(end)
+        if not rows:
+            return
+        width = self.cells + 1
+        offsets = np.array(rows, dtype=np.int64) * width
+        first = np.clip((np.array(starts) - self.day_start) // self.resolution, 0, self.cells)
+        last = np.clip(-(-(np.array(ends) - self.day_start) // self.resolution), 0, self.cells)
+        size = self.busy.shape[0] * self.busy.shape[1] * width
+        delta = np.bincount(offsets + first, minlength=size) - np.bincount(offsets + last, minlength=size)
+        delta = delta.reshape(self.busy.shape[:2] + (width,))
+        self.busy |= np.cumsum(delta, axis=2)[:, :, :self.cells] > 0
+
+    def _length(self, duration):
+        return -(-duration // self.resolution)
+
+    def fits(self, duration):
+        """Начала, с которых у мастера свободно duration минут: дни × мастера × клетки"""
+        length = self._length(duration)
+        fits = np.zeros(self.busy.shape, dtype=bool)
+        if length > self.cells:
+            return fits
+        # Занятых клеток в окне [s, s + length) - разность накопленных сумм
+        taken = np.cumsum(self.busy, axis=2, dtype=np.int32)
+        taken = np.concatenate([np.zeros(self.busy.shape[:2] + (1,), dtype=np.int32), taken], axis=2)
+        fits[:, :, :self.cells - length + 1] = taken[:, :, length:] == taken[:, :, :-length]
+        return fits & self.start_mask
+
+    def free_starts(self, duration):
+        """Начала, свободные хотя бы у одного мастера: дни × клетки"""
+        return self.fits(duration).any(axis=1)
+
+    def free_counts(self, duration):
+        """Количество возможных начал услуги по дням"""
+        return self.free_starts(duration).sum(axis=1)
+
+    def first_free(self, duration):
+        """Первое свободное время по дням ('HH:MM' или None)"""
+        starts = self.free_starts(duration)
+        first = starts.argmax(axis=1)
+        return [
+            self._time(cell) if found else None
+            for cell, found in zip(first.tolist(), starts.any(axis=1).tolist())
+        ]
+
+    def next_free(self, duration):
+        """Ближайшие (дата, время), когда услуга помещается; None, если таких нет"""
+        starts = self.free_starts(duration)
+        days = np.flatnonzero(starts.any(axis=1))
+        if not len(days):
+            return None
+        day = int(days[0])
+        return self.dates[day], self._time(int(starts[day].argmax()))
+
+    def free_windows(self, duration=0):
+        """Непрерывные свободные промежутки не короче duration минут:
+        [(дата, мастер, начало, конец)] по дням и мастерам"""
+        free = np.zeros(self.busy.shape[:2] + (self.cells + 2,), dtype=np.int8)
+        free[:, :, 1:-1] = ~self.busy
+        edges = np.diff(free, axis=2)
+        # Начала и концы промежутков идут в одном порядке (по дням, мастерам, времени)
+        days, masters, starts = np.nonzero(edges == 1)
+        ends = np.nonzero(edges == -1)[2]
+        keep = (ends - starts) >= self._length(duration)
+        return [
+            (self.dates[day], self.masters[master].name, self._time(start), self._time(end))
+            for day, master, start, end in zip(
+                days[keep].tolist(), masters[keep].tolist(), starts[keep].tolist(), ends[keep].tolist()
+            )
+        ]
+
+    def _time(self, cell):
+        return format_minutes(self.day_start + cell * self.resolution)
@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+
+from telegram.ext import PicklePersistence, PersistenceInput
+
+from config.settings import PERSISTENCE_PATH, PERSISTENCE_INTERVAL, CACHE_SNAPSHOT_PATH
+
+logger = logging.getLogger(__name__)
+
+# Версия формата снимка: при несовпадении снимок игнорируется
+SNAPSHOT_VERSION = 4
+
+
+def build_persistence(path=PERSISTENCE_PATH, interval=PERSISTENCE_INTERVAL):
+    """Сохранение состояний разговоров и context.user_data между перезапусками.
+
+    Каждая категория хранится в своем файле ({path}_conversations,
+    {path}_user_data), а приложение передает только изменившиеся данные,
+    поэтому запись недорогая даже при частом сохранении.
+    """
+    return PicklePersistence(
+        filepath=path,
+        store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+        single_file=False,
+        update_interval=interval,
+    )
+
+
+class CacheSnapshot:
+    """Снимок кэшей бота в файле для быстрого «теплого» перезапуска.
+
+    Файл перезаписывается атомарно (через временный файл) и только если
+    содержимое изменилось с прошлого сохранения; запись на диск идет
+    в отдельном потоке и не блокирует обработку сообщений.
+    """
+
+    def __init__(self, path=CACHE_SNAPSHOT_PATH):
+        self.path = path
+        self._digest = None
+
+    def load(self):
+        """Состояние из файла или None, если снимка нет или он не читается"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                version, state = pickle.load(f)
+        except Exception as e:
+            logging.error(f"Ошибка при чтении снимка кэшей: {e}")
+            return None
+        if version != SNAPSHOT_VERSION:
+            return None
+        return state
+
+    async def save(self, state):
+        """Сохраняет состояние; возвращает False, если оно не изменилось"""
+        # Сериализуем в цикле событий, пока кэши не меняются, пишем - в потоке
+        data = pickle.dumps((SNAPSHOT_VERSION, state), protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(data).digest()
+        if digest == self._digest:
+            return False
+        await asyncio.to_thread(self._write, data)
+        self._digest = digest
+        return True
+
+    def _write(self, data):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
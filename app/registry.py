@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+
+from app.metrics import cache_lookup
+from config.settings import CLIENTS_CACHE_TTL, CLIENTS_RELOAD_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Порядок столбцов листа clients (как их пишет save_client_data)
+CLIENT_COLUMNS = ['user_id', 'client_name', 'phone', 'username', 'first_name', 'last_name', 'registered_at']
+
+
+class ClientRegistry:
+    """Реестр клиентов в памяти с индексом по user_id.
+
+    Лист загружается один раз, затем по истечении TTL дочитываются
+    только новые строки. Если строки удаляли или таблица менялась
+    вручную (invalidate), а также раз в reload_interval секунд лист
+    загружается целиком. Регистрация через бота сразу попадает в индекс.
+    """
+
+    def __init__(self, storage, ttl=CLIENTS_CACHE_TTL, sheet_name="clients", reload_interval=CLIENTS_RELOAD_INTERVAL):
+        self.storage = storage
+        self.ttl = ttl
+        self.reload_interval = reload_interval
+        self.sheet_name = sheet_name
+        self._clients = {}
+        self._added = {}            # user_id -> клиент, добавленный ботом, но еще не прочитанный из листа
+        self._rows_loaded = 0
+        self._last_user_id = None   # user_id последней прочитанной строки
+        self._refreshed_at = None
+        self._reloaded_at = None
+        self._stale = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._clients)
+
+    async def get(self, user_id):
+        """Клиент по user_id или None"""
+        await self._ensure_fresh()
+        return self._clients.get(str(user_id))
+
+    def add(self, record):
+        """Добавляет в индекс клиента, только что записанного в лист"""
+        self._index(record)
+        user_id = str(record.get('user_id', ''))
+        self._added[user_id] = record
+        self._rows_loaded += 1
+        self._last_user_id = user_id
+
+    def discard(self, user_id):
+        """Убирает клиента, которого не удалось записать в лист"""
+        user_id = str(user_id)
+        if self._added.pop(user_id, None) is not None:
+            self._clients.pop(user_id, None)
+            # Счетчик строк уже учел клиента: сверяемся с листом заново
+            self._stale = True
+
+    def invalidate(self):
+        """Таблица менялась: при следующем обновлении лист загружается целиком"""
+        self._stale = True
+
+    def _index(self, record):
+        user_id = str(record.get('user_id', ''))
+        if user_id:
+            self._clients[user_id] = record
+            self._added.pop(user_id, None)
+
+    async def _ensure_fresh(self):
+        fresh = self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.ttl
+        cache_lookup("clients", fresh)
+        if fresh:
+            return
+        async with self._lock:
+            if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.ttl:
+                return
+            if (self._refreshed_at is None or self._stale
+                    or time.monotonic() - self._reloaded_at >= self.reload_interval):
+                await self.reload()
+            else:
+                await self.refresh()
+
+    def snapshot(self):
+        if self._refreshed_at is None:
+            return None
+        refreshed_at = round(time.time() - (time.monotonic() - self._refreshed_at))
+        return self._clients, self._rows_loaded, self._last_user_id, refreshed_at
+
+    def restore(self, state):
+        """Восстанавливает индекс из снимка; после TTL дочитываются только новые строки"""
+        self._clients, self._rows_loaded, self._last_user_id, refreshed_at = state
+        self._refreshed_at = self._reloaded_at = time.monotonic() - (time.time() - refreshed_at)
+
+    async def reload(self):
+        """Полная загрузка листа клиентов"""
+        records = await self.storage.get_all_records(self.sheet_name)
+        added = self._added
+        self._clients, self._added = {}, {}
+        for record in records:
+            self._index(record)
+        # Клиенты, которые еще ждут в очереди записи, в прочитанных строках не видны
+        for user_id, record in added.items():
+            if user_id not in self._clients:
+                self._clients[user_id] = self._added[user_id] = record
+        self._rows_loaded = len(records)
+        self._last_user_id = str(records[-1].get('user_id', '')) if records else None
+        self._refreshed_at = self._reloaded_at = time.monotonic()
+        self._stale = False
+        logger.info(f"Реестр клиентов загружен: {len(self._clients)} клиентов")
+
+    async def refresh(self):
+        """Дочитывает строки, появившиеся после последней загрузки"""
+        if not self._rows_loaded:
+            return await self.reload()
+        # Строка 1 - заголовок: читаем с последней известной строки (_rows_loaded + 1).
+        # Если там другой клиент или строки нет, строки удаляли - загружаем лист заново
+        records = await self.storage.get_records_from(self.sheet_name, self._rows_loaded + 1)
+        if not records or str(records[0].get('user_id', '')) != self._last_user_id:
+            logger.info("Строки листа клиентов удалены или сдвинуты, реестр загружается заново")
+            return await self.reload()
+        records = records[1:]
+        for record in records:
+            self._index(record)
+        self._rows_loaded += len(records)
+        if records:
+            self._last_user_id = str(records[-1].get('user_id', ''))
+        self._refreshed_at = time.monotonic()
+        if records:
+            logger.info(f"В реестр клиентов добавлено {len(records)} новых строк")
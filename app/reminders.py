@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+
+from config.settings import REMINDER_OFFSETS
+
+logger = logging.getLogger(__name__)
+
+
+def appointment_start(appt):
+    """Начало записи (datetime) или None, если дата или время не разбираются"""
+    try:
+        return datetime.strptime(f"{appt.get('date', '')} {appt.get('time', '')}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        return None
+
+
+def appointment_created(appt):
+    """Время создания записи (datetime) или None"""
+    try:
+        return datetime.strptime(str(appt.get('created_at', '')), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def reminder_text(appt, start, now):
+    if start.date() == now.date():
+        when = f"Сегодня в {start.strftime('%H:%M')}"
+    elif start.date() == (now + timedelta(days=1)).date():
+        when = f"Завтра, {start.strftime('%d.%m.%Y')} в {start.strftime('%H:%M')}"
+    else:
+        when = f"{start.strftime('%d.%m.%Y')} в {start.strftime('%H:%M')}"
+    return (
+        f"🔔 Напоминание о записи!\n\n"
+        f"{when}\n"
+        f"У вас запись на: {appt.get('service', '')}\n\n"
+        f"Ждем вас в салоне! 🎉"
+    )
+
+
+class ReminderScheduler:
+    """Напоминания клиентам за REMINDER_OFFSETS часов до каждой записи.
+
+    Напоминания лежат в куче по времени отправки; одна задача спит до
+    ближайшего и будит себя заново, если появилось более раннее.
+    Отмена записи не трогает кучу: у записи меняется версия, и старые
+    элементы пропускаются при извлечении.
+    """
+
+    def __init__(self, send, offsets=REMINDER_OFFSETS):
+        self.send = send  # корутина: send([(ключ, chat_id, текст)])
+        self.offsets = sorted(offsets, reverse=True)
+        self._heap = []           # (время отправки, номер, ID записи, версия, часы до записи)
+        self._appointments = {}   # ID -> [запись, версия, неотправленных напоминаний]
+        self._versions = itertools.count()
+        self._order = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._appointments)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def load(self, appointments):
+        """Планирует напоминания для записей из хранилища (при запуске бота)"""
+        for appt in appointments:
+            self.add(appt, catch_up=True)
+        logger.info(f"Напоминания запланированы для {len(self._appointments)} записей")
+
+    def add(self, appt, catch_up=False):
+        """Планирует напоминания для записи (повторный вызов переносит их).
+
+        Наступившие напоминания не отправляются; catch_up=True (запуск бота) -
+        отправляется самое позднее из тех, что пропущены, пока бот не работал.
+        """
+        appointment_id = str(appt.get('appointment_id', ''))
+        start = appointment_start(appt)
+        now = datetime.now()
+        if appt.get('status') != 'confirmed' or start is None or start <= now or not appt.get('user_id'):
+            self.remove(appt)
+            return
+        version = next(self._versions)
+        offsets = [hours for hours in self.offsets if start - timedelta(hours=hours) > now]
+        if catch_up:
+            # Пропущенными считаются только напоминания, наступившие уже после создания записи
+            created = appointment_created(appt)
+            missed = [
+                hours for hours in self.offsets
+                if hours not in offsets and (created is None or start - timedelta(hours=hours) >= created)
+            ]
+            offsets += missed[-1:]
+        if not offsets:
+            self.remove(appt)
+            return
+        self._appointments[appointment_id] = [appt, version, len(offsets)]
+        for hours in offsets:
+            heapq.heappush(self._heap, (start - timedelta(hours=hours), next(self._order), appointment_id, version, hours))
+        if self._heap[0][3] == version:
+            self._wakeup.set()
+
+    def remove(self, appt):
+        """Отменяет напоминания записи"""
+        if self._appointments.pop(str(appt.get('appointment_id', '')), None) is not None:
+            self._compact()
+
+    def _compact(self):
+        # Устаревшие элементы удаляются при извлечении; если их накопилось много, чистим кучу сразу
+        alive = sum(remaining for _, _, remaining in self._appointments.values())
+        if len(self._heap) > 2 * alive + 100:
+            self._heap = [
+                entry for entry in self._heap
+                if self._appointments.get(entry[2], (None, None))[1] == entry[3]
+            ]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now):
+        messages = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, appointment_id, version, hours = heapq.heappop(self._heap)
+            current = self._appointments.get(appointment_id)
+            if current is None or current[1] != version:
+                continue
+            appt = current[0]
+            messages.append((
+                f"{appointment_id}:{hours:g}h", appt['user_id'], reminder_text(appt, appointment_start(appt), now)
+            ))
+            current[2] -= 1
+            if not current[2]:
+                del self._appointments[appointment_id]
+        return messages
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = datetime.now()
+            messages = self._pop_due(now)
+            if messages:
+                try:
+                    report = await self.send(messages)
+                    if report.failed:
+                        logging.error(f"Не доставлены напоминания: {', '.join(report.failed)}")
+                except Exception as e:
+                    logging.error(f"Ошибка при отправке напоминаний: {e}")
+                continue
+            timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+            try:
+                # Просыпаемся к ближайшему напоминанию или раньше, если добавили более раннее
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
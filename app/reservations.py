@@ -0,0 +1,97 @@
+import logging
+import time
+
+from app.availability import to_minutes
+from config.settings import SLOT_HOLD_MINUTES, SLOT_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class SlotReservations:
+    """Временные брони времени между выбором и подтверждением записи.
+
+    Клиент держит интервал [время, время + длительность) у одного мастера
+    SLOT_HOLD_MINUTES минут; брони разных клиентов у одного мастера не
+    пересекаются. Все методы синхронные: в цикле событий проверка и
+    изменение брони выполняются без переключений, то есть атомарно.
+    """
+
+    def __init__(self, hold_minutes=SLOT_HOLD_MINUTES):
+        self.hold_seconds = hold_minutes * 60
+        self._holds = {}  # user_id -> (date, master, начало, конец, истекает)
+
+    def _live(self, user_id):
+        hold = self._holds.get(user_id)
+        if hold is not None and hold[4] <= time.monotonic():
+            del self._holds[user_id]
+            return None
+        return hold
+
+    def _conflicts(self, date_str, time_str, user_id, master, duration):
+        start = to_minutes(time_str)
+        if start is None:
+            return False
+        end = start + duration
+        now = time.monotonic()
+        return any(
+            owner != user_id and expires > now and hold_date == date_str and hold_master == master
+            and hold_start < end and start < hold_end
+            for owner, (hold_date, hold_master, hold_start, hold_end, expires) in self._holds.items()
+        )
+
+    def hold(self, date_str, time_str, user_id, master='', duration=SLOT_DURATION):
+        """Бронирует время у мастера за клиентом; False, если его держит другой клиент"""
+        if self._conflicts(date_str, time_str, user_id, master, duration):
+            return False
+        start = to_minutes(time_str)
+        if start is None:
+            return False
+        # У клиента одна бронь: предыдущий выбор освобождается
+        self._holds[user_id] = (date_str, master, start, start + duration, time.monotonic() + self.hold_seconds)
+        return True
+
+    def commit(self, date_str, time_str, user_id, master='', duration=SLOT_DURATION):
+        """Снимает бронь при подтверждении; False, если время успел занять другой клиент"""
+        if self._conflicts(date_str, time_str, user_id, master, duration):
+            return False
+        self._holds.pop(user_id, None)
+        return True
+
+    def release(self, date_str, time_str, user_id):
+        """Освобождает бронь клиента, если она на это время"""
+        hold = self._live(user_id)
+        if hold is not None and hold[0] == date_str and hold[2] == to_minutes(time_str):
+            del self._holds[user_id]
+
+    def release_user(self, user_id):
+        """Освобождает бронь клиента, вышедшего из записи"""
+        self._holds.pop(user_id, None)
+
+    def held_by_others(self, date_str, user_id):
+        """Брони других клиентов на дату: {мастер: [(начало, конец)]} для поиска свободного времени"""
+        now = time.monotonic()
+        busy = {}
+        for owner, (hold_date, master, start, end, expires) in self._holds.items():
+            if owner != user_id and hold_date == date_str and expires > now:
+                busy.setdefault(master, []).append((start, end))
+        return busy
+
+    def snapshot(self):
+        """Брони со сроком по часам системы (монотонные часы после перезапуска другие)"""
+        now = time.monotonic()
+        offset = time.time() - now
+        return {
+            user_id: hold[:4] + (round(hold[4] + offset),)
+            for user_id, hold in self._holds.items() if hold[4] > now
+        }
+
+    def restore(self, holds):
+        offset = time.monotonic() - time.time()
+        self._holds = {user_id: hold[:4] + (hold[4] + offset,) for user_id, hold in holds.items()}
+
+    def purge(self):
+        """Удаляет истекшие брони"""
+        now = time.monotonic()
+        for user_id, hold in list(self._holds.items()):
+            if hold[4] <= now:
+                del self._holds[user_id]
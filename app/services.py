@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.metrics import cache_lookup
+from config.settings import SERVICES_CACHE_TTL, SLOT_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Услуги по умолчанию, если список в хранилище пуст
+DEFAULT_SERVICES = [
+    {'name': 'Маникюр', 'price': '', 'duration': ''},
+    {'name': 'Педикюр', 'price': '', 'duration': ''},
+    {'name': 'Покрытие', 'price': '', 'duration': ''},
+]
+
+
+def build_services_keyboard(services):
+    """Инлайн-клавиатура выбора услуги"""
+    keyboard = []
+    for service in services:
+        service_name = service.get('name', 'Услуга')
+        service_price = service.get('price', '')
+        button_text = f"{service_name} - {service_price}₽" if service_price else service_name
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"service_{service_name}")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+class ServicesCatalog:
+    """Кэш списка услуг вместе с готовой клавиатурой.
+
+    Список перечитывается по истечении SERVICES_CACHE_TTL или после
+    явного сброса (команда мастера /reload_services).
+    """
+
+    def __init__(self, storage, ttl=SERVICES_CACHE_TTL):
+        self.storage = storage
+        self.ttl = ttl
+        self._services = None
+        self._keyboard = None
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def services(self):
+        """Список услуг"""
+        cache_lookup("services", self._is_fresh())
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    await self.reload()
+        return self._services
+
+    async def keyboard(self):
+        """Клавиатура выбора услуги (строится один раз на версию списка)"""
+        services = await self.services()
+        if self._keyboard is None:
+            self._keyboard = build_services_keyboard(services)
+        return self._keyboard
+
+    async def reload(self):
+        """Перечитывает услуги из хранилища"""
+        return self.update(await self.storage.list_services())
+
+    def update(self, services):
+        """Подставляет свежий список услуг (при загрузке и при правке листа мастером)"""
+        self._services = services or DEFAULT_SERVICES
+        self._keyboard = None
+        self._loaded_at = time.monotonic()
+        logger.info(f"Список услуг загружен: {len(self._services)}")
+        return self._services
+
+    async def duration(self, name):
+        """Длительность услуги в минутах (столбец duration; без него - один слот)"""
+        for service in await self.services():
+            if service.get('name') == name:
+                try:
+                    return int(float(service.get('duration') or SLOT_DURATION))
+                except (TypeError, ValueError):
+                    break
+        return SLOT_DURATION
+
+    def invalidate(self):
+        """Сбрасывает кэш: при следующем обращении список будет перечитан"""
+        self._loaded_at = None
+
+    def snapshot(self):
+        """Состояние для сохранения между перезапусками: (список, время загрузки по часам системы)"""
+        if self._loaded_at is None:
+            return None
+        return self._services, round(time.time() - (time.monotonic() - self._loaded_at))
+
+    def restore(self, state):
+        """Восстанавливает список из снимка; TTL отсчитывается от исходной загрузки"""
+        self._services, loaded_at = state
+        self._keyboard = None
+        self._loaded_at = time.monotonic() - (time.time() - loaded_at)
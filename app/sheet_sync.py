@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from gspread.exceptions import APIError
+
+from app.metrics import metrics
+from app.sheets_scheduler import background_job
+from config.settings import SHEETS_SYNC_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+SYNC_CHECKS = metrics.counter("sheets_sync_checks_total", "Проверки ручных правок таблицы: result=unchanged|changed")
+DRIVE_RETRY_MAX = 600  # секунд между попытками Drive API после сбоев подряд
+
+
+def is_access_denied(error):
+    """Drive API недоступен насовсем: нет прав или файла, повтор не поможет"""
+    response = getattr(error, 'response', None)
+    return isinstance(error, APIError) and getattr(response, 'status_code', None) in (403, 404)
+
+
+def parse_modified_time(value):
+    """'2024-05-01T10:20:30.123Z' (modifiedTime из Drive API) -> datetime в UTC"""
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+
+class SheetsReconciler:
+    """Фоновая сверка кэшей бота с таблицей, которую мастер правит вручную.
+
+    Раз в interval секунд запрашивает время изменения файла (Drive API,
+    квота Sheets не расходуется). Лист записей и услуги перечитываются
+    только если таблица менялась; разница с памятью уходит в индексы бота
+    через on_change. Поэтому обработчики отвечают из памяти, а ручные
+    правки появляются в боте через несколько секунд.
+
+    Собственные записи бота тоже меняют время изменения файла. Если перед
+    отправкой очереди записи таблица совпадала с памятью, изменения не
+    позже конца отправки считаются своими и перечитывания не вызывают.
+    """
+
+    def __init__(self, backend, interval=SHEETS_SYNC_INTERVAL):
+        self.backend = backend
+        self.interval = interval
+        self.on_services = None   # callback(services)
+        self._modified = None
+        self._services = None
+        self._own_until = None      # конец последней своей отправки, перед которой таблица совпадала с памятью
+        self._drive_available = True
+        self._drive_failures = 0
+        self._drive_retry_at = 0
+        self._task = None
+        backend.writes.flush_guard = self.own_writes
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @background_job
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logging.error(f"Ошибка при сверке с таблицей: {e}")
+
+    async def _modified_time(self):
+        if not self._drive_available or time.monotonic() < self._drive_retry_at:
+            return None
+        try:
+            modified = await self.backend.sheets.modified_time()
+        except Exception as e:
+            if is_access_denied(e):
+                # Без доступа к Drive сверяемся каждый интервал
+                logging.error(f"Нет доступа к Drive API, сверка с таблицей по таймеру: {e}")
+                self._drive_available = False
+                return None
+            # Временный сбой: пока повторяем реже, сверяемся по таймеру
+            self._drive_failures += 1
+            delay = min(self.interval * 2 ** self._drive_failures, DRIVE_RETRY_MAX)
+            self._drive_retry_at = time.monotonic() + delay
+            logging.error(f"Ошибка при получении времени изменения таблицы, повтор через {delay:.0f} с: {e}")
+            return None
+        self._drive_failures = 0
+        return modified
+
+    def _is_known(self, modified):
+        """Изменений, кроме своих, с последнего чтения не было"""
+        if modified == self._modified:
+            return True
+        return self._own_until is not None and parse_modified_time(modified) <= self._own_until
+
+    @asynccontextmanager
+    async def own_writes(self):
+        """Оборачивает отправку очереди записи: отмечает изменения таблицы как свои"""
+        modified = await self._modified_time() if self._modified is not None else None
+        in_sync = modified is not None and self._is_known(modified)
+        yield
+        if in_sync:
+            self._own_until = datetime.now(timezone.utc)
+
+    async def reconcile(self):
+        """Перечитывает листы, если таблица изменилась; True, если перечитывали"""
+        modified = await self._modified_time()
+        if modified is not None and self._is_known(modified):
+            SYNC_CHECKS.inc(result="unchanged")
+            self._modified = modified
+            return False
+        SYNC_CHECKS.inc(result="changed")
+        # Клиентов перечитываем целиком при следующем обращении: строки могли удалить или исправить
+        self.backend.clients.invalidate()
+        # Разница с памятью уходит в индексы через AppointmentBook.on_change
+        await self.backend.appointments.records()
+        services = await self.backend.sheets.get_all_records("services")
+        if services != self._services:
+            if self._services is not None:
+                logger.info("Список услуг изменен в таблице")
+            self._services = services
+            if self.on_services is not None:
+                self.on_services(services)
+        # Время запоминаем только после чтения: правки во время чтения увидим в следующий раз
+        self._modified = modified
+        return True
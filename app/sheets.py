@@ -0,0 +1,129 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+import gspread
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+from config.settings import (
+    SPREADSHEET_ID, SHEETS_TOKEN_REFRESH_MARGIN, SHEETS_HTTP_POOL_SIZE, SHEETS_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+class SheetsClientManager:
+    """Долгоживущий клиент Google Sheets.
+
+    Авторизуется один раз, держит одну HTTP-сессию с keep-alive,
+    кэширует листы по имени и обновляет токен в фоновом потоке.
+    """
+
+    def __init__(self, spreadsheet_id=SPREADSHEET_ID, refresh_margin=SHEETS_TOKEN_REFRESH_MARGIN):
+        self.spreadsheet_id = spreadsheet_id
+        self.refresh_margin = refresh_margin
+        self._lock = threading.RLock()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def _load_credentials(self):
+        # Для Heroku используем переменные окружения
+        if os.environ.get('GOOGLE_CREDENTIALS'):
+            creds_info = json.loads(os.environ['GOOGLE_CREDENTIALS'])
+            return Credentials.from_service_account_info(creds_info, scopes=SCOPES)
+        raise ValueError("GOOGLE_CREDENTIALS не установлены")
+
+    @property
+    def client(self):
+        """Авторизованный клиент gspread (создается при первом обращении)"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    client = gspread.authorize(self._load_credentials())
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SHEETS_HTTP_POOL_SIZE)
+                    client.session.mount("https://", adapter)
+                    client.set_timeout(SHEETS_TIMEOUT)
+                    self._client = client
+                    self._refresh_token()
+                    self._start_refresher()
+        return self._client
+
+    @property
+    def spreadsheet(self):
+        """Таблица салона (метаданные загружаются один раз)"""
+        if self._spreadsheet is None:
+            with self._lock:
+                if self._spreadsheet is None:
+                    self._spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+        return self._spreadsheet
+
+    def worksheet(self, sheet_name):
+        """Возвращает закэшированный лист по имени"""
+        worksheet = self._worksheets.get(sheet_name)
+        if worksheet is None:
+            with self._lock:
+                worksheet = self._worksheets.get(sheet_name)
+                if worksheet is None:
+                    worksheet = self.spreadsheet.worksheet(sheet_name)
+                    self._worksheets[sheet_name] = worksheet
+        return worksheet
+
+    def invalidate(self, sheet_name=None):
+        """Сбрасывает кэш листов (например, после переименования листа в таблице)"""
+        with self._lock:
+            if sheet_name is None:
+                self._worksheets.clear()
+                self._spreadsheet = None
+            else:
+                self._worksheets.pop(sheet_name, None)
+
+    def _refresh_token(self):
+        with self._lock:
+            credentials = self._client.auth
+            # Обычная сессия requests: AuthorizedSession клиента сама подписывает запросы этими же учетными данными
+            credentials.refresh(Request())
+            logger.info(f"Токен Google обновлен, действует до {credentials.expiry}")
+
+    def _seconds_until_refresh(self):
+        expiry = self._client.auth.expiry
+        if expiry is None:
+            return self.refresh_margin
+        remaining = (expiry - datetime.utcnow()).total_seconds() - self.refresh_margin
+        return max(remaining, 1)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                self._refresh_token()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении токена Google: {e}")
+                # Повторим попытку через минуту; сессия обновит токен сама, если не успеем
+                if self._stop.wait(60):
+                    break
+
+    def _start_refresher(self):
+        self._refresher = threading.Thread(target=self._refresh_loop, name="sheets-token-refresh", daemon=True)
+        self._refresher.start()
+
+    def close(self):
+        """Останавливает фоновое обновление и закрывает HTTP-сессию"""
+        self._stop.set()
+        if self._client is not None:
+            self._client.session.close()
+
+
+sheets_manager = SheetsClientManager()
+
+
+def get_google_sheet(sheet_name="clients"):
+    """Лист таблицы через общий долгоживущий клиент"""
+    return sheets_manager.worksheet(sheet_name)
@@ -0,0 +1,178 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+
+from gspread.exceptions import APIError
+
+from app.metrics import metrics
+from config.settings import SHEETS_BURST, SHEETS_MAX_RETRIES, SHEETS_READS_PER_MINUTE, SHEETS_WRITES_PER_MINUTE
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: меньше - раньше
+USER = 0
+BACKGROUND = 1
+
+_priority = contextvars.ContextVar("sheets_priority", default=USER)
+
+COALESCED_READS = metrics.counter("sheets_reads_coalesced_total", "Чтения, получившие ответ уже идущего запроса")
+THROTTLE_SECONDS = metrics.histogram("sheets_throttle_seconds", "Ожидание квоты Google Sheets перед запросом")
+RATE_LIMITED = metrics.counter("sheets_rate_limited_total", "Ответы 429 от Google Sheets")
+
+
+@contextmanager
+def background_priority():
+    """Запросы к таблице внутри блока уступают очередь запросам пользователей"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def background_job(func):
+    """Декоратор фоновой задачи (напоминания, архив, зеркало): низкий приоритет запросов"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with background_priority():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def is_rate_limited(error):
+    response = getattr(error, 'response', None)
+    return isinstance(error, APIError) and getattr(response, 'status_code', None) == 429
+
+
+class TokenBucket:
+    """Корзина токенов с очередью ожидающих по приоритету.
+
+    Токены пополняются со скоростью per_minute в минуту, в запасе не
+    больше burst. Ожидающие получают токены строго по (приоритет, порядок
+    прихода), поэтому фоновые задачи не обгоняют пользователей.
+    per_minute = 0 - без ограничения.
+    """
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._waiters = []  # heap: (приоритет, номер, future)
+        self._order = itertools.count()
+        self._wakeup = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """Обнуляет запас после ответа 429: следующий токен появится через seconds"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    async def acquire(self, priority=USER):
+        if not self.rate:
+            return
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._order), future)
+        heapq.heappush(self._waiters, entry)
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Токен уже выдан, но ждущий отменен - возвращаем токен
+                self.tokens += 1
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            self._schedule()
+            raise
+
+    def _schedule(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        if self._waiters:
+            delay = (1 - self.tokens) / self.rate
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._schedule)
+
+
+class SheetsScheduler:
+    """Планировщик запросов к Google Sheets.
+
+    Одинаковые одновременные чтения (тот же лист и диапазон) объединяются
+    в один запрос, результат получают все ожидающие. Чтения и записи
+    расходуют отдельные квоты (у Google - около 60 в минуту на каждое),
+    запросы пользователей обслуживаются раньше фоновых задач. На ответ 429
+    квота приостанавливается и запрос повторяется.
+    """
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+                 burst=SHEETS_BURST, max_retries=SHEETS_MAX_RETRIES):
+        self.reads = TokenBucket(reads_per_minute, burst)
+        self.writes = TokenBucket(writes_per_minute, burst)
+        self.max_retries = max_retries
+        self._in_flight = {}  # ключ чтения -> задача с запросом
+
+    async def read(self, key, call, shared=True):
+        """Чтение с объединением: call - корутинная функция запроса.
+
+        shared=False - не присоединяться к уже идущему чтению (его ответ
+        мог устареть), но последующие одинаковые чтения присоединятся к этому.
+        """
+        task = self._in_flight.get(key) if shared else None
+        if task is not None:
+            COALESCED_READS.inc(sheet=key[0])
+        else:
+            task = asyncio.create_task(self._call(self.reads, call))
+            self._in_flight[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Ошибку получат ожидающие; если их не осталось, не пишем "exception was never retrieved"
+            task.exception()
+
+    async def write(self, call):
+        return await self._call(self.writes, call)
+
+    async def _call(self, bucket, call):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            await bucket.acquire(_priority.get())
+            THROTTLE_SECONDS.observe(time.perf_counter() - started)
+            try:
+                return await call()
+            except APIError as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt * 5
+                RATE_LIMITED.inc()
+                logger.warning(f"Google Sheets вернул 429, повтор через {delay} с")
+                if bucket.rate:
+                    bucket.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from app.appointments import APPOINTMENT_COLUMNS, generate_appointment_id
+from app.backend import StorageBackend, SheetsBackend
+from app.registry import CLIENT_COLUMNS
+from app.sheets_scheduler import background_job
+from config.settings import SQLITE_PATH, SHEETS_MIRROR, SHEETS_MIRROR_INTERVAL, EXPORT_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    user_id TEXT PRIMARY KEY,
+    client_name TEXT, phone TEXT, username TEXT,
+    first_name TEXT, last_name TEXT, registered_at TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    synced_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS services (
+    name TEXT PRIMARY KEY,
+    price TEXT, duration TEXT
+);
+CREATE TABLE IF NOT EXISTS appointments (
+    appointment_id TEXT PRIMARY KEY,
+    user_id TEXT, client_name TEXT, phone TEXT, service TEXT,
+    date TEXT, time TEXT, status TEXT, created_at TEXT, notes TEXT,
+    master TEXT, duration TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    synced_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_user_id ON appointments (user_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments (date);
+CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments (status);
+CREATE TABLE IF NOT EXISTS appointments_archive (
+    appointment_id TEXT PRIMARY KEY,
+    user_id TEXT, client_name TEXT, phone TEXT, service TEXT,
+    date TEXT, time TEXT, status TEXT, created_at TEXT, notes TEXT,
+    master TEXT, duration TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_archive_date ON appointments_archive (date);
+"""
+
+# Столбцы, добавленные после первой версии схемы: (таблица, столбец)
+MIGRATIONS = [
+    ('services', 'duration'),
+    ('appointments', 'master'),
+    ('appointments', 'duration'),
+    ('appointments_archive', 'master'),
+    ('appointments_archive', 'duration'),
+]
+
+
+def migrate(conn):
+    """Добавляет в существующую базу недостающие столбцы"""
+    for table, column in MIGRATIONS:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+            logger.info(f"База обновлена: столбец {table}.{column}")
+
+
+class SQLiteBackend(StorageBackend):
+    """Локальное хранилище в SQLite с индексами по user_id, date и status.
+
+    Все обращения к базе идут через один рабочий поток, поэтому
+    соединение используется последовательно и не блокирует цикл событий.
+    При SHEETS_MIRROR данные в фоне зеркалируются в Google Sheets.
+    """
+
+    def __init__(self, path=SQLITE_PATH, mirror=SHEETS_MIRROR):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn = None
+        self.mirror = SheetsMirror(self) if mirror else None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            migrate(conn)
+        return conn
+
+    def _query(self, sql, params=()):
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def _execute(self, sql, params=()):
+        with self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    def _executemany(self, sql, rows):
+        with self._conn:
+            return self._conn.executemany(sql, rows).rowcount
+
+    async def start(self):
+        self._conn = await self._run(self._connect)
+        if self.mirror:
+            await self.mirror.start()
+
+    async def close(self):
+        if self.mirror:
+            await self.mirror.stop()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+    async def get_client(self, user_id):
+        rows = await self._run(self._query, "SELECT * FROM clients WHERE user_id = ?", (str(user_id),))
+        return rows[0] if rows else None
+
+    async def add_client(self, record):
+        values = [str(record.get(column, '')) for column in CLIENT_COLUMNS]
+        await self._run(
+            self._execute,
+            f"INSERT OR REPLACE INTO clients ({', '.join(CLIENT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(CLIENT_COLUMNS))})",
+            values,
+        )
+
+    async def add_clients(self, records):
+        await self._run(
+            self._executemany,
+            f"INSERT OR IGNORE INTO clients ({', '.join(CLIENT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(CLIENT_COLUMNS))})",
+            [[str(record.get(column, '')) for column in CLIENT_COLUMNS] for record in records],
+        )
+
+    async def _iter_table(self, table, columns, chunk_size):
+        """Строки таблицы порциями по rowid (без долгоживущего курсора в рабочем потоке)"""
+        last_rowid = 0
+        while True:
+            rows = await self._run(
+                self._query,
+                f"SELECT rowid AS _rowid, {', '.join(columns)} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, chunk_size),
+            )
+            if not rows:
+                return
+            last_rowid = rows[-1]['_rowid']
+            for row in rows:
+                del row['_rowid']
+            yield rows
+            if len(rows) < chunk_size:
+                return
+
+    async def iter_clients(self, chunk_size=EXPORT_CHUNK_SIZE):
+        async for chunk in self._iter_table("clients", CLIENT_COLUMNS, chunk_size):
+            yield chunk
+
+    async def iter_appointments(self, chunk_size=EXPORT_CHUNK_SIZE, archive=False):
+        tables = ("appointments_archive", "appointments") if archive else ("appointments",)
+        for table in tables:
+            async for chunk in self._iter_table(table, APPOINTMENT_COLUMNS, chunk_size):
+                yield chunk
+
+    async def list_services(self):
+        return await self._run(self._query, "SELECT name, price, duration FROM services ORDER BY rowid")
+
+    async def replace_services(self, services):
+        """Заменяет список услуг (услуги ведутся в таблице и подтягиваются зеркалом)"""
+        def replace():
+            with self._conn:
+                self._conn.execute("DELETE FROM services")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO services (name, price, duration) VALUES (?, ?, ?)",
+                    [(str(s.get('name', '')), str(s.get('price', '')), str(s.get('duration', ''))) for s in services],
+                )
+        await self._run(replace)
+
+    async def add_appointment(self, record):
+        appointment_id = str(record.get('appointment_id') or generate_appointment_id())
+        record = dict(record, appointment_id=appointment_id)
+        values = [str(record.get(column, '')) for column in APPOINTMENT_COLUMNS]
+        await self._run(
+            self._execute,
+            f"INSERT INTO appointments ({', '.join(APPOINTMENT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(APPOINTMENT_COLUMNS))})",
+            values,
+        )
+        return appointment_id
+
+    async def get_appointment(self, appointment_id):
+        rows = await self._run(
+            self._query, "SELECT * FROM appointments WHERE appointment_id = ?", (str(appointment_id),)
+        )
+        return rows[0] if rows else None
+
+    async def set_appointment_status(self, appointment_id, status):
+        updated = await self._run(
+            self._execute,
+            "UPDATE appointments SET status = ?, version = version + 1 WHERE appointment_id = ?",
+            (status, str(appointment_id)),
+        )
+        return await self.get_appointment(appointment_id) if updated else None
+
+    async def list_appointments(self, user_id=None, date=None, status=None, date_from=None):
+        conditions, params = [], []
+        for column, operator, value in (
+            ('user_id', '=', user_id), ('date', '=', date), ('status', '=', status), ('date', '>=', date_from)
+        ):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(str(value))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return await self._run(self._query, f"SELECT * FROM appointments {where} ORDER BY date, time", params)
+
+    async def archive_appointments(self, before_date):
+        if self.mirror:
+            # В архив уходят только строки, уже выгруженные в таблицу
+            await self.mirror.push()
+        columns = ', '.join(APPOINTMENT_COLUMNS)
+        condition = "(status = 'cancelled' OR date < ?) AND version <= synced_version" if self.mirror \
+            else "(status = 'cancelled' OR date < ?)"
+
+        def archive():
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO appointments_archive ({columns}) "
+                    f"SELECT {columns} FROM appointments WHERE {condition}",
+                    (before_date,),
+                )
+                return self._conn.execute(f"DELETE FROM appointments WHERE {condition}", (before_date,)).rowcount
+        archived = await self._run(archive)
+        if self.mirror:
+            await self.mirror.sheets.archive_appointments(before_date)
+        logger.info(f"В архив перенесено записей: {archived}")
+        return archived
+
+    async def archived_appointments(self, month):
+        return await self._run(
+            self._query,
+            "SELECT * FROM appointments_archive WHERE date LIKE ? ORDER BY date, time",
+            (f"{month}-%",),
+        )
+
+    async def archive_months(self):
+        rows = await self._run(
+            self._query, "SELECT DISTINCT substr(date, 1, 7) AS month FROM appointments_archive ORDER BY month"
+        )
+        return [row['month'] for row in rows]
+
+    # Методы для зеркалирования
+    async def unsynced(self, table):
+        """Строки, изменившиеся после последней выгрузки в таблицу"""
+        return await self._run(self._query, f"SELECT * FROM {table} WHERE version > synced_version")
+
+    async def mark_synced(self, table, key_column, rows):
+        def mark():
+            with self._conn:
+                self._conn.executemany(
+                    f"UPDATE {table} SET synced_version = ? WHERE {key_column} = ?",
+                    [(row['version'], row[key_column]) for row in rows],
+                )
+        await self._run(mark)
+
+    async def is_empty(self):
+        rows = await self._run(
+            self._query, "SELECT (SELECT COUNT(*) FROM clients) + (SELECT COUNT(*) FROM appointments) AS total"
+        )
+        return rows[0]['total'] == 0
+
+    async def import_rows(self, clients, appointments):
+        """Первичная загрузка данных из таблицы (строки помечаются как уже выгруженные)"""
+        def load():
+            with self._conn:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO clients ({', '.join(CLIENT_COLUMNS)}, synced_version) "
+                    f"VALUES ({', '.join('?' * len(CLIENT_COLUMNS))}, 1)",
+                    [[str(c.get(column, '')) for column in CLIENT_COLUMNS] for c in clients if c.get('user_id')],
+                )
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO appointments ({', '.join(APPOINTMENT_COLUMNS)}, synced_version) "
+                    f"VALUES ({', '.join('?' * len(APPOINTMENT_COLUMNS))}, 1)",
+                    [[str(a.get(column, '')) for column in APPOINTMENT_COLUMNS] for a in appointments],
+                )
+        await self._run(load)
+
+
+def is_written(future):
+    """Отправка через очередь записи завершилась успешно (None - отправлять было нечего)"""
+    return future is None or (future.done() and not future.cancelled() and future.exception() is None)
+
+
+class SheetsMirror:
+    """Фоновое зеркалирование SQLite в Google Sheets.
+
+    Новые клиенты и записи дописываются в листы, смена статуса переносится
+    в ячейку; список услуг, который мастер правит в таблице, подтягивается
+    обратно. При пустой базе данные один раз загружаются из таблицы.
+    """
+
+    def __init__(self, db, sheets=None, interval=SHEETS_MIRROR_INTERVAL):
+        self.db = db
+        # Источник данных - база, поэтому сверка листа записей не нужна
+        self.sheets = sheets or SheetsBackend(sync_interval=0)
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        await self.sheets.start()
+        try:
+            if await self.db.is_empty():
+                await self.import_from_sheets()
+            await self.pull_services()
+        except Exception as e:
+            logging.error(f"Ошибка при начальной синхронизации с таблицей: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.push()
+        except Exception as e:
+            logging.error(f"Ошибка при выгрузке в таблицу: {e}")
+        await self.sheets.close()
+
+    @background_job
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.push()
+                await self.pull_services()
+            except Exception as e:
+                logging.error(f"Ошибка при зеркалировании в таблицу: {e}")
+
+    async def import_from_sheets(self):
+        clients = await self.sheets.sheets.get_all_records("clients")
+        appointments = await self.sheets.appointments.records()
+        await self.db.import_rows(clients, appointments)
+        logger.info(f"Из таблицы загружено {len(clients)} клиентов и {len(appointments)} записей")
+
+    async def pull_services(self):
+        await self.db.replace_services(await self.sheets.list_services())
+
+    async def push(self):
+        """Выгружает изменения в таблицу; отмечаются выгруженными только записанные строки"""
+        clients = await self.db.unsynced("clients")
+        new_clients = [client for client in clients if await self.sheets.get_client(client['user_id']) is None]
+        if len(new_clients) > 1:
+            # После загрузки из файла клиентов много: пачками вместо строки на клиента
+            await self.sheets.add_clients(new_clients)
+        elif new_clients:
+            await self.sheets.add_client(new_clients[0])
+        # Клиент мог остаться в очереди записи с прошлой выгрузки
+        writes = {client['user_id']: self.sheets.pending_client_write(client['user_id']) for client in clients}
+        appointments = await self.db.unsynced("appointments")
+        for appt in appointments:
+            existing = await self.sheets.get_appointment(appt['appointment_id'])
+            if existing is None:
+                await self.sheets.add_appointment(
+                    {column: appt[column] for column in APPOINTMENT_COLUMNS}
+                )
+            elif existing.get('status') != appt['status']:
+                await self.sheets.set_appointment_status(appt['appointment_id'], appt['status'])
+            writes[appt['appointment_id']] = self.sheets.appointments.pending_write(appt['appointment_id'])
+        # Строки уходят в таблицу пачкой через очередь отложенной записи
+        await self.sheets.writes.flush()
+        clients = [client for client in clients if is_written(writes.get(client['user_id']))]
+        appointments = [appt for appt in appointments if is_written(writes.get(appt['appointment_id']))]
+        await self.db.mark_synced("clients", "user_id", clients)
+        await self.db.mark_synced("appointments", "appointment_id", appointments)
+        if clients or appointments:
+            logger.info(f"В таблицу выгружено: клиентов {len(clients)}, записей {len(appointments)}")
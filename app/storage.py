@@ -0,0 +1,204 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import ValueInputOption, a1_range_to_grid_range, fill_gaps, numericise_all, rowcol_to_a1
+
+from app.metrics import SheetsTimer
+from app.sheets import sheets_manager
+from app.sheets_scheduler import SheetsScheduler
+from config.settings import SHEETS_POOL_SIZE, SHEETS_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def to_records(header, rows):
+    """Превращает строки листа в словари по заголовку (как get_all_records)"""
+    if not rows:
+        return []
+    rows = fill_gaps(rows, cols=len(header))
+    return [dict(zip(header, numericise_all(row))) for row in rows]
+
+
+def first_appended_row(response):
+    """Номер первой строки, добавленной append_rows (по updatedRange из ответа API)"""
+    updated_range = response["updates"]["updatedRange"].split("!")[-1]
+    return a1_range_to_grid_range(updated_range)["startRowIndex"] + 1
+
+
+class SheetsStorage:
+    """Асинхронный доступ к Google Sheets.
+
+    Синхронные вызовы gspread выполняются в ограниченном пуле потоков,
+    поэтому медленный ответ Google не блокирует цикл событий бота.
+    Все запросы проходят через SheetsScheduler: квота, приоритеты и
+    объединение одинаковых чтений.
+    """
+
+    def __init__(self, manager=sheets_manager, pool_size=SHEETS_POOL_SIZE, timeout=SHEETS_TIMEOUT, scheduler=None):
+        self.manager = manager
+        self.timeout = timeout
+        self.scheduler = scheduler or SheetsScheduler()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="sheets")
+        self._headers = {}
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, call), self.timeout)
+
+    async def _request(self, sheet_name, method, func):
+        """Запрос к листу с замером времени (метрики по листу и методу)"""
+        with SheetsTimer(sheet_name, method):
+            return await self._run(func)
+
+    async def _read(self, sheet_name, method, func, range_name=None, shared=True):
+        """Чтение: одновременные чтения того же диапазона получают один ответ"""
+        return await self.scheduler.read(
+            (sheet_name, method, range_name), lambda: self._request(sheet_name, method, func), shared
+        )
+
+    async def _write(self, sheet_name, method, func):
+        return await self.scheduler.write(lambda: self._request(sheet_name, method, func))
+
+    def _worksheet(self, sheet_name):
+        return self.manager.worksheet(sheet_name)
+
+    async def get_all_records(self, sheet_name, shared=True):
+        """Все строки листа в виде словарей (shared=False - не присоединяться к уже идущему чтению)"""
+        # Читаем весь лист без опоры на row_count: у закэшированного листа он устаревает
+        values = await self._read(
+            sheet_name, "get_values", lambda: self._worksheet(sheet_name).get_values(), shared=shared
+        )
+        if not values:
+            return []
+        self._headers[sheet_name] = values[0]
+        return to_records(values[0], values[1:])
+
+    async def get_header(self, sheet_name):
+        """Заголовок листа (первая строка), кэшируется"""
+        if sheet_name not in self._headers:
+            values = await self._read(
+                sheet_name, "get_values", lambda: self._worksheet(sheet_name).get_values("1:1"), "1:1"
+            )
+            self._headers[sheet_name] = values[0] if values else []
+        return self._headers[sheet_name]
+
+    def cached_header(self, sheet_name):
+        """Заголовок листа, если он уже известен (без запроса к Google)"""
+        return self._headers.get(sheet_name)
+
+    async def get_records_from(self, sheet_name, first_row):
+        """Строки листа начиная с first_row (нумерация строк как в таблице)"""
+        header = await self.get_header(sheet_name)
+        if not header:
+            return []
+        range_name = f"A{first_row}:{rowcol_to_a1(1, len(header))[:-1]}"
+        values = await self._read(
+            sheet_name, "get_values", lambda: self._worksheet(sheet_name).get_values(range_name), range_name
+        )
+        return to_records(header, values)
+
+    async def column_values(self, sheet_name, col):
+        """Значения одного столбца листа по порядку строк (первый элемент - строка 1)"""
+        letter = rowcol_to_a1(1, col)[:-1]
+        range_name = f"{letter}:{letter}"
+        values = await self._read(
+            sheet_name, "get_values", lambda: self._worksheet(sheet_name).get_values(range_name),
+            range_name, shared=False
+        )
+        return [str(row[0]) if row else '' for row in values]
+
+    async def iter_records(self, sheet_name, chunk_size):
+        """Строки листа порциями по chunk_size: одно чтение диапазона на порцию"""
+        header = await self.get_header(sheet_name)
+        if not header:
+            return
+        last_column = rowcol_to_a1(1, len(header))[:-1]
+        first_row = 2
+        while True:
+            range_name = f"A{first_row}:{last_column}{first_row + chunk_size - 1}"
+            values = await self._read(
+                sheet_name, "get_values",
+                lambda: self._worksheet(sheet_name).get_values(range_name), range_name
+            )
+            if values:
+                yield to_records(header, values)
+            if len(values) < chunk_size:
+                return
+            first_row += chunk_size
+
+    async def append_row(self, sheet_name, row):
+        """Добавляет строку в конец листа"""
+        return await self._write(sheet_name, "append_row", lambda: self._worksheet(sheet_name).append_row(row))
+
+    async def append_rows(self, sheet_name, rows):
+        """Добавляет несколько строк одним запросом"""
+        return await self._write(sheet_name, "append_rows", lambda: self._worksheet(sheet_name).append_rows(rows))
+
+    async def update_cell(self, sheet_name, row, col, value):
+        """Обновляет одну ячейку листа"""
+        return await self._write(
+            sheet_name, "update_cell", lambda: self._worksheet(sheet_name).update_cell(row, col, value)
+        )
+
+    async def batch_update(self, sheet_name, data):
+        """Обновляет несколько диапазонов листа одним запросом"""
+        return await self._write(
+            sheet_name, "batch_update",
+            lambda: self._worksheet(sheet_name).batch_update(data, value_input_option=ValueInputOption.user_entered)
+        )
+
+    async def modified_time(self):
+        """Время последнего изменения таблицы (Drive API, квота Sheets не расходуется)"""
+        return await self._request(
+            "spreadsheet", "modified_time", lambda: self.manager.spreadsheet.get_lastUpdateTime()
+        )
+
+    async def worksheet_names(self):
+        return await self._read(
+            "spreadsheet", "worksheets", lambda: [ws.title for ws in self.manager.spreadsheet.worksheets()]
+        )
+
+    async def ensure_worksheet(self, sheet_name, header):
+        """Создает лист с заголовком, если его еще нет"""
+        def ensure():
+            try:
+                return self.manager.worksheet(sheet_name)
+            except WorksheetNotFound:
+                worksheet = self.manager.spreadsheet.add_worksheet(sheet_name, rows=1, cols=len(header))
+                worksheet.append_row(header)
+                return worksheet
+        await self._write(sheet_name, "ensure_worksheet", ensure)
+        self._headers.setdefault(sheet_name, list(header))
+
+    async def delete_rows(self, sheet_name, rows):
+        """Удаляет строки листа одним запросом (номера строк как в таблице)"""
+        if not rows:
+            return
+        # Соседние строки объединяем в диапазоны и удаляем снизу вверх, чтобы номера не сдвигались
+        ranges = []
+        for row in sorted(set(rows), reverse=True):
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
+            else:
+                ranges.append([row, row])
+
+        def delete():
+            worksheet = self._worksheet(sheet_name)
+            requests = [
+                {'deleteDimension': {'range': {
+                    'sheetId': worksheet.id, 'dimension': 'ROWS',
+                    'startIndex': start - 1, 'endIndex': end,
+                }}}
+                for start, end in ranges
+            ]
+            return worksheet.spreadsheet.batch_update({'requests': requests})
+        return await self._write(sheet_name, "delete_rows", delete)
+
+    def close(self):
+        """Дожидается завершения запросов и освобождает пул и HTTP-сессию"""
+        self._executor.shutdown(wait=True)
+        self.manager.close()
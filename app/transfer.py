@@ -0,0 +1,182 @@
+"""Выгрузка клиентов и записей в CSV/JSONL и загрузка клиентов из файла.
+
+Данные читаются и пишутся порциями: выгрузка не собирает весь список в
+памяти, загрузка отправляет клиентов пачками по IMPORT_BATCH_SIZE строк
+на запрос вместо строки на клиента.
+
+    python -m app.transfer export appointments --format csv --output appointments.csv --archive
+    python -m app.transfer export clients --format jsonl --output clients.jsonl
+    python -m app.transfer import-clients clients.csv
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+from datetime import datetime
+
+from app.appointments import APPOINTMENT_COLUMNS
+from app.backend import create_storage
+from app.registry import CLIENT_COLUMNS
+from config.settings import EXPORT_CHUNK_SIZE, IMPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = {'appointments': APPOINTMENT_COLUMNS, 'clients': CLIENT_COLUMNS}
+
+
+def normalize_phone(phone):
+    """Телефон для сравнения: только цифры, 8XXXXXXXXXX приводится к 7XXXXXXXXXX"""
+    digits = ''.join(ch for ch in str(phone or '') if ch.isdigit())
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    return digits
+
+
+def format_of(filename, default='csv'):
+    """Формат файла по расширению"""
+    extension = str(filename).rsplit('.', 1)[-1].lower()
+    return extension if extension in FORMATS else default
+
+
+async def export_records(storage, kind, fmt, stream, archive=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Пишет клиентов или записи в текстовый поток порциями; возвращает число строк"""
+    columns = EXPORT_COLUMNS[kind]
+    if kind == 'clients':
+        chunks = storage.iter_clients(chunk_size)
+    else:
+        chunks = storage.iter_appointments(chunk_size, archive=archive)
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, columns, restval='', extrasaction='ignore')
+        writer.writeheader()
+    count = 0
+    async for chunk in chunks:
+        for record in chunk:
+            if writer is not None:
+                writer.writerow(record)
+            else:
+                stream.write(json.dumps({column: record.get(column, '') for column in columns}, ensure_ascii=False))
+                stream.write("\n")
+        count += len(chunk)
+    logger.info(f"Выгружено ({kind}, {fmt}): {count}")
+    return count
+
+
+async def export_file(storage, kind, fmt, path, archive=False):
+    with open(path, 'w', encoding='utf-8', newline='') as stream:
+        return await export_records(storage, kind, fmt, stream, archive=archive)
+
+
+def read_records(stream, fmt, chunk_size):
+    """Строки файла (CSV с заголовком или JSONL) порциями по chunk_size"""
+    if fmt == 'csv':
+        rows = csv.DictReader(stream)
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ImportReport:
+    """Итоги загрузки клиентов"""
+
+    def __init__(self):
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.batches = 0
+
+    def __str__(self):
+        return (
+            f"добавлено {self.imported}, уже были {self.duplicates}, без user_id {self.invalid}, "
+            f"пачек записи {self.batches}"
+        )
+
+
+async def import_clients(storage, stream, fmt='csv', batch_size=IMPORT_BATCH_SIZE):
+    """Добавляет клиентов из файла пачками; известные user_id и телефоны пропускаются"""
+    report = ImportReport()
+    user_ids, phones = set(), set()
+    async for chunk in storage.iter_clients():
+        for client in chunk:
+            user_ids.add(str(client.get('user_id', '')))
+            phones.add(normalize_phone(client.get('phone', '')))
+    phones.discard('')
+
+    registered_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    batch = []
+    for chunk in read_records(stream, fmt, batch_size):
+        for row in chunk:
+            record = {column: str(row.get(column) or '').strip() for column in CLIENT_COLUMNS}
+            phone = normalize_phone(record['phone'])
+            if not record['user_id']:
+                report.invalid += 1
+                continue
+            # Повторы внутри файла отсекаются так же, как уже известные клиенты
+            if record['user_id'] in user_ids or (phone and phone in phones):
+                report.duplicates += 1
+                continue
+            user_ids.add(record['user_id'])
+            if phone:
+                phones.add(phone)
+            record['registered_at'] = record['registered_at'] or registered_at
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await storage.add_clients(batch)
+                report.imported += len(batch)
+                report.batches += 1
+                batch = []
+    if batch:
+        await storage.add_clients(batch)
+        report.imported += len(batch)
+        report.batches += 1
+    logger.info(f"Загрузка клиентов: {report}")
+    return report
+
+
+async def run(args):
+    storage = create_storage()
+    await storage.start()
+    try:
+        if args.command == 'export':
+            fmt = args.format or format_of(args.output)
+            if args.output == '-':
+                count = await export_records(storage, args.kind, fmt, sys.stdout, archive=args.archive)
+            else:
+                count = await export_file(storage, args.kind, fmt, args.output, archive=args.archive)
+            print(f"Выгружено: {count}", file=sys.stderr)
+        else:
+            with open(args.path, encoding='utf-8-sig', newline='') as stream:
+                report = await import_clients(storage, stream, args.format or format_of(args.path))
+            print(f"Клиенты: {report}", file=sys.stderr)
+    finally:
+        # Хранилище дописывает очередь и останавливает фоновые задачи
+        await storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="выгрузить клиентов или записи")
+    export.add_argument('kind', choices=sorted(EXPORT_COLUMNS))
+    export.add_argument('--format', choices=FORMATS, help="по умолчанию - по расширению файла")
+    export.add_argument('--output', default='-', help="файл (по умолчанию - stdout)")
+    export.add_argument('--archive', action='store_true', help="вместе с архивом записей")
+    load = commands.add_parser('import-clients', help="загрузить клиентов из CSV/JSONL")
+    load.add_argument('path')
+    load.add_argument('--format', choices=FORMATS, help="по умолчанию - по расширению файла")
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
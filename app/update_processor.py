@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from app.metrics import metrics
+from config.settings import UPDATE_CONCURRENCY, UPDATE_QUEUE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+UPDATES_SHED = metrics.counter("bot_updates_shed_total", "Обновления, отклоненные из-за перегрузки")
+
+OVERLOAD_TEXT = "⏳ Сейчас очень много запросов. Пожалуйста, повторите через минуту."
+
+
+def update_user_id(update):
+    """Чей это апдейт: пользователь, иначе чат (None для служебных обновлений)"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с порядком внутри одного пользователя.
+
+    Обновления разных пользователей обрабатываются одновременно (не больше
+    concurrency обработчиков), обновления одного пользователя - строго
+    по очереди, поэтому состояние ConversationHandler не ломается.
+    Если принятых, но не обработанных обновлений больше queue_limit,
+    новые не ставятся в очередь: пользователь получает просьбу повторить.
+    """
+
+    def __init__(self, concurrency=UPDATE_CONCURRENCY, queue_limit=UPDATE_QUEUE_LIMIT):
+        # Семафор базового класса захватывается до do_process_update; берем его с запасом,
+        # чтобы лишние обновления доходили до проверки очереди и отклонялись, а не ждали
+        super().__init__(queue_limit + concurrency)
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.in_flight = 0
+        self.shed = 0
+        self._handlers = asyncio.BoundedSemaphore(concurrency)
+        self._user_locks = {}  # user_id -> [lock, число обновлений пользователя в работе]
+        self._replies = set()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._replies:
+            await asyncio.gather(*self._replies, return_exceptions=True)
+
+    async def do_process_update(self, update, coroutine):
+        if self.pending >= self.queue_limit:
+            self._reject(update, coroutine)
+            return
+        user_id = update_user_id(update)
+        self.pending += 1
+        try:
+            if user_id is None:
+                await self._run(coroutine)
+                return
+            entry = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                # asyncio.Lock пропускает ожидающих по порядку, а задачи создаются в порядке обновлений
+                async with entry[0]:
+                    await self._run(coroutine)
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._user_locks[user_id]
+        finally:
+            self.pending -= 1
+
+    async def _run(self, coroutine):
+        async with self._handlers:
+            self.in_flight += 1
+            try:
+                await coroutine
+            finally:
+                self.in_flight -= 1
+
+    def _reject(self, update, coroutine):
+        # Обработчик не запускаем; coroutine закрываем, чтобы не было предупреждения
+        coroutine.close()
+        self.shed += 1
+        UPDATES_SHED.inc()
+        if self.shed % 100 == 1:
+            logger.warning(f"Очередь обновлений переполнена ({self.pending}), отклонено всего: {self.shed}")
+        if isinstance(update, Update):
+            reply = asyncio.create_task(self._send_overload_reply(update))
+            self._replies.add(reply)
+            reply.add_done_callback(self._replies.discard)
+
+    async def _send_overload_reply(self, update):
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(OVERLOAD_TEXT, show_alert=True)
+            elif update.effective_message:
+                await update.effective_message.reply_text(OVERLOAD_TEXT)
+        except Exception as e:
+            logging.error(f"Ошибка при отправке ответа о перегрузке: {e}")
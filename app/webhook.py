@@ -0,0 +1,117 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import time
+
+from telegram import Update
+
+from app.http_server import HttpServer
+from app.metrics import metrics
+from config.settings import (
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_SECRET, WEBHOOK_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer(HttpServer):
+    """HTTP-сервер для приема обновлений Telegram.
+
+    POST /{path} проверяет секретный токен и ставит обновление в очередь
+    приложения, не дожидаясь обработки; GET /health отдает состояние,
+    GET /metrics - метрики в формате Prometheus.
+    При остановке новые обновления отклоняются с 503 (Telegram повторит
+    их позже), а уже принятые дообрабатываются.
+    """
+
+    def __init__(self, application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 secret_token=WEBHOOK_SECRET, drain_timeout=WEBHOOK_DRAIN_TIMEOUT):
+        super().__init__(listen, port, drain_timeout)
+        self.application = application
+        self.path = f"/{path.strip('/')}"
+        if not secret_token:
+            raise ValueError("Вебхук без секретного токена не запускается")
+        self.secret_token = secret_token
+        self.received = 0
+        self.draining = False
+        self._started_at = time.monotonic()
+
+    async def start(self):
+        await super().start()
+        logger.info(f"Вебхук слушает {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Перестает принимать обновления и дожидается текущих запросов"""
+        self.draining = True
+        await super().stop()
+
+    async def dispatch(self, method, path, headers, body):
+        """Обрабатывает запрос; возвращает (код ответа, тело)"""
+        if path == '/health':
+            if method != 'GET':
+                return 405, {}
+            return (503 if self.draining else 200), {
+                'status': 'draining' if self.draining else 'ok',
+                'received': self.received,
+                'queued': self.application.update_queue.qsize(),
+                'uptime': round(time.monotonic() - self._started_at),
+            }
+        if path == '/metrics':
+            return (200, metrics.render()) if method == 'GET' else (405, {})
+        if path != self.path:
+            return 404, {}
+        if method != 'POST':
+            return 405, {}
+        if not hmac.compare_digest(
+            headers.get('x-telegram-bot-api-secret-token', ''), self.secret_token
+        ):
+            return 403, {}
+        if self.draining:
+            return 503, {}
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logging.error(f"Ошибка при разборе обновления: {e}")
+            return 400, {}
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return 200, {}
+
+
+async def serve_webhook(application, url=WEBHOOK_URL, server=None):
+    """Запускает приложение в режиме вебхука до SIGTERM/SIGINT"""
+    server = server or WebhookServer(application)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # post_init/post_shutdown вызываются только в run_polling/run_webhook, поэтому здесь - явно
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await server.start()
+        if url:
+            await application.bot.set_webhook(
+                url=f"{url.rstrip('/')}{server.path}",
+                secret_token=server.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        else:
+            logger.info("WEBHOOK_URL не задан: вебхук в Telegram не регистрируется")
+        await stop_event.wait()
+        logger.info("Получен сигнал остановки, дообрабатываем принятые обновления")
+    finally:
+        await server.stop()
+        # Application.stop дожидается обработки обновлений, уже стоящих в очереди
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
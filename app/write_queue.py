@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, nullcontext
+
+from gspread.utils import rowcol_to_a1
+
+from app.storage import first_appended_row
+from config.settings import WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL, WRITE_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+
+def fail_futures(futures, error):
+    """Завершает ожидающие future ошибкой"""
+    for future in futures:
+        if not future.done():
+            future.set_exception(error)
+            # Ошибка уже записана в лог: не дублируем ее предупреждением "exception was never retrieved"
+            future.exception()
+
+
+class WriteBehindQueue:
+    """Очередь отложенной записи в Google Sheets.
+
+    Добавления строк и изменения ячеек копятся в памяти и отправляются
+    одним append_rows и одним batch_update на лист: по таймеру, при
+    накоплении WRITE_BATCH_SIZE операций и при остановке бота.
+
+    Неудачная отправка повторяется при следующем сбросе, после
+    max_attempts неудач подряд future получают ошибку. Если append_rows
+    не дождался ответа (таймаут), строки могли записаться: перед повтором
+    столбец-ключ листа перечитывается и найденные строки не дублируются.
+    """
+
+    def __init__(self, storage, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL,
+                 max_attempts=WRITE_MAX_ATTEMPTS):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._appends = {}  # лист -> [(строка, future, столбец-ключ)]
+        self._updates = {}  # лист -> {(row, col): (значение, [future])}
+        self._failures = {}  # ('append' | 'update', лист) -> неудачных отправок подряд
+        self._unconfirmed = set()  # листы, где append_rows закончился таймаутом
+        self._resolvers = {}  # лист -> функция ключ строки -> номер строки
+        self._flush_lock = asyncio.Lock()
+        self.flush_guard = None  # фабрика async-контекста вокруг отправки (SheetsReconciler отмечает свои правки)
+        self._timer = None
+        self._flush_task = None
+        self.last_flush_latency = None
+        self.flushed_requests = 0
+
+    @property
+    def pending(self):
+        """Количество операций, ожидающих отправки"""
+        return (sum(len(rows) for rows in self._appends.values())
+                + sum(len(cells) for cells in self._updates.values()))
+
+    def append_row(self, sheet_name, row, key_column=None):
+        """Ставит строку в очередь; future вернет номер строки в листе после отправки.
+
+        key_column - номер столбца с уникальным значением (ID записи, user_id):
+        по нему строка находится в листе, если ответ на запись не пришел.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._appends.setdefault(sheet_name, []).append((row, future, key_column))
+        self._flush_if_full()
+        return future
+
+    def resolve_rows(self, sheet_name, resolver):
+        """Номера строк листа определяются при отправке: update_cell получает
+        вместо номера ключ (например, ID записи), resolver(ключ) возвращает
+        номер строки на момент отправки или None, если строки уже нет"""
+        self._resolvers[sheet_name] = resolver
+
+    def update_cell(self, sheet_name, row, col, value):
+        """Ставит изменение ячейки в очередь; повторные изменения ячейки схлопываются.
+
+        row - номер строки или ключ строки для листа с resolve_rows.
+        """
+        future = asyncio.get_running_loop().create_future()
+        cells = self._updates.setdefault(sheet_name, {})
+        _, futures = cells.get((row, col), (None, []))
+        cells[(row, col)] = (value, futures + [future])
+        self._flush_if_full()
+        return future
+
+    def _flush_if_full(self):
+        if self.pending >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def start(self):
+        """Запускает периодическую отправку"""
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._run_timer())
+
+    async def _run_timer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self):
+        """Останавливает таймер и отправляет все накопленное"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        if self.pending:
+            logger.error(f"При остановке не удалось записать {self.pending} операций")
+            error = RuntimeError("очередь записи остановлена")
+            for items in self._appends.values():
+                fail_futures([future for _, future, _ in items], error)
+            for cells in self._updates.values():
+                fail_futures([future for _, futures in cells.values() for future in futures], error)
+
+    async def flush(self):
+        """Отправляет накопленные операции"""
+        async with self._flush_lock:
+            await self._flush()
+
+    @asynccontextmanager
+    async def paused(self):
+        """Отправляет накопленное и не отправляет новое до выхода из блока
+        (пока номера строк меняются, например при удалении строк архивом)"""
+        async with self._flush_lock:
+            await self._flush()
+            yield
+
+    async def _flush(self):
+        appends, self._appends = self._appends, {}
+        updates, self._updates = self._updates, {}
+        if not appends and not updates:
+            return
+        async with self.flush_guard() if self.flush_guard is not None else nullcontext():
+            await self._send(appends, updates)
+
+    async def _send(self, appends, updates):
+        started = time.monotonic()
+        requests = 0
+        # Сначала добавления: изменения могут ссылаться на только что добавленные строки
+        for sheet_name, items in appends.items():
+            try:
+                if sheet_name in self._unconfirmed:
+                    items = await self._confirm_appends(sheet_name, items)
+                    requests += 1
+                    if not items:
+                        continue
+                response = await self.storage.append_rows(sheet_name, [row for row, _, _ in items])
+                requests += 1
+            except Exception as e:
+                logger.error(f"Ошибка при пакетной записи в лист {sheet_name}: {e!r}")
+                if isinstance(e, asyncio.TimeoutError):
+                    # Запрос мог выполниться после таймаута: проверим лист перед повтором
+                    self._unconfirmed.add(sheet_name)
+                if self._failed('append', sheet_name, e, [future for _, future, _ in items]):
+                    self._requeue_appends(sheet_name, items)
+                continue
+            self._failures.pop(('append', sheet_name), None)
+            first_row = first_appended_row(response)
+            for offset, (_, future, _) in enumerate(items):
+                if not future.done():
+                    future.set_result(first_row + offset)
+
+        for sheet_name, cells in updates.items():
+            rows = self._resolve_rows(sheet_name, cells)
+            cells = {key: item for key, item in cells.items() if key[0] in rows}
+            if not cells:
+                continue
+            data = [
+                {'range': rowcol_to_a1(rows[row], col), 'values': [[value]]}
+                for (row, col), (value, _) in cells.items()
+            ]
+            try:
+                await self.storage.batch_update(sheet_name, data)
+                requests += 1
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном обновлении листа {sheet_name}: {e!r}")
+                futures = [future for _, pending in cells.values() for future in pending]
+                if self._failed('update', sheet_name, e, futures):
+                    self._requeue_updates(sheet_name, cells)
+                continue
+            self._failures.pop(('update', sheet_name), None)
+            for (row, _), (_, futures) in cells.items():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(rows[row])
+
+        self.last_flush_latency = time.monotonic() - started
+        self.flushed_requests += requests
+        operations = sum(len(items) for items in appends.values()) + sum(len(cells) for cells in updates.values())
+        logger.info(
+            f"Отложенная запись: {operations} операций за {requests} запросов, "
+            f"{self.last_flush_latency * 1000:.0f} мс"
+        )
+
+    def _resolve_rows(self, sheet_name, cells):
+        """Номера строк для изменений листа: {номер или ключ: номер}; изменения удаленных строк отбрасываются"""
+        resolver = self._resolvers.get(sheet_name)
+        rows = {}
+        for row, col in cells:
+            if isinstance(row, int):
+                rows[row] = row
+            elif resolver is not None and row not in rows:
+                rows[row] = resolver(row)
+        # Строка с этим ключом еще ждет повторной отправки: изменение подождет вместе с ней
+        waiting = self._queued_keys(sheet_name)
+        delayed = {key: item for key, item in cells.items() if rows.get(key[0]) is None and key[0] in waiting}
+        if delayed:
+            self._requeue_updates(sheet_name, delayed)
+        missing = [
+            futures for (row, _), (_, futures) in cells.items() if rows.get(row) is None and row not in waiting
+        ]
+        if missing:
+            logger.info(f"Лист {sheet_name}: {len(missing)} изменений отброшено, строк уже нет")
+            fail_futures([future for futures in missing for future in futures], LookupError("строки уже нет в листе"))
+        return {key: row for key, row in rows.items() if row is not None}
+
+    def _queued_keys(self, sheet_name):
+        """Ключи строк листа, стоящих в очереди на добавление"""
+        return {
+            str(row[key_column - 1]) for row, _, key_column in self._appends.get(sheet_name, ()) if key_column
+        }
+
+    def _failed(self, kind, sheet_name, error, futures):
+        """Считает неудачу подряд; True - повторить, False - попытки кончились, future получили ошибку"""
+        key = (kind, sheet_name)
+        self._failures[key] = self._failures.get(key, 0) + 1
+        if self._failures[key] < self.max_attempts:
+            return True
+        logger.error(f"Лист {sheet_name}: {len(futures)} операций не записаны после {self._failures[key]} попыток")
+        del self._failures[key]
+        self._unconfirmed.discard(sheet_name)
+        fail_futures(futures, error)
+        return False
+
+    async def _confirm_appends(self, sheet_name, items):
+        """Находит в листе строки, записанные несмотря на таймаут; возвращает еще не записанные"""
+        found = {}
+        for column in {key_column for _, _, key_column in items if key_column}:
+            values = await self.storage.column_values(sheet_name, column)
+            found[column] = {value: row for row, value in enumerate(values, 1) if value}
+        remaining = []
+        for item in items:
+            row, future, key_column = item
+            written = found.get(key_column, {}).get(str(row[key_column - 1])) if key_column else None
+            if written is None:
+                remaining.append(item)
+            elif not future.done():
+                future.set_result(written)
+        self._unconfirmed.discard(sheet_name)
+        if len(remaining) < len(items):
+            logger.info(f"Лист {sheet_name}: {len(items) - len(remaining)} строк записаны до таймаута, повтор не нужен")
+        return remaining
+
+    def _requeue_appends(self, sheet_name, items):
+        # Возвращаем строки в начало очереди, чтобы сохранить порядок
+        self._appends[sheet_name] = items + self._appends.get(sheet_name, [])
+
+    def _requeue_updates(self, sheet_name, cells):
+        newer = self._updates.get(sheet_name, {})
+        merged = dict(cells)
+        for key, (value, futures) in newer.items():
+            merged[key] = (value, merged.get(key, (None, []))[1] + futures)
+        self._updates[sheet_name] = merged
@@ -0,0 +1,136 @@
+"""Бенчмарк расчета свободного времени за период.
+
+Сравнивает цикл по дням (индекс AvailabilityIndex и простой перебор
+записей дня, как при поиске времени для одной даты) с матрицей
+занятости OccupancyMatrix: свободные начала по дням, первое свободное
+время и свободные окна для услуги заданной длительности.
+
+    python -m bench.availability_bench --days 90 --masters 5 --rows 20000
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+for name, value in {'BOT_TOKEN': '0:bench', 'SPREADSHEET_ID': 'bench'}.items():
+    os.environ.setdefault(name, value)
+
+from app.availability import AvailabilityIndex, Master, appointment_duration, format_minutes, to_minutes  # noqa: E402
+from app.occupancy import OccupancyMatrix  # noqa: E402
+
+DURATIONS = (30, 60, 90, 120, 180)
+
+
+def generate(days, masters, rows, seed, step):
+    """Записи без пересечений у одного мастера: попытки, которые не помещаются, пропускаются"""
+    rng = random.Random(seed)
+    today = datetime.now()
+    index = AvailabilityIndex(None, masters=masters, step=step)
+    index.rebuild([])
+    appointments = []
+    for i in range(rows):
+        master = rng.choice(masters)
+        duration = rng.choice(DURATIONS)
+        appt = {
+            'appointment_id': f"b{i}", 'status': 'confirmed', 'master': master.name,
+            'date': (today + timedelta(days=rng.randrange(days))).strftime("%Y-%m-%d"),
+            'time': format_minutes(rng.randrange(master.start, master.end - duration + 1, step)),
+            'duration': duration,
+        }
+        if index.is_free(appt['date'], appt['time'], duration, master.name):
+            index.book(appt)
+            appointments.append(appt)
+    return index, appointments
+
+
+def naive_free_starts(by_day, date_str, masters, step, duration):
+    """Перебор: каждое начало у каждого мастера против каждой записи дня"""
+    free = set()
+    for master in masters:
+        for start in range(master.start, master.end - duration + 1, step):
+            end = start + duration
+            if all(
+                appt['master'] != master.name or not (
+                    to_minutes(appt['time']) < end and start < to_minutes(appt['time']) + appointment_duration(appt)
+                )
+                for appt in by_day.get(date_str, ())
+            ):
+                free.add(start)
+    return sorted(free)
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=90, help="длина периода, дней")
+    parser.add_argument('--masters', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=20000, help="записей в периоде")
+    parser.add_argument('--step', type=int, default=30, help="шаг начала записи, минут")
+    parser.add_argument('--duration', type=int, default=90, help="длительность услуги, минут")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    masters = [Master(f"M{i}", 9 * 60 + (i % 2) * 60, 21 * 60 - (i % 3) * 60) for i in range(args.masters)]
+    index, appointments = generate(args.days, masters, args.rows, args.seed, args.step)
+    date_from = datetime.now().strftime("%Y-%m-%d")
+    dates = [(datetime.now() + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(args.days)]
+    by_day = {}
+    for appt in appointments:
+        by_day.setdefault(appt['date'], []).append(appt)
+    matrix = index.occupancy(date_from, args.days)
+
+    def naive_loop():
+        return [len(naive_free_starts(by_day, date_str, masters, args.step, args.duration)) for date_str in dates]
+
+    def index_loop():
+        counts = []
+        for date_str in dates:
+            starts = index.free_starts(date_str, args.duration)
+            counts.append(len(starts))
+        return counts
+
+    def matrix_build():
+        return index.occupancy(date_from, args.days).free_counts(args.duration).tolist()
+
+    def matrix_from_appointments():
+        built = OccupancyMatrix.from_appointments(appointments, date_from, args.days, masters, args.step)
+        return built.free_counts(args.duration).tolist()
+
+    def matrix_queries():
+        counts = matrix.free_counts(args.duration)
+        matrix.first_free(args.duration)
+        matrix.free_windows(args.duration)
+        return counts.tolist()
+
+    print(f"Дней: {args.days}, мастеров: {args.masters}, записей: {len(appointments)}, услуга: {args.duration} мин\n")
+    print(f"{'способ':<44}{'мс':>10}{'мс/день':>10}")
+    results = {}
+    for title, func, repeat in (
+        ("перебор записей по дням", naive_loop, 1),
+        ("индекс, цикл по дням", index_loop, args.repeat),
+        ("матрица: построение по индексу + число", matrix_build, args.repeat),
+        ("матрица: построение по записям + число", matrix_from_appointments, args.repeat),
+        ("матрица: число, первое время, окна", matrix_queries, args.repeat),
+    ):
+        elapsed, results[title] = measure(func, repeat)
+        print(f"{title:<44}{elapsed:>10.2f}{elapsed / args.days:>10.3f}")
+
+    # Все способы должны давать одинаковое число свободных начал по дням
+    reference = results["индекс, цикл по дням"]
+    for title, counts in results.items():
+        if counts != reference:
+            print(f"\nРасхождение: {title}")
+
+
+if __name__ == '__main__':
+    main()
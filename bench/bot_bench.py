@@ -0,0 +1,248 @@
+"""Офлайн-бенчмарк обработчиков NailSalonBot.
+
+N пользователей одновременно проходят полный сценарий: регистрация,
+запись на услугу, просмотр и отмена записи, просмотр записей мастером.
+Google Sheets и Telegram заменены фейками с настраиваемой задержкой.
+
+    python -m bench.bot_bench --users 50 --rows 5000 --sheets-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+MASTER_ID = 1
+STATE_DIR = tempfile.mkdtemp(prefix="bench_")
+
+# Настройки читаются при импорте, поэтому окружение задаем до импорта бота
+for name, value in {
+    'BOT_TOKEN': '0:bench', 'SPREADSHEET_ID': 'bench', 'MASTER_USER_ID': str(MASTER_ID),
+    'MASTER_CHAT_ID': str(MASTER_ID), 'STORAGE_BACKEND': 'sheets',
+    'SQLITE_PATH': os.path.join(STATE_DIR, 'salon.db'),
+    'DELIVERY_LOG_PATH': os.path.join(STATE_DIR, 'delivered.log'),
+    'PERSISTENCE_PATH': os.path.join(STATE_DIR, 'bot_state'),
+    'CACHE_SNAPSHOT_PATH': os.path.join(STATE_DIR, 'cache_snapshot.pickle'),
+    'METRICS_PORT': '0',
+}.items():
+    os.environ.setdefault(name, value)
+
+from app.appointments import APPOINTMENT_COLUMNS  # noqa: E402
+from app.backend import SheetsBackend  # noqa: E402
+from app.bot import NailSalonBot  # noqa: E402
+from app.persistence import CacheSnapshot  # noqa: E402
+from app.registry import CLIENT_COLUMNS  # noqa: E402
+from app.sheets_scheduler import COALESCED_READS, SheetsScheduler  # noqa: E402
+from app.storage import SheetsStorage  # noqa: E402
+from app.availability import SLOTS  # noqa: E402
+from bench.fakes import (  # noqa: E402
+    FakeSpreadsheet, FakeSheetsManager, FakeBot, FakeUser, UpdateFactory
+)
+
+SERVICES = [('Маникюр', 1500, 90), ('Педикюр', 2000, 120), ('Покрытие', 1200, 60), ('Дизайн', 500, 30), ('Снятие', 300, 30)]
+
+
+def seed_spreadsheet(spreadsheet, clients, rows, days=60):
+    """Заполняет таблицу: клиенты и записи за days дней до и после сегодняшнего дня"""
+    rng = random.Random(42)
+    today = datetime.now()
+    spreadsheet.add('clients', CLIENT_COLUMNS, [
+        [100000 + i, f"Клиент {i}", f"+7999{i:07d}", f"client{i}", "Клиент", "", "2024-01-01 10:00:00"]
+        for i in range(clients)
+    ])
+    spreadsheet.add('services', ['name', 'price', 'duration'], SERVICES)
+    appointments = []
+    for i in range(rows):
+        day = (today + timedelta(days=rng.randint(-days, days))).strftime("%Y-%m-%d")
+        status = 'cancelled' if rng.random() < 0.2 else 'confirmed'
+        service, _, duration = rng.choice(SERVICES)
+        appointments.append([
+            100000 + rng.randrange(max(clients, 1)), f"Клиент {i}", "+79990000000", service,
+            day, rng.choice(SLOTS[:-1]), status, "2024-01-01 10:00:00", "", f"s{i:09d}", "", duration
+        ])
+    spreadsheet.add('appointments', APPOINTMENT_COLUMNS, appointments)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    """Время выполнения каждого обработчика"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.actions = 0
+
+    async def call(self, handler, update, context, *args):
+        started = time.perf_counter()
+        result = await handler(update, context, *args)
+        self.latencies[handler.__name__].append(time.perf_counter() - started)
+        self.actions += 1
+        return result
+
+
+async def user_flow(bot, factory, recorder, user_id, rng, days_ahead):
+    """Регистрация -> запись -> мои записи -> отмена -> просмотр мастером"""
+    user = FakeUser(user_id)
+    context = factory.context(user)
+
+    await recorder.call(bot.start, factory.message(user, "/start"), context)
+    await recorder.call(bot.get_name, factory.message(user, f"Клиент {user_id}"), context)
+    await recorder.call(bot.handle_phone_choice, factory.message(user, "Ввести номер вручную"), context)
+    await recorder.call(bot.get_phone_manual, factory.message(user, f"+7999{user_id:07d}"), context)
+
+    update = factory.message(user, "💅 Записаться на услугу")
+    await recorder.call(bot.start_booking, update, context)
+    message = update.message
+    await recorder.call(bot.select_service, factory.callback(user, rng.choice(message.buttons("service_")), message), context)
+    booked = False
+    for _ in range(5):
+        day = (datetime.now() + timedelta(days=rng.randint(1, days_ahead))).strftime("%Y-%m-%d")
+        await recorder.call(bot.handle_calendar_callback, factory.callback(user, f"date_{day}", message), context)
+        times = message.buttons("time_")
+        if not times:
+            continue
+        await recorder.call(bot.select_time, factory.callback(user, rng.choice(times), message), context)
+        if message.buttons("confirm_"):
+            await recorder.call(bot.confirm_booking, factory.callback(user, "confirm_yes", message), context)
+            booked = True
+            break
+
+    await recorder.call(bot.show_my_bookings, factory.message(user, "📋 Мои записи"), context)
+
+    if booked:
+        update = factory.message(user, "❌ Отменить запись")
+        await recorder.call(bot.start_cancel_booking, update, context)
+        cancel_buttons = update.message.buttons("cancel_")
+        if cancel_buttons:
+            await recorder.call(bot.cancel_booking, factory.callback(user, cancel_buttons[0], update.message), context)
+
+    master = FakeUser(MASTER_ID)
+    master_context = factory.context(master)
+    await recorder.call(bot.master_menu, factory.message(master, "👨‍💼 Режим мастера"), master_context)
+    await recorder.call(bot.show_today_bookings, factory.message(master, "📊 Записи на сегодня"), master_context)
+    await recorder.call(bot.show_all_active_bookings, factory.message(master, "🗓️ Все активные записи"), master_context)
+
+
+async def run(args):
+    spreadsheet = FakeSpreadsheet(latency=args.sheets_latency)
+    seed_spreadsheet(spreadsheet, args.clients, args.rows)
+    if args.backend == 'sqlite':
+        from app.sqlite_backend import SQLiteBackend
+        storage = SQLiteBackend(os.path.join(STATE_DIR, f"bench_{os.getpid()}.db"), mirror=False)
+    else:
+        # Квота по умолчанию выключена: меряем сам бот, а не ожидание токенов
+        scheduler = SheetsScheduler(reads_per_minute=args.sheets_quota, writes_per_minute=args.sheets_quota)
+        storage = SheetsBackend(SheetsStorage(manager=FakeSheetsManager(spreadsheet), scheduler=scheduler))
+    telegram = FakeBot(latency=args.telegram_latency)
+    bot = NailSalonBot(storage=storage, snapshot=CacheSnapshot(os.path.join(STATE_DIR, "missing.pickle")))
+    factory = UpdateFactory(telegram)
+    recorder = Recorder()
+
+    application = types.SimpleNamespace(bot=telegram)
+    await bot.post_init(application)
+    if args.backend == 'sqlite':
+        # Та же исходная база, что и в таблице
+        sheets = SheetsStorage(manager=FakeSheetsManager(spreadsheet))
+        await storage.import_rows(
+            await sheets.get_all_records('clients'), await sheets.get_all_records('appointments')
+        )
+        await storage.replace_services(await sheets.get_all_records('services'))
+        sheets.close()
+    spreadsheet.counter.reset()
+    coalesced_before = sum(COALESCED_READS.values.values())
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency or args.users)
+
+    async def simulated_user(i):
+        async with semaphore:
+            await user_flow(bot, factory, recorder, 200000 + i, random.Random(rng.random()), args.days)
+
+    await asyncio.gather(*(simulated_user(i) for i in range(args.users)))
+    await bot.shutdown(application)
+    elapsed = time.perf_counter() - started
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'users': args.users,
+        'backend': args.backend,
+        'rows': args.rows,
+        'elapsed': elapsed,
+        'actions': recorder.actions,
+        'handlers': {
+            name: {
+                'count': len(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': max(values) * 1000,
+            }
+            for name, values in recorder.latencies.items()
+        },
+        'sheets_calls': dict(spreadsheet.counter.calls),
+        'sheets_calls_total': spreadsheet.counter.total,
+        'sheets_calls_per_action': spreadsheet.counter.total / max(recorder.actions, 1),
+        'sheets_reads_coalesced': sum(COALESCED_READS.values.values()) - coalesced_before,
+        'telegram_calls': telegram.api_calls,
+        'peak_traced_mb': peak_memory / 1024 / 1024,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_report(result):
+    print(f"Пользователей: {result['users']}, хранилище: {result['backend']}, строк записей: {result['rows']}")
+    print(f"Действий: {result['actions']} за {result['elapsed']:.2f} с "
+          f"({result['actions'] / result['elapsed']:.1f} действий/с)\n")
+    print(f"{'обработчик':<28}{'вызовов':>9}{'p50, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for name, stats in sorted(result['handlers'].items(), key=lambda item: -item[1]['p99_ms']):
+        print(f"{name:<28}{stats['count']:>9}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    print(f"\nЗапросов к Sheets: {result['sheets_calls_total']} "
+          f"({result['sheets_calls_per_action']:.3f} на действие пользователя), "
+          f"объединено чтений: {result['sheets_reads_coalesced']:.0f}")
+    for name, count in sorted(result['sheets_calls'].items()):
+        print(f"  {name:<32}{count:>7}")
+    print(f"Запросов к Telegram: {result['telegram_calls']}")
+    print(f"Пик памяти (tracemalloc): {result['peak_traced_mb']:.1f} МБ, max RSS: {result['max_rss_mb']:.1f} МБ")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк обработчиков бота на фейковых Sheets и Telegram")
+    parser.add_argument('--users', type=int, default=20, help="одновременных пользователей")
+    parser.add_argument('--concurrency', type=int, default=0, help="ограничение одновременных сценариев (0 - все)")
+    parser.add_argument('--rows', type=int, default=1000, help="строк в листе appointments")
+    parser.add_argument('--clients', type=int, default=500, help="строк в листе clients")
+    parser.add_argument('--days', type=int, default=30, help="на сколько дней вперед выбирать дату")
+    parser.add_argument('--sheets-latency', type=float, default=0.05, help="задержка запроса к Sheets, с")
+    parser.add_argument('--sheets-quota', type=int, default=0, help="запросов к Sheets в минуту (0 - без ограничения)")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="задержка запроса к Telegram, с")
+    parser.add_argument('--backend', choices=['sheets', 'sqlite'], default='sheets')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="сохранить результат в JSON (для сравнения прогонов)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
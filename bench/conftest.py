@@ -0,0 +1,5 @@
+import os
+
+# config.settings проверяет обязательные переменные при импорте: тестам хватает фиктивных
+for name, value in {'BOT_TOKEN': '0:test', 'SPREADSHEET_ID': 'test', 'METRICS_PORT': '0'}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,291 @@
+"""Фейки Google Sheets и Telegram для офлайн-бенчмарков бота"""
+import asyncio
+import itertools
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+RANGE_RE = re.compile(r"^([A-Z]*)(\d*):([A-Z]*)(\d*)$")
+
+
+def column_number(letters):
+    return a1_to_rowcol(f"{letters}1")[1]
+
+
+class CallCounter:
+    """Потокобезопасный счетчик обращений к API"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def add(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+
+class FakeWorksheet:
+    """Лист в памяти с интерфейсом gspread.Worksheet и задержкой на каждый запрос"""
+
+    def __init__(self, spreadsheet, title, header, rows=(), sheet_id=0):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self._values = [list(header)] + [[str(value) for value in row] for row in rows]
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        self.spreadsheet.counter.add(f"{self.title}.{name}")
+        if self.spreadsheet.latency:
+            time.sleep(self.spreadsheet.latency)
+        if name != "get_values":
+            self.spreadsheet.touch()
+
+    @property
+    def row_count(self):
+        return len(self._values)
+
+    def get_values(self, range_name=None, **kwargs):
+        self._call("get_values")
+        with self._lock:
+            if range_name is None:
+                return [list(row) for row in self._values]
+            first_col, first_row, last_col, last_row = RANGE_RE.match(range_name).groups()
+            start = int(first_row or 1) - 1
+            end = int(last_row) if last_row else len(self._values)
+            col_start = column_number(first_col) - 1 if first_col else 0
+            col_end = column_number(last_col) if last_col else None
+            return [list(row[col_start:col_end]) for row in self._values[start:end]]
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        with self._lock:
+            first = len(self._values) + 1
+            self._values.extend([str(value) for value in row] for row in values)
+            last = len(self._values)
+        width = max((len(row) for row in values), default=1)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:{rowcol_to_a1(last, width)}"}}
+
+    def _set(self, row, col, value):
+        while len(self._values) < row:
+            self._values.append([])
+        cells = self._values[row - 1]
+        cells.extend([''] * (col - len(cells)))
+        cells[col - 1] = str(value)
+
+    def update_cell(self, row, col, value):
+        self._call("update_cell")
+        with self._lock:
+            self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        with self._lock:
+            for item in data:
+                row, col = a1_to_rowcol(item['range'].split(':')[0])
+                for row_offset, values in enumerate(item['values']):
+                    for col_offset, value in enumerate(values):
+                        self._set(row + row_offset, col + col_offset, value)
+
+    def delete_rows(self, start, end):
+        self.spreadsheet.touch()
+        with self._lock:
+            del self._values[start - 1:end]
+
+
+class FakeSpreadsheet:
+    """Таблица из нескольких FakeWorksheet с общей задержкой и счетчиком запросов"""
+
+    def __init__(self, latency=0.0, counter=None):
+        self.latency = latency
+        self.counter = counter or CallCounter()
+        self._sheets = {}
+        self._ids = itertools.count()
+        self.modified = datetime.now(timezone.utc)
+
+    def touch(self):
+        """Отмечает изменение таблицы (для get_lastUpdateTime)"""
+        self.modified = datetime.now(timezone.utc)
+
+    def get_lastUpdateTime(self):
+        self.counter.add("drive.modified_time")
+        return self.modified.isoformat(timespec='microseconds').replace('+00:00', 'Z')
+
+    def add(self, title, header, rows=()):
+        worksheet = FakeWorksheet(self, title, header, rows, sheet_id=next(self._ids))
+        self._sheets[title] = worksheet
+        return worksheet
+
+    def worksheet(self, title):
+        if title not in self._sheets:
+            raise WorksheetNotFound(title)
+        return self._sheets[title]
+
+    def worksheets(self):
+        self.counter.add("spreadsheet.worksheets")
+        return list(self._sheets.values())
+
+    def add_worksheet(self, title, rows=1, cols=1):
+        self.counter.add("spreadsheet.add_worksheet")
+        worksheet = self.add(title, [])
+        worksheet._values = []  # как в Google: первая добавленная строка становится строкой 1
+        return worksheet
+
+    def batch_update(self, body):
+        self.counter.add("spreadsheet.batch_update")
+        by_id = {worksheet.id: worksheet for worksheet in self._sheets.values()}
+        for request in body['requests']:
+            grid = request['deleteDimension']['range']
+            by_id[grid['sheetId']].delete_rows(grid['startIndex'] + 1, grid['endIndex'])
+
+
+class FakeSheetsManager:
+    """Замена SheetsClientManager: те же worksheet/spreadsheet/invalidate/close"""
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def worksheet(self, sheet_name):
+        return self.spreadsheet.worksheet(sheet_name)
+
+    def invalidate(self, sheet_name=None):
+        pass
+
+    def close(self):
+        pass
+
+
+# Telegram
+
+class FakeUser:
+    def __init__(self, user_id, first_name="Клиент", username=None):
+        self.id = user_id
+        self.first_name = first_name
+        self.last_name = ""
+        self.username = username or f"user{user_id}"
+
+
+class FakeContact:
+    def __init__(self, phone_number):
+        self.phone_number = phone_number
+
+
+class FakeMessage:
+    """Сообщение: запоминает ответы бота и последнюю инлайн-клавиатуру"""
+
+    def __init__(self, bot, user, text=None, contact=None):
+        self.bot = bot
+        self.from_user = user
+        self.chat_id = user.id
+        self.text = text
+        self.contact = contact
+        self.replies = []
+        self.reply_markup = None
+
+    async def _api_call(self, text, reply_markup):
+        await self.bot.api_call()
+        self.replies.append(text)
+        if reply_markup is not None and hasattr(reply_markup, 'inline_keyboard'):
+            self.reply_markup = reply_markup
+        return self
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        return await self._api_call(text, reply_markup)
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.text = text
+        return await self._api_call(text, reply_markup)
+
+    def buttons(self, prefix=""):
+        """callback_data кнопок последней клавиатуры, начинающиеся с prefix"""
+        if self.reply_markup is None:
+            return []
+        return [
+            button.callback_data
+            for row in self.reply_markup.inline_keyboard for button in row
+            if button.callback_data and button.callback_data.startswith(prefix)
+        ]
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot, user, data, message):
+        self.bot = bot
+        self.from_user = user
+        self.data = data
+        self.message = message
+
+    async def answer(self, *args, **kwargs):
+        await self.bot.api_call()
+
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class FakeUpdate:
+    def __init__(self, user, message=None, callback_query=None):
+        self.message = message
+        self.callback_query = callback_query
+        self.effective_user = user
+        self.effective_chat = FakeChat(user.id)
+        self.effective_message = message or (callback_query.message if callback_query else None)
+
+
+class FakeBot:
+    """Бот без сети: считает вызовы API и выдерживает задержку на каждый"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.api_calls = 0
+        self.sent = []
+
+    async def api_call(self):
+        self.api_calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.api_call()
+        self.sent.append((chat_id, text))
+
+
+class FakeContext:
+    def __init__(self, bot, user_data):
+        self.bot = bot
+        self.user_data = user_data
+        self.bot_data = {}
+        self.job_queue = None
+
+
+class UpdateFactory:
+    """Создает обновления от имени пользователей с общим ботом и user_data"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._user_data = {}
+
+    def context(self, user):
+        return FakeContext(self.bot, self._user_data.setdefault(user.id, {}))
+
+    def message(self, user, text=None, contact=None):
+        return FakeUpdate(user, message=FakeMessage(self.bot, user, text, contact))
+
+    def callback(self, user, data, message):
+        return FakeUpdate(user, callback_query=FakeCallbackQuery(self.bot, user, data, message))
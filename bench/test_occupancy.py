@@ -0,0 +1,86 @@
+"""Матрица занятости против индекса свободного времени.
+
+    python -m pytest bench
+"""
+from datetime import datetime, timedelta
+
+from app.availability import AvailabilityIndex, Master
+from app.occupancy import OccupancyMatrix
+from bench.availability_bench import generate
+
+MASTERS = [Master('Анна', 9 * 60, 21 * 60), Master('Мария', 10 * 60 + 30, 18 * 60)]
+DATE = '2030-03-04'
+
+
+def booking(master, time, duration, date=DATE):
+    return {'appointment_id': f"{master}{time}", 'status': 'confirmed', 'master': master,
+            'date': date, 'time': time, 'duration': duration}
+
+
+def matrix_for(appointments, days=2, step=30):
+    return OccupancyMatrix.from_appointments(appointments, DATE, days, MASTERS, step)
+
+
+def test_fits_respects_bookings_and_shifts():
+    matrix = matrix_for([booking('Анна', '09:00', 120), booking('Мария', '12:00', 60)])
+    fits = matrix.fits(60)
+    anna, maria = fits[0, 0], fits[0, 1]
+    cell = {minutes: (minutes - matrix.day_start) // matrix.resolution for minutes in range(9 * 60, 21 * 60, 30)}
+    assert not anna[cell[9 * 60]] and not anna[cell[10 * 60 + 30]]
+    assert anna[cell[11 * 60]] and anna[cell[20 * 60]]
+    assert not anna[cell[20 * 60 + 30]]        # не помещается до конца смены
+    assert not maria[cell[10 * 60]]            # до начала смены
+    assert maria[cell[10 * 60 + 30]] and maria[cell[11 * 60]]
+    assert not maria[cell[11 * 60 + 30]] and not maria[cell[12 * 60]]
+    assert maria[cell[17 * 60]] and not maria[cell[17 * 60 + 30]]
+    # Во второй день записей нет: помещается везде в сменах
+    assert fits[1, 0].sum() == len(range(9 * 60, 20 * 60 + 1, 30))
+
+
+def test_cancelled_bookings_are_free():
+    matrix = matrix_for([dict(booking('Анна', '09:00', 720), status='cancelled')])
+    assert matrix.first_free(720) == ['09:00', '09:00']
+
+
+def test_first_free_and_next_free():
+    appointments = [
+        booking('Анна', '09:00', 720),
+        booking('Мария', '10:30', 90), booking('Мария', '12:30', 330),
+    ]
+    matrix = matrix_for(appointments)
+    # У Марии окно 12:00-12:30 меньше часа; весь первый день занят
+    assert matrix.first_free(60) == [None, '09:00']
+    assert matrix.first_free(30) == ['12:00', '09:00']
+    assert matrix.next_free(60) == ('2030-03-05', '09:00')
+    assert matrix.free_windows(30)[0] == (DATE, 'Мария', '12:00', '12:30')
+    assert matrix_for(appointments, days=1).next_free(60) is None
+
+
+def test_matrix_matches_index():
+    masters = [Master(f"M{i}", 9 * 60 + (i % 2) * 60, 21 * 60 - (i % 3) * 60) for i in range(4)]
+    index, appointments = generate(14, masters, 400, seed=3, step=30)
+    date_from = datetime.now().strftime("%Y-%m-%d")
+    dates = [(datetime.now() + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(14)]
+    for duration in (30, 90, 180):
+        expected = [len(index.free_starts(date_str, duration)) for date_str in dates]
+        assert index.occupancy(date_from, 14).free_counts(duration).tolist() == expected
+        built = OccupancyMatrix.from_appointments(appointments, date_from, 14, masters, 30)
+        assert built.free_counts(duration).tolist() == expected
+
+
+def test_month_free_starts_hides_days_without_room():
+    index = AvailabilityIndex(None, masters=MASTERS, step=60)
+    index.rebuild([booking('Анна', '09:00', 720), booking('Мария', '10:30', 390)])
+    free = index.month_free_starts(2030, 3, 60)
+    assert free[DATE] == 0
+    assert free['2030-03-05'] == len(index.starts_for(60))
+
+
+def test_overlapping_rows_keep_time_busy():
+    # Записи, добавленные вручную, могут пересекаться: длинная 09:00-12:00 и короткая внутри нее
+    index = AvailabilityIndex(None, masters=MASTERS[:1], step=60)
+    index.rebuild([booking('Анна', '09:00', 180), booking('Анна', '10:00', 60)])
+    assert not index.is_free(DATE, '11:00', 60)
+    assert index.is_free(DATE, '12:00', 60)
+    index.release(booking('Анна', '09:00', 180))
+    assert index.is_free(DATE, '11:00', 60) and not index.is_free(DATE, '10:00', 60)
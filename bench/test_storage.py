@@ -0,0 +1,302 @@
+"""Поведение хранилища на фейковой таблице: архив, очередь записи, сверка, выгрузка/загрузка.
+
+    python -m pytest bench
+"""
+import asyncio
+import io
+
+from app.appointments import APPOINTMENT_COLUMNS
+from app.backend import SheetsBackend
+from app.registry import CLIENT_COLUMNS
+from app.sqlite_backend import SQLiteBackend
+from app.storage import SheetsStorage
+from app.transfer import export_records, import_clients
+from bench.fakes import FakeSpreadsheet, FakeSheetsManager
+
+
+def appointment_row(i, date, status='confirmed'):
+    return [str(i), f"Клиент {i}", "+79990000000", "Маникюр", date, "10:00", status,
+            "2024-01-01 10:00:00", "", f"a{i:04d}", "", "60"]
+
+
+def make_spreadsheet(rows=()):
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.add('clients', CLIENT_COLUMNS, [[str(100 + i), f"Клиент {i}", f"+7999000000{i}"] for i in range(3)])
+    spreadsheet.add('services', ['name', 'price', 'duration'], [['Маникюр', '1500', '60']])
+    spreadsheet.add('appointments', APPOINTMENT_COLUMNS, rows)
+    return spreadsheet
+
+
+def make_backend(spreadsheet, timeout=5, sync_interval=0):
+    storage = SheetsStorage(manager=FakeSheetsManager(spreadsheet), timeout=timeout)
+    return SheetsBackend(storage, sync_interval=sync_interval)
+
+
+def run_with_backend(spreadsheet, scenario, **options):
+    """Выполняет scenario(backend) с бэкендом на фейковой таблице и закрывает бэкенд; возвращает результат"""
+    async def main():
+        backend = make_backend(spreadsheet, **options)
+        try:
+            return await scenario(backend)
+        finally:
+            await backend.close()
+
+    return asyncio.run(main())
+
+
+def sheet_values(spreadsheet, title):
+    return spreadsheet.worksheet(title)._values
+
+
+def test_archive_with_concurrent_status_changes():
+    spreadsheet = make_spreadsheet([
+        appointment_row(1, '2020-01-01'), appointment_row(2, '2030-01-01'),
+        appointment_row(3, '2020-01-02'), appointment_row(4, '2030-01-02'), appointment_row(5, '2030-01-03'),
+    ])
+
+    async def scenario(backend):
+        await backend.list_appointments()
+        spreadsheet.latency = 0.05
+
+        async def change_statuses():
+            # Попадаем между чтением листа и удалением строк архивом
+            await asyncio.sleep(0.12)
+            await backend.set_appointment_status('a0005', 'cancelled')
+            await backend.set_appointment_status('a0004', 'done')
+
+        archived, _ = await asyncio.gather(backend.archive_appointments('2025-01-01'), change_statuses())
+        await backend.writes.flush()
+        spreadsheet.latency = 0
+        return archived
+
+    assert run_with_backend(spreadsheet, scenario) == 2
+    rows = sheet_values(spreadsheet, 'appointments')
+    assert [(row[9], row[6]) for row in rows[1:]] == [
+        ('a0002', 'confirmed'), ('a0004', 'done'), ('a0005', 'cancelled'),
+    ]
+    assert [row[9] for row in sheet_values(spreadsheet, 'archive_2020_01')[1:]] == ['a0001', 'a0003']
+
+
+def test_archive_retry_does_not_duplicate_rows():
+    spreadsheet = make_spreadsheet([
+        appointment_row(1, '2020-01-01'), appointment_row(2, '2020-02-01'),
+        appointment_row(3, ''), appointment_row(4, '2030-01-01'),
+    ])
+    delete_rows = spreadsheet.batch_update
+
+    def unavailable(body):
+        raise ValueError("unavailable")
+
+    async def scenario(backend):
+        spreadsheet.batch_update = unavailable
+        try:
+            await backend.archive_appointments('2025-01-01')
+        except ValueError:
+            pass
+        # Строки уже скопированы, но не удалены: повторный перенос их только удаляет
+        spreadsheet.batch_update = delete_rows
+        archived = await backend.archive_appointments('2025-01-01')
+        months = await backend.archive_months()
+        return archived, months
+
+    assert run_with_backend(spreadsheet, scenario) == (2, ['2020-01', '2020-02'])
+    assert [row[9] for row in sheet_values(spreadsheet, 'appointments')[1:]] == ['a0003', 'a0004']
+    assert [row[9] for row in sheet_values(spreadsheet, 'archive_2020_01')[1:]] == ['a0001']
+    assert [row[9] for row in sheet_values(spreadsheet, 'archive_2020_02')[1:]] == ['a0002']
+
+
+def test_write_queue_timeout_does_not_duplicate_rows():
+    spreadsheet = make_spreadsheet()
+
+    async def scenario(backend):
+        await backend.list_appointments()
+        spreadsheet.latency = 0.3
+        appointment_id = await backend.add_appointment({'user_id': '1', 'date': '2030-01-01', 'time': '10:00'})
+        await backend.writes.flush()
+        assert backend.writes.pending == 1
+        # Запрос дописал строку уже после таймаута
+        await asyncio.sleep(0.4)
+        spreadsheet.latency = 0
+        await backend.writes.flush()
+        await asyncio.sleep(0)
+        row = backend.appointments.row_of(appointment_id)
+        return appointment_id, row
+
+    appointment_id, row = run_with_backend(spreadsheet, scenario, timeout=0.1)
+    rows = sheet_values(spreadsheet, 'appointments')
+    assert [values[9] for values in rows[1:]] == [appointment_id]
+    assert row == 2
+
+
+def test_status_of_queued_row_does_not_wait_for_flush():
+    spreadsheet = make_spreadsheet()
+    worksheet = spreadsheet.worksheet('appointments')
+    append_rows = worksheet.append_rows
+    attempts = []
+
+    def flaky(values, **kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("unavailable")
+        return append_rows(values, **kwargs)
+
+    worksheet.append_rows = flaky
+
+    async def scenario(backend):
+        await backend.list_appointments()
+        appointment_id = await backend.add_appointment({'user_id': '1', 'date': '2030-01-01', 'time': '10:00'})
+        # Строка еще в очереди: отмена не ждет отправки
+        record = await asyncio.wait_for(backend.set_appointment_status(appointment_id, 'cancelled'), 0.05)
+        # Первая отправка строки не удалась - изменение статуса ждет ее повтора
+        await backend.writes.flush()
+        assert backend.writes.pending == 2
+        await backend.writes.flush()
+        await asyncio.sleep(0)
+        pending = backend.appointments._pending_status
+        return appointment_id, record['status'], pending
+
+    appointment_id, status, pending = run_with_backend(spreadsheet, scenario)
+    assert (status, pending) == ('cancelled', {})
+    assert [(row[9], row[6]) for row in sheet_values(spreadsheet, 'appointments')[1:]] == [(appointment_id, 'cancelled')]
+
+
+def test_write_queue_fails_futures_after_max_attempts():
+    spreadsheet = make_spreadsheet()
+
+    def unavailable(*args, **kwargs):
+        raise ValueError("unavailable")
+
+    spreadsheet.worksheet('clients').append_rows = unavailable
+
+    async def scenario(backend):
+        backend.writes.max_attempts = 3
+        future = backend.writes.append_row('clients', ['999', 'Новый'])
+        for _ in range(3):
+            await backend.writes.flush()
+        pending = backend.writes.pending
+        return future, pending
+
+    future, pending = run_with_backend(spreadsheet, scenario)
+    assert pending == 0
+    assert isinstance(future.exception(), ValueError)
+
+
+def test_reconciler_reports_added_changed_removed():
+    spreadsheet = make_spreadsheet([
+        appointment_row(1, '2030-01-01'), appointment_row(2, '2030-01-02'), appointment_row(3, '2030-01-03'),
+    ])
+    changes = []
+
+    async def scenario(backend):
+        backend.subscribe(on_appointments=lambda added, changed, removed: changes.append((added, changed, removed)))
+        await backend.reconciler.reconcile()
+        assert not await backend.reconciler.reconcile()
+
+        rows = sheet_values(spreadsheet, 'appointments')
+        rows[1][6] = 'cancelled'
+        del rows[2]
+        rows.append(appointment_row(4, '2030-01-04'))
+        spreadsheet.touch()
+        assert await backend.reconciler.reconcile()
+
+    run_with_backend(spreadsheet, scenario, sync_interval=60)
+    assert len(changes) == 1
+    added, changed, removed = changes[0]
+    assert [appt['appointment_id'] for appt in added] == ['a0004']
+    assert [(old['status'], new['status']) for old, new in changed] == [('confirmed', 'cancelled')]
+    assert [appt['appointment_id'] for appt in removed] == ['a0002']
+
+
+def test_reconciler_ignores_own_writes():
+    spreadsheet = make_spreadsheet([appointment_row(1, '2030-01-01')])
+
+    async def scenario(backend):
+        await backend.reconciler.reconcile()
+        await backend.set_appointment_status('a0001', 'done')
+        await backend.writes.flush()
+        own = await backend.reconciler.reconcile()
+        sheet_values(spreadsheet, 'appointments')[1][6] = 'cancelled'
+        spreadsheet.touch()
+        manual = await backend.reconciler.reconcile()
+        status = (await backend.list_appointments())[0]['status']
+        return own, manual, status
+
+    assert run_with_backend(spreadsheet, scenario, sync_interval=60) == (False, True, 'cancelled')
+
+
+def test_reconciler_retries_drive_after_transient_error():
+    spreadsheet = make_spreadsheet()
+    modified_time = spreadsheet.get_lastUpdateTime
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("reset")
+        return modified_time()
+
+    spreadsheet.get_lastUpdateTime = flaky
+
+    async def scenario(backend):
+        reconciler = backend.reconciler
+        await reconciler.reconcile()
+        # Во время паузы после сбоя сверяемся по таймеру, не обращаясь к Drive
+        await reconciler.reconcile()
+        assert len(calls) == 1 and reconciler._drive_available
+        reconciler._drive_retry_at = 0
+        await reconciler.reconcile()
+        unchanged = not await reconciler.reconcile()
+        return unchanged
+
+    assert run_with_backend(spreadsheet, scenario, sync_interval=60)
+    assert len(calls) == 3
+
+
+def test_transfer_round_trip(tmp_path):
+    async def scenario():
+        source = SQLiteBackend(path=str(tmp_path / 'source.db'), mirror=False)
+        target = SQLiteBackend(path=str(tmp_path / 'target.db'), mirror=False)
+        await source.start()
+        await target.start()
+        await source.add_clients([
+            {'user_id': str(100 + i), 'client_name': f"Клиент {i}", 'phone': f"+7999000{i:04d}"} for i in range(25)
+        ])
+        await source.add_appointment({'user_id': '100', 'date': '2030-01-01', 'time': '10:00', 'status': 'confirmed'})
+        results = {}
+        for fmt in ('csv', 'jsonl'):
+            stream = io.StringIO()
+            assert await export_records(source, 'clients', fmt, stream, chunk_size=10) == 25
+            stream.seek(0)
+            results[fmt] = await import_clients(target, stream, fmt, batch_size=10)
+        appointments = io.StringIO()
+        await export_records(source, 'appointments', 'csv', appointments)
+        clients = [client async for chunk in target.iter_clients() for client in chunk]
+        await source.close()
+        await target.close()
+        return results, clients, appointments.getvalue()
+
+    results, clients, appointments = asyncio.run(scenario())
+    assert (results['csv'].imported, results['csv'].batches) == (25, 3)
+    # Повторная загрузка того же списка ничего не добавляет
+    assert (results['jsonl'].imported, results['jsonl'].duplicates) == (0, 25)
+    assert sorted(client['user_id'] for client in clients) == [str(100 + i) for i in range(25)]
+    assert appointments.splitlines()[0] == ','.join(APPOINTMENT_COLUMNS)
+    assert len(appointments.splitlines()) == 2
+
+
+def test_import_skips_known_phones():
+    spreadsheet = make_spreadsheet()
+
+    async def scenario(backend):
+        stream = io.StringIO(
+            "user_id,client_name,phone\n"
+            "200,Новая,+7 999 000 00 00\n"      # телефон клиента 100 в другой записи
+            "201,Новая 2,89990000009\n"
+            ",Без ID,+79990000008\n"
+        )
+        report = await import_clients(backend, stream, 'csv')
+        return report
+
+    report = run_with_backend(spreadsheet, scenario)
+    assert (report.imported, report.duplicates, report.invalid) == (1, 1, 1)
+    assert [row[0] for row in sheet_values(spreadsheet, 'clients')[1:]] == ['100', '101', '102', '201']
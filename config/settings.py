@@ -1,8 +1,8 @@
 import os
 
 # Настройки бота
-BOT_TOKEN = os.environ.get('8328246749:AAGCTumwVb7OyPhzMRkpyGLccPSNQy8f344')
-SPREADSHEET_ID = os.environ.get('1nJbrwHz0jqWs8sN9a1L22JpNozn7Qf1V8cZ4skz55Qs')
+BOT_TOKEN = os.environ.get('BOT_TOKEN')
+SPREADSHEET_ID = os.environ.get('SPREADSHEET_ID')
 MASTER_CHAT_ID = os.environ.get('MASTER_CHAT_ID', '')
 MASTER_USER_ID = os.environ.get('MASTER_USER_ID', '')
 
@@ -16,6 +16,90 @@ if not SPREADSHEET_ID:
 WORK_START = 9
 WORK_END = 21
 SLOT_DURATION = 60
+SLOT_HOLD_MINUTES = 5  # сколько минут выбранное время держится за клиентом до подтверждения
+CALENDAR_NEARLY_FULL = 2  # свободных слотов, при которых день помечается как почти занятый
+
+# Мастера и их рабочие часы: 'Анна:9-21;Мария:10:30-18' (по умолчанию один мастер на часы салона)
+MASTERS = os.environ.get('MASTERS', '')
+SCHEDULE_STEP = int(os.environ.get('SCHEDULE_STEP', SLOT_DURATION))  # шаг возможного начала записи, минут
+
+# Просмотр записей мастером: записей на одной странице
+MASTER_PAGE_SIZE = int(os.environ.get('MASTER_PAGE_SIZE', 10))
+
+# Хранилище данных: 'sheets' (Google Sheets) или 'sqlite' (локальная база)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sheets')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'salon.db')
+SHEETS_MIRROR = os.environ.get('SHEETS_MIRROR', '') == '1'  # зеркалировать SQLite в таблицу
+SHEETS_MIRROR_INTERVAL = int(os.environ.get('SHEETS_MIRROR_INTERVAL', 60))  # секунд
+
+# Настройки Google Sheets
+SHEETS_TOKEN_REFRESH_MARGIN = int(os.environ.get('SHEETS_TOKEN_REFRESH_MARGIN', 300))  # секунд до истечения токена
+SHEETS_POOL_SIZE = int(os.environ.get('SHEETS_POOL_SIZE', 8))  # потоков для запросов к таблице
+SHEETS_HTTP_POOL_SIZE = int(os.environ.get('SHEETS_HTTP_POOL_SIZE', SHEETS_POOL_SIZE))
+SHEETS_TIMEOUT = float(os.environ.get('SHEETS_TIMEOUT', 15))  # секунд на один запрос
+# Квота Google Sheets: ~60 чтений и ~60 записей в минуту; 0 - без ограничения
+SHEETS_READS_PER_MINUTE = int(os.environ.get('SHEETS_READS_PER_MINUTE', 60))
+SHEETS_WRITES_PER_MINUTE = int(os.environ.get('SHEETS_WRITES_PER_MINUTE', 60))
+SHEETS_BURST = int(os.environ.get('SHEETS_BURST', 10))  # запросов подряд без ожидания
+SHEETS_MAX_RETRIES = int(os.environ.get('SHEETS_MAX_RETRIES', 3))  # повторов после ответа 429
+# Сверка с ручными правками таблицы: раз в столько секунд; 0 - перечитывать лист при каждом запросе
+SHEETS_SYNC_INTERVAL = float(os.environ.get('SHEETS_SYNC_INTERVAL', 15))
+
+# Отложенная запись: строки копятся и отправляются пачкой
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 50))  # строк/ячеек до немедленной отправки
+WRITE_FLUSH_INTERVAL = float(os.environ.get('WRITE_FLUSH_INTERVAL', 2))  # секунд между отправками
+WRITE_MAX_ATTEMPTS = int(os.environ.get('WRITE_MAX_ATTEMPTS', 5))  # неудачных отправок подряд до отказа
+
+# Напоминания клиентам: за сколько часов до записи (через запятую)
+REMINDER_OFFSETS = tuple(float(hours) for hours in os.environ.get('REMINDER_OFFSETS', '24,2').split(',') if hours.strip())
+MASTER_DIGEST_HOUR = int(os.environ.get('MASTER_DIGEST_HOUR', 19))  # час отправки мастеру списка записей на завтра
+
+# Рассылка напоминаний (лимиты Telegram: ~30 сообщений в секунду, ~1 в секунду в один чат)
+BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE', 25))
+BROADCAST_CHAT_INTERVAL = float(os.environ.get('BROADCAST_CHAT_INTERVAL', 1))
+BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', 10))
+BROADCAST_MAX_RETRIES = int(os.environ.get('BROADCAST_MAX_RETRIES', 3))
+DELIVERY_LOG_PATH = os.environ.get('DELIVERY_LOG_PATH', 'delivered.log')
+DELIVERY_LOG_DAYS = int(os.environ.get('DELIVERY_LOG_DAYS', 7))  # сколько дней помнить доставленные сообщения
+
+# Выгрузка и загрузка данных (/export, /import_clients, python -m app.transfer)
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 500))  # строк на одно чтение при выгрузке
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))  # строк на один запрос при загрузке
+
+# Архив: прошедшие и отмененные записи переносятся в помесячные архивные листы/таблицу
+ARCHIVE_HOUR = int(os.environ.get('ARCHIVE_HOUR', 3))  # час ночного переноса в архив
+
+# Параллельная обработка обновлений (обновления одного пользователя - по порядку)
+UPDATE_CONCURRENCY = int(os.environ.get('UPDATE_CONCURRENCY', 16))  # обработчиков одновременно
+UPDATE_QUEUE_LIMIT = int(os.environ.get('UPDATE_QUEUE_LIMIT', 200))  # принятых обновлений до отказа с просьбой повторить
+
+# Режим получения обновлений: 'polling' или 'webhook'
+RUN_MODE = os.environ.get('RUN_MODE', 'polling')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')  # публичный адрес (https://...); пусто - не регистрировать вебхук
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('PORT', 8443))  # Heroku передает порт в PORT
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')  # проверяется в X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_DRAIN_TIMEOUT = float(os.environ.get('WEBHOOK_DRAIN_TIMEOUT', 20))  # секунд на дообработку при остановке
+
+# Без секрета вебхук принял бы обновления от любого, кто знает адрес
+if RUN_MODE == 'webhook' and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET не установлен (обязателен при RUN_MODE=webhook)")
+
+# Метрики в формате Prometheus (GET /metrics); 0 - не запускать отдельный сервер
+METRICS_LISTEN = os.environ.get('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
+
+# Сохранение разговоров и кэшей между перезапусками
+PERSISTENCE_PATH = os.environ.get('PERSISTENCE_PATH', 'bot_state')  # префикс файлов состояния разговоров
+PERSISTENCE_INTERVAL = float(os.environ.get('PERSISTENCE_INTERVAL', 10))  # секунд между сохранениями
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', 'cache_snapshot.pickle')
+CACHE_SNAPSHOT_INTERVAL = float(os.environ.get('CACHE_SNAPSHOT_INTERVAL', 60))  # секунд между снимками кэшей
+
+# Время жизни кэшей (в секундах)
+CLIENTS_CACHE_TTL = int(os.environ.get('CLIENTS_CACHE_TTL', 300))
+CLIENTS_RELOAD_INTERVAL = int(os.environ.get('CLIENTS_RELOAD_INTERVAL', 3600))  # полная перезагрузка листа клиентов
+SERVICES_CACHE_TTL = int(os.environ.get('SERVICES_CACHE_TTL', 3600))
 
 # Этапы разговора
 (